@@ -0,0 +1,566 @@
+import asyncio
+import json
+import os
+import re
+from time import time
+
+import humanize
+
+from modules._DataProductFile import _DataProductFile
+from modules._OncArchive import _OncArchive
+from modules._OncDelivery import _OncDelivery
+from modules._OncDiscovery import _OncDiscovery
+from modules._OncRealTime import _OncRealTime
+from modules._OncService import _OncService
+from modules._PageAccumulator import _PageAccumulator
+from modules._PollLog import _PollLog
+from modules._util import saveAsFile, _formatDuration, _jsonDecoder
+from modules.RetryPolicy import RetryPolicy
+from onc.util.util import add_docs
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+
+class _AsyncResponse:
+    """
+    A completely read aiohttp response, with the attributes of requests.Response used by this library
+    """
+
+    def __init__(self, response, content: bytes):
+        self.status_code = response.status
+        self.reason = response.reason
+        self.url = str(response.url)
+        self.headers = response.headers
+        self.content = content
+
+    @property
+    def ok(self):
+        return self.status_code < 400
+
+    @property
+    def text(self):
+        return self.content.decode('utf-8', errors='replace')
+
+    def json(self):
+        return json.loads(self.content)
+
+
+class AsyncONC:
+    """
+    Python ONC Api Client Library
+    asyncio version of the ONC class, backed by an aiohttp connection pool
+    Usage:
+        async with AsyncONC(token) as onc:
+            devices = await onc.getDevices({'locationCode': 'BACAX'})
+    """
+
+    def __init__(self, token, production: bool = True, showInfo: bool = False, outPath: str = 'output',
+                 timeout: int = 60, download_threads: int = 2, pool_size: int = 100,
+                 retry_policy: RetryPolicy = None, json_decoder='auto'):
+        """
+        @param download_threads: Number of files getDirectFiles downloads at the same time
+        @param pool_size:        Maximum number of simultaneous connections of this client
+        """
+        if aiohttp is None:
+            raise ImportError('AsyncONC requires the aiohttp package, install it with: pip install aiohttp')
+
+        self.token = re.sub('[^a-zA-Z0-9\\-]+', '', token)
+        self.showInfo = showInfo
+        self.timeout = timeout
+        self.baseUrl = 'https://data.oceannetworks.ca/'
+        self.outPath = ''
+        self.download_threads = download_threads
+        self.pool_size = pool_size
+        self.retry_policy = RetryPolicy() if retry_policy is None else retry_policy
+        self.json_decoder = _jsonDecoder(json_decoder)
+
+        # the aiohttp session has to be created inside the event loop, see _getSession
+        self.session = None
+
+        # sanitize outPath
+        if len(outPath) > 0:
+            outPath = outPath.replace('\\', '/')
+            if outPath[-1] == '/':
+                outPath = outPath[:-1]
+            self.outPath = outPath
+
+        # switch to qa if needed
+        if not production:
+            self.baseUrl = 'https://qa.oceannetworks.ca/'
+
+        # Service objects provide the filter handling and response post-processing, their requests are not used
+        self.discovery = _OncDiscovery(self)
+        self.delivery = _OncDelivery(self)
+        self.realTime = _OncRealTime(self)
+        self.archive = _OncArchive(self)
+
+        # poll period per data product runId, estimated from the request response
+        self._pollPeriods = {}
+
+    async def close(self):
+        """
+        Closes the pooled connections of this client
+        """
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    # Discovery methods
+    @add_docs(_OncDiscovery.getLocations)
+    async def getLocations(self, filters: dict = None):
+        return await self._discoveryRequest(filters, service='locations')
+
+    @add_docs(_OncDiscovery.getLocationHierarchy)
+    async def getLocationHierarchy(self, filters: dict = None):
+        return await self._discoveryRequest(filters, service='locations', method='getTree')
+
+    @add_docs(_OncDiscovery.getDeployments)
+    async def getDeployments(self, filters: dict = None):
+        return await self._discoveryRequest(filters, service='deployments')
+
+    @add_docs(_OncDiscovery.getDevices)
+    async def getDevices(self, filters: dict = None):
+        return await self._discoveryRequest(filters, service='devices')
+
+    @add_docs(_OncDiscovery.getDeviceCategories)
+    async def getDeviceCategories(self, filters: dict = None):
+        return await self._discoveryRequest(filters, service='deviceCategories')
+
+    @add_docs(_OncDiscovery.getProperties)
+    async def getProperties(self, filters: dict = None):
+        return await self._discoveryRequest(filters, service='properties')
+
+    @add_docs(_OncDiscovery.getDataProducts)
+    async def getDataProducts(self, filters: dict = None):
+        return await self._discoveryRequest(filters, service='dataProducts')
+
+    # Delivery methods
+    @add_docs(_OncDelivery.orderDataProduct)
+    async def orderDataProduct(self, filters: dict, maxRetries: int = 0, downloadResultsOnly: bool = False,
+                               includeMetadataFile: bool = True, overwrite: bool = False, outPath: str = None):
+        fileList = []
+        requestData = await self.requestDataProduct(filters)
+
+        if downloadResultsOnly:
+            # Only run and return links
+            runData = await self.runDataProduct(requestData['dpRequestId'], waitComplete=True)
+            for runId in runData['runIds']:
+                fileList.extend(await self._infoForProductFiles(runId, runData['fileCount'], includeMetadataFile))
+        else:
+            # Run and download files
+            runData = await self.runDataProduct(requestData['dpRequestId'], waitComplete=False)
+            for runId in runData['runIds']:
+                fileList.extend(await self._downloadProductFiles(runId, includeMetadataFile, maxRetries, overwrite,
+                                                                 outPath=outPath))
+
+        print('')
+        _OncDelivery._printProductOrderStats(fileList, runData)
+        return _OncDelivery._formatResult(fileList, runData)
+
+    @add_docs(_OncDelivery.requestDataProduct)
+    async def requestDataProduct(self, filters: dict):
+        filters['method'] = 'request'
+        filters['token'] = self.token
+        response = await self._doRequest(self._deliveryUrl(), filters)
+
+        self._pollPeriods[response['dpRequestId']] = _OncDelivery._pollPeriodFromEstimate(
+            response, self.delivery.pollPeriod)
+        _OncDelivery._printProductRequest(response)
+        return response
+
+    @add_docs(_OncDelivery.runDataProduct)
+    async def runDataProduct(self, dpRequestId: int, waitComplete: bool = True):
+        status = ''
+        log = _PollLog(True)
+        pollPeriod = self._pollPeriods.get(dpRequestId, self.delivery.pollPeriod)
+        runResult = {'runIds': [], 'fileCount': 0, 'runTime': 0, 'requestCount': 0}
+        data = []
+
+        start = time()
+        while status != 'complete':
+            response = await self._sendRequest(self._deliveryUrl(),
+                                               {'method': 'run', 'token': self.token, 'dpRequestId': dpRequestId})
+            runResult['requestCount'] += 1
+            _OncService._raiseForStatus(response)
+            data = response.json()
+
+            if waitComplete:
+                status = data[0]['status']
+                log.logMessage(data)
+                if response.status_code != 200:
+                    await asyncio.sleep(pollPeriod)
+            else:
+                status = 'complete'
+
+        if data:
+            runResult['fileCount'] = data[0]['fileCount']
+        runResult['runTime'] = time() - start
+
+        # print a new line after the process finishes
+        if waitComplete:
+            print('')
+
+        # gather a list of runIds, which inherit the poll period of the request
+        for run in data:
+            runResult['runIds'].append(run['dpRunId'])
+            self._pollPeriods[run['dpRunId']] = pollPeriod
+
+        return runResult
+
+    @add_docs(_OncDelivery.downloadDataProduct)
+    async def downloadDataProduct(self, runId: int, maxRetries: int = 0, downloadResultsOnly: bool = False,
+                                  includeMetadataFile: bool = True, overwrite: bool = False, outPath: str = None):
+        if downloadResultsOnly:
+            return await self._infoForProductFiles(runId, 0, includeMetadataFile)
+        return await self._downloadProductFiles(runId, includeMetadataFile, maxRetries, overwrite, outPath=outPath)
+
+    # Real-time methods
+    @add_docs(_OncRealTime.getDirectByLocation)
+    async def getDirectByLocation(self, filters: dict = None, allPages: bool = False):
+        return await self._getDirectAllPages(filters, 'scalardata', 'getByLocation', allPages)
+
+    @add_docs(_OncRealTime.getDirectByDevice)
+    async def getDirectByDevice(self, filters: dict = None, allPages: bool = False):
+        return await self._getDirectAllPages(filters, 'scalardata', 'getByDevice', allPages)
+
+    @add_docs(_OncRealTime.getDirectRawByLocation)
+    async def getDirectRawByLocation(self, filters: dict = None, allPages: bool = False):
+        return await self._getDirectAllPages(filters, 'rawdata', 'getByLocation', allPages)
+
+    @add_docs(_OncRealTime.getDirectRawByDevice)
+    async def getDirectRawByDevice(self, filters: dict = None, allPages: bool = False):
+        return await self._getDirectAllPages(filters, 'rawdata', 'getByDevice', allPages)
+
+    # Archive file methods
+    @add_docs(_OncArchive.getListByLocation)
+    async def getListByLocation(self, filters: dict = None, allPages: bool = False):
+        return await self._getList(filters, by='location', allPages=allPages)
+
+    @add_docs(_OncArchive.getListByDevice)
+    async def getListByDevice(self, filters: dict = None, allPages: bool = False):
+        return await self._getList(filters, by='device', allPages=allPages)
+
+    @add_docs(_OncArchive.getFile)
+    async def getFile(self, filename: str = '', overwrite: bool = False, outPath: str = None):
+        url = self.archive._serviceUrl('archivefiles')
+        filters = {'token': self.token, 'method': 'getFile', 'filename': filename}
+
+        start = time()
+        response = await self._sendRequest(url, filters)
+        elapsed = time() - start
+
+        if response.ok:
+            if outPath is None:
+                outPath = self.outPath
+            await asyncio.get_running_loop().run_in_executor(None, saveAsFile, response, outPath, filename,
+                                                             overwrite)
+        else:
+            _OncService._raiseForStatus(response)
+
+        return {
+            'url': response.url,
+            'status': 'completed' if response.status_code == 200 else 'error',
+            'size': len(response.content),
+            'downloadTime': round(elapsed, 3),
+            'file': filename
+        }
+
+    @add_docs(_OncArchive.getDirectFiles)
+    async def getDirectFiles(self, filters_or_result: dict, overwrite: bool = False, allPages: bool = False,
+                             download_threads: int = None):
+        # make sure we only get a simple list of files
+        if 'returnOptions' in filters_or_result:
+            del filters_or_result['returnOptions']
+
+        if 'files' in filters_or_result:
+            dataRows = filters_or_result
+        elif hasattr(filters_or_result, 'to_dict'):
+            # pandas.DataFrame
+            columns = ['filename', 'outPath'] if 'outPath' in filters_or_result else ['filename']
+            dataRows = {'files': filters_or_result[columns].to_dict(orient='records')}
+        elif 'locationCode' in filters_or_result and 'deviceCategoryCode' in filters_or_result:
+            dataRows = await self.getListByLocation(filters=filters_or_result, allPages=allPages)
+        elif 'deviceCode' in filters_or_result:
+            dataRows = await self.getListByDevice(filters=filters_or_result, allPages=allPages)
+        else:
+            raise Exception(
+                'getDirectFiles filters_or_result require either a combination of "locationCode" and '
+                '"deviceCategoryCode", or a "deviceCode" or "files" present.')
+
+        # normalize to (filename, outPath) and skip existing files
+        files = []
+        for file_i in dataRows['files']:
+            if isinstance(file_i, str):
+                files.append((file_i, self.outPath))
+            else:
+                files.append((file_i['filename'], file_i.get('outPath', self.outPath)))
+        if not overwrite:
+            missing = [f for f in files if not os.path.exists(os.path.join(f[1], f[0]))]
+            if len(missing) < len(files):
+                print(f'Skipping {len(files) - len(missing)} files.')
+            files = missing
+
+        if download_threads is None:
+            download_threads = self.download_threads
+        semaphore = asyncio.Semaphore(download_threads)
+
+        async def download(filename, outPath):
+            async with semaphore:
+                return await self.getFile(filename, overwrite=overwrite, outPath=outPath)
+
+        start = time()
+        downInfos = await asyncio.gather(*[download(filename, outPath) for filename, outPath in files])
+        elapsed = time() - start if files else 0
+        size = sum(downInfo['size'] for downInfo in downInfos)
+
+        print('Downloaded - Directory: {:s}; Files: {:d}; Size: {:s}; Time: {:s}; Speed: {:s}/s'.format(
+            self.outPath, len(downInfos), humanize.naturalsize(size), _formatDuration(elapsed),
+            humanize.naturalsize(size / elapsed if elapsed else 0)))
+
+        return {
+            'downloadResults': list(downInfos),
+            'stats': {
+                'totalSize': size,
+                'downloadTime': elapsed,
+                'fileCount': len(downInfos)
+            }
+        }
+
+    # Request handling
+    async def _getSession(self):
+        """
+        Returns the aiohttp session of this client, creating it in the running event loop if required
+        """
+        if self.session is None:
+            connector = aiohttp.TCPConnector(limit=self.pool_size)
+            self.session = aiohttp.ClientSession(connector=connector)
+        return self.session
+
+    async def _sendRequest(self, url: str, params: dict = None, method: str = 'get'):
+        """
+        Sends an HTTP request and reads its whole content
+        Transient failures are sent again as defined by the retry policy, as in _OncService._sendRequest
+        @return: An _AsyncResponse
+        """
+        session = await self._getSession()
+        timeout = aiohttp.ClientTimeout(total=self.timeout)
+        params = self._requestParams(params)
+
+        attempt = 1
+        while True:
+            try:
+                async with session.request(method, url, params=params, timeout=timeout) as rawResponse:
+                    response = _AsyncResponse(rawResponse, await rawResponse.read())
+            except (asyncio.TimeoutError, aiohttp.ClientConnectionError) as error:
+                if not self.retry_policy.shouldRetry(attempt, error=error):
+                    raise
+                delay = self.retry_policy.delay(attempt)
+            else:
+                if not self.retry_policy.shouldRetry(attempt, response=response):
+                    return response
+                delay = self.retry_policy.delay(attempt, response)
+
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def _doRequest(self, url: str, filters: dict = None, getTime=False):
+        """
+        Awaitable version of _OncService._doRequest
+        """
+        self.discovery._log('Requesting URL:\n{:s}'.format(url))
+        start = time()
+        try:
+            response = await self._sendRequest(url, filters)
+        except asyncio.TimeoutError:
+            raise Exception('The request ran out of time (timeout: {:d} s)'.format(self.timeout)) from None
+        responseTime = time() - start
+
+        _OncService._raiseForStatus(response)
+        jsonResult = self.json_decoder(response.content)
+        self.discovery._log('Web Service response time: {:s}'.format(_formatDuration(responseTime)))
+
+        if getTime:
+            return jsonResult, responseTime
+        return jsonResult
+
+    @staticmethod
+    def _requestParams(params: dict):
+        """
+        Converts filters into query parameters accepted by aiohttp, like requests does:
+        None values are dropped and other values are converted to strings
+        """
+        if params is None:
+            return None
+        return {key: value if isinstance(value, str) else str(value)
+                for key, value in params.items() if value is not None}
+
+    async def _discoveryRequest(self, filters: dict, service: str, method: str = 'get'):
+        url = self.discovery._serviceUrl(service)
+        filters = self.discovery._discoveryFilters(filters or {}, method)
+        result = await self._doRequest(url, filters)
+        _OncDiscovery._sanitizeBooleans(result)
+        return result
+
+    async def _getDirectAllPages(self, filters: dict, service: str, method: str, allPages: bool):
+        url = self.realTime._serviceUrl(service)
+        filters = self.realTime._directFilters(filters, method)
+        if allPages:
+            return await self._getAllPages(service, url, filters)
+        return await self._doRequest(url, filters)
+
+    async def _getList(self, filters: dict, by: str = 'location', allPages: bool = False):
+        url = self.archive._serviceUrl('archivefiles')
+        filters2, extension = self.archive._listFilters(filters or {}, by)
+        if 'extension' in filters2:
+            del filters2['extension']
+
+        if allPages:
+            return await self._getAllPages('archivefiles', url, filters2, extension)
+        result = await self._doRequest(url, filters2)
+        return _OncArchive._filterByExtension(result, extension)
+
+    async def _getAllPages(self, service: str, url: str, filters: dict, extension: str = None):
+        """
+        Awaitable version of _MultiPage.getAllPages
+        Requests all pages from the service, and concatenates their data
+        @param extension: Only provide for archivefiles filtering
+        """
+        start = time()
+        response = await self._doPageRequest(url, filters, service, extension)
+        rNext = response['next']
+        accumulator = _PageAccumulator(service)
+        accumulator.add(response)
+        pageCount = 1
+
+        while rNext is not None:
+            nextResponse = await self._doPageRequest(url, rNext['parameters'], service, extension)
+            rNext = nextResponse['next']
+            accumulator.add(nextResponse)
+            pageCount += 1
+
+        self.discovery._log('   ({:d} samples, {:d} pages) Completed in {:s}.'.format(
+            accumulator.rows, pageCount, _formatDuration(time() - start)))
+        return accumulator.result()
+
+    async def _doPageRequest(self, url: str, filters: dict, service: str, extension: str = None):
+        response = await self._doRequest(url, filters)
+        if service == 'archivefiles':
+            response = _OncArchive._filterByExtension(response, extension)
+        return response
+
+    def _deliveryUrl(self):
+        return '{:s}api/dataProductDelivery'.format(self.baseUrl)
+
+    async def _downloadProductFiles(self, runId: int, getMetadata: bool, maxRetries: int, overwrite: bool,
+                                    fileCount: int = 0, outPath: str = None):
+        """
+        Awaitable version of _OncDelivery._downloadProductFiles
+        """
+        fileList = []
+        index = 1
+        if outPath is None:
+            outPath = self.outPath
+        pollPeriod = self._pollPeriods.get(runId, self.delivery.pollPeriod)
+        print('\nDownloading data product files with runId {:d}...'.format(runId))
+
+        # keep increasing index until fileCount or until we get 404
+        while True:
+            dpf = _DataProductFile(runId, str(index), self.baseUrl, self.token)
+            status = await self._downloadProductFile(dpf, pollPeriod, outPath, maxRetries, overwrite)
+            if status == 200 or status == 777:
+                # file was downloaded (200), or downloaded & skipped (777)
+                fileList.append(dpf.getInfo())
+                index += 1
+            elif status != 202 or (0 < fileCount <= index):
+                # no more files to download
+                break
+
+        # get metadata if required
+        if getMetadata:
+            dpf = _DataProductFile(runId, 'meta', self.baseUrl, self.token)
+            try:
+                status = await self._downloadProductFile(dpf, pollPeriod, outPath, maxRetries, overwrite)
+                if status == 200 or status == 777:
+                    fileList.append(dpf.getInfo())
+            except Exception as ex:
+                print(ex)
+                print("   Metadata file was not downloaded")
+                fileList.append(dpf.getInfo())
+
+        return fileList
+
+    async def _downloadProductFile(self, dpf: _DataProductFile, pollPeriod: float, outPath: str, maxRetries: int,
+                                   overwrite: bool):
+        """
+        Awaitable version of _DataProductFile.download
+        Polls until the file is ready and saves it
+        """
+        log = _PollLog(True)
+        loop = asyncio.get_running_loop()
+        status = 202
+        while status == 202:
+            start = time()
+            response = await self._sendRequest(dpf._baseUrl, dpf._filters)
+            duration = time() - start
+
+            # the file is saved in the response processing, keep it out of the event loop
+            await loop.run_in_executor(None, dpf._processResponse, response, duration, outPath, maxRetries,
+                                       overwrite, log)
+            status = dpf._status
+            if status == 202:
+                await asyncio.sleep(pollPeriod)
+
+        return status
+
+    async def _infoForProductFiles(self, dpRunId: int, fileCount: int, getMetadata: bool):
+        """
+        Awaitable version of _OncDelivery._infoForProductFiles
+        """
+        print('\nObtaining download information for data product files with runId {:d}...'.format(dpRunId))
+
+        # If we don't know the fileCount, get it from the server (takes longer)
+        if fileCount <= 0:
+            fileCount = await self._countFilesInProduct(dpRunId)
+
+        indexes = list(range(1, fileCount + 1))
+        if getMetadata:
+            indexes.append('meta')
+
+        fileList = []
+        for index in indexes:
+            dpf = _DataProductFile(dpRunId=dpRunId, index=str(index), baseUrl=self.baseUrl, token=self.token)
+            dpf.setComplete()
+            fileList.append(dpf.getInfo())
+
+        return fileList
+
+    async def _countFilesInProduct(self, runId: int):
+        """
+        Awaitable version of _OncDelivery._countFilesInProduct
+        """
+        filters = {'method': 'download', 'token': self.token, 'dpRunId': runId, 'index': 1}
+        pollPeriod = self._pollPeriods.get(runId, self.delivery.pollPeriod)
+        status = 200
+        n = 0
+
+        while status == 200 or status == 202:
+            response = await self._sendRequest(self._deliveryUrl(), filters, method='head')
+            status = response.status_code
+            if status == 202:
+                # If the file is still running, wait
+                await asyncio.sleep(pollPeriod)
+            elif status == 200:
+                filters['index'] += 1
+                n += 1
+
+        print('   {:d} files available for download'.format(n))
+        return n
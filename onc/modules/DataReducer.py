@@ -0,0 +1,157 @@
+import numpy as np
+
+from ._columnar import _columnList, _sensorColumns
+
+
+class DataReducer:
+    """
+    Reduces scalar data while the pages of a download arrive, so that only the reduced data is kept in memory
+    Samples can be masked by their QAQC flag, and aggregated to the mean, min or max of fixed time bins. A bin that
+    spans two pages is carried over to the next page, so the result doesn't depend on the page size.
+    Aggregated samples are timed at the start of their bin, with the highest QAQC flag of the bin. Missing values
+    (None or NaN) are dropped.
+    """
+
+    aggregations = ('mean', 'min', 'max')
+
+    def __init__(self, keepFlags: tuple = None, period: float = None, how: str = 'mean'):
+        """
+        @param keepFlags: QAQC flags of the samples to keep, i.e. (0, 1, 2), None keeps all samples
+        @param period:    Seconds per bin, the bins are aligned to multiples of period since 1970. None doesn't
+                          aggregate
+        @param how:       Aggregation of the values of a bin: 'mean', 'min' or 'max'
+        """
+        if how not in self.aggregations:
+            raise ValueError(f'how must be one of {list(self.aggregations)}; got {how}')
+        self.keepFlags = None if keepFlags is None else np.asarray(keepFlags, dtype=np.int8)
+        self.period = period
+        self.how = how
+
+    def stream(self):
+        """
+        Returns the state of the reduction of one download, see _ReducerStream
+        """
+        return _ReducerStream(self)
+
+    def reduce(self, response: dict):
+        """
+        Reduces a complete scalardata response, in place
+        @return: The response
+        """
+        stream = self.stream()
+        stream.reducePage(response)
+        stream.flush(response)
+        return response
+
+    def periodNs(self):
+        return int(round(self.period * 1e9))
+
+
+class _ReducerStream:
+    """
+    Reduces the pages of one download in order, carrying the last bin of each sensor over to the next page
+    """
+
+    def __init__(self, reducer: DataReducer):
+        self.reducer = reducer
+        self._carry = {}  # sensorCode -> (sensor metadata, bin, sum, count, min, max, flag)
+
+    def reducePage(self, response: dict):
+        """
+        Replaces the data of each sensor of a scalardata page with the reduced data of the complete bins, in place
+        """
+        for sensorData in response.get('sensorData') or []:
+            columns = _sensorColumns(sensorData['data'])
+            columns = self._mask(columns)
+            if self.reducer.period:
+                columns = self._aggregate(sensorData, columns)
+            sensorData['data'] = {key: _columnList(key, column) for key, column in columns.items()}
+
+    def flush(self, response: dict):
+        """
+        Appends the bins carried over from the last page to the sensors of response, adding missing sensors
+        @return: The response
+        """
+        if response.get('sensorData') is None:
+            response['sensorData'] = []
+        sensors = {sensorData['sensorCode']: sensorData for sensorData in response['sensorData']}
+        for code, carry in self._carry.items():
+            data = {key: _columnList(key, column) for key, column in self._bins(*carry[1:]).items()}
+            if code in sensors:
+                for key in data:
+                    sensors[code]['data'][key] = sensors[code]['data'].get(key, []) + data[key]
+            else:
+                response['sensorData'].append(dict(carry[0], data=data))
+        self._carry = {}
+        return response
+
+    def flushPage(self):
+        """
+        Returns the bins carried over from the last page as a scalardata page
+        """
+        return self.flush({'sensorData': [], 'next': None})
+
+    def _mask(self, columns: dict):
+        keep = np.ones(len(columns['sampleTimes']), dtype=bool)
+        if self.reducer.keepFlags is not None and 'qaqcFlags' in columns:
+            keep &= np.isin(columns['qaqcFlags'], self.reducer.keepFlags)
+        if columns['values'].dtype.kind == 'f':
+            keep &= ~np.isnan(columns['values'])
+        if keep.all():
+            return columns
+        return {key: column[keep] for key, column in columns.items()}
+
+    def _aggregate(self, sensorData: dict, columns: dict):
+        """
+        Aggregates the samples of a page to bins, and returns the complete bins as columns
+        """
+        code = sensorData['sensorCode']
+        times = columns['sampleTimes'].astype(np.int64)
+        values = columns['values'].astype(np.float64)
+        flags = columns['qaqcFlags'] if 'qaqcFlags' in columns else np.zeros(len(times), dtype=np.int8)
+
+        bins = times // self.reducer.periodNs()
+        starts = np.flatnonzero(np.r_[True, bins[1:] != bins[:-1]]) if len(bins) else np.array([], dtype=np.int64)
+        if len(starts):
+            pageBins = [bins[starts], np.add.reduceat(values, starts), np.diff(np.r_[starts, len(bins)]),
+                        np.minimum.reduceat(values, starts), np.maximum.reduceat(values, starts),
+                        np.maximum.reduceat(flags, starts)]
+        else:
+            pageBins = [np.array([], dtype=np.int64), np.array([]), np.array([], dtype=np.int64), np.array([]),
+                        np.array([]), np.array([], dtype=np.int8)]
+
+        carry = self._carry.get(code)
+        if carry is not None:
+            if len(pageBins[0]) and pageBins[0][0] == carry[1]:
+                # the first bin continues the carried bin
+                bin_, total, count, low, high, flag = carry[1:]
+                pageBins[1][0] += total
+                pageBins[2][0] += count
+                pageBins[3][0] = min(pageBins[3][0], low)
+                pageBins[4][0] = max(pageBins[4][0], high)
+                pageBins[5][0] = max(pageBins[5][0], flag)
+            else:
+                pageBins = [np.r_[[value], column].astype(column.dtype) for value, column in zip(carry[1:], pageBins)]
+
+        if len(pageBins[0]):
+            self._carry[code] = (dict((k, v) for k, v in sensorData.items() if k != 'data'),) + \
+                                tuple(column[-1] for column in pageBins)
+            pageBins = [column[:-1] for column in pageBins]
+        return self._bins(*pageBins)
+
+    def _bins(self, bins, total, count, low, high, flag):
+        """
+        Returns bins as the columns sampleTimes, values and qaqcFlags
+        """
+        bins, total, count = np.atleast_1d(bins), np.atleast_1d(total), np.atleast_1d(count)
+        if self.reducer.how == 'mean':
+            values = total / count
+        elif self.reducer.how == 'min':
+            values = np.atleast_1d(low)
+        else:
+            values = np.atleast_1d(high)
+        return {
+            'sampleTimes': (bins * self.reducer.periodNs()).astype('datetime64[ns]'),
+            'values': values.astype(np.float64),
+            'qaqcFlags': np.atleast_1d(flag).astype(np.int8)
+        }
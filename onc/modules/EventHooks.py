@@ -0,0 +1,96 @@
+import threading
+import weakref
+from time import time
+from urllib import parse
+
+from ._util import _formatDuration
+
+
+class EventHooks:
+    """
+    Event bus of an ONC instance, to feed request timings and transfer sizes into tracing or metrics
+    Callbacks are called synchronously, in the thread that emits the event, with a single dictionary holding
+    'event' (the event name), 'time' (epoch seconds) and the fields of the event.
+    Events and their main fields:
+        requestStart:   url, params (without token), service, method
+        responseEnd:    url, params, service, method, status, bytes, latency, retries, error
+        pageFetched:    url, service, page, rows, bytes, latency, retries, rowLimit
+        fileDownloaded: url, service, file, outPath, status, bytes, latency, retries
+        pollTick:       url, service, status, poll, bytes, latency, retries (and runStatus while running products)
+                        or url, service, poll, rows, interval while following real-time data
+        progress:       task, service, done, total, bytes, elapsed, rate, bytesPerSecond, eta (see Progress)
+    latency is in seconds; retries is the number of repeated attempts of the request (see RetryPolicy).
+    """
+
+    events = ('requestStart', 'responseEnd', 'pageFetched', 'fileDownloaded', 'pollTick', 'progress')
+
+    def __init__(self):
+        self._callbacks = {event: [] for event in self.events}
+        self._lock = threading.Lock()
+
+    def on(self, event: str, callback=None):
+        """
+        Registers callback(eventDict) for the event, can be used as a decorator: @onc.hooks.on('responseEnd')
+        Use the event '*' to register the callback for all events
+        @return: The callback
+        """
+        if callback is None:
+            return lambda f: self.on(event, f)
+
+        with self._lock:
+            for name in self._eventNames(event):
+                self._callbacks[name] = self._callbacks[name] + [callback]
+        return callback
+
+    def off(self, event: str, callback):
+        """
+        Unregisters a callback registered with on
+        """
+        with self._lock:
+            for name in self._eventNames(event):
+                self._callbacks[name] = [c for c in self._callbacks[name] if c is not callback]
+
+    def emit(self, event: str, **fields):
+        """
+        Calls the callbacks registered for the event with a dictionary of the fields
+        """
+        callbacks = self._callbacks[event]
+        if not callbacks:
+            return
+        payload = {'event': event, 'time': time()}
+        payload.update(fields)
+        for callback in callbacks:
+            callback(payload)
+
+    def _eventNames(self, event: str):
+        if event == '*':
+            return self.events
+        if event not in self.events:
+            raise ValueError(f'event must be one of {list(self.events)} or "*"; got {event}')
+        return (event,)
+
+
+class _ConsoleLog:
+    """
+    Prints the request events to the console while the showInfo flag of the ONC instance is True
+    """
+
+    def __init__(self, parent: object):
+        self.parent = weakref.ref(parent)
+
+    def attach(self, hooks: EventHooks):
+        hooks.on('requestStart', self.requestStart)
+        hooks.on('responseEnd', self.responseEnd)
+
+    def _showInfo(self):
+        parent = self.parent()
+        return parent is not None and parent.showInfo
+
+    def requestStart(self, event: dict):
+        if self._showInfo():
+            txtParams = parse.unquote(parse.urlencode(event['params'] or {}))
+            print('Requesting URL:\n{:s}?{:s}'.format(event['url'], txtParams))
+
+    def responseEnd(self, event: dict):
+        if self._showInfo() and event['error'] is None:
+            print('Web Service response time: {:s}'.format(_formatDuration(event['latency'])))
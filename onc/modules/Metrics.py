@@ -0,0 +1,167 @@
+import threading
+from time import time
+
+
+class MetricsRegistry:
+    """
+    Aggregates per-service counters and latency histograms from the events of an ONC instance (see EventHooks)
+    Counters: requests, errors by status, downloaded bytes, pages, downloaded files and poll iterations
+    The values are available as a dictionary (snapshot) and in the Prometheus text format (toPrometheus)
+    """
+
+    # upper bounds in seconds of the request latency histogram buckets
+    buckets = (0.05, 0.1, 0.25, 0.5, 1., 2.5, 5., 10., 30., 60.)
+
+    def __init__(self, prefix: str = 'onc'):
+        """
+        @param prefix: Prefix of the metric names in the Prometheus format
+        """
+        self.prefix = prefix
+        self.started = time()
+        self._services = {}
+        self._lock = threading.Lock()
+
+    def attach(self, hooks):
+        """
+        Subscribes this registry to the events of an EventHooks bus
+        """
+        hooks.on('responseEnd', self._onResponseEnd)
+        hooks.on('pageFetched', self._onPageFetched)
+        hooks.on('fileDownloaded', self._onFileDownloaded)
+        hooks.on('pollTick', self._onPollTick)
+        return self
+
+    def reset(self):
+        """
+        Sets all counters back to zero
+        """
+        with self._lock:
+            self._services = {}
+            self.started = time()
+
+    def snapshot(self):
+        """
+        Returns a copy of the metrics as a dictionary {'uptime': seconds, 'services': {service: metrics}}
+        The latency histogram is given as cumulative counts per bucket upper bound, as in Prometheus
+        """
+        with self._lock:
+            services = {}
+            for service, m in self._services.items():
+                services[service] = {
+                    'requests': m['requests'],
+                    'errors': dict(m['errors']),
+                    'retries': m['retries'],
+                    'bytes': m['bytes'],
+                    'bytesPerSecond': m['bytes'] / m['latencySum'] if m['latencySum'] > 0 else 0.,
+                    'pages': m['pages'],
+                    'rows': m['rows'],
+                    'files': m['files'],
+                    'fileBytes': m['fileBytes'],
+                    'polls': m['polls'],
+                    'latency': {
+                        'count': m['requests'],
+                        'sum': m['latencySum'],
+                        'buckets': dict(zip(self.buckets + (float('inf'),), self._cumulative(m['latencyBuckets'])))
+                    }
+                }
+            return {'uptime': time() - self.started, 'services': services}
+
+    def toPrometheus(self):
+        """
+        Returns the metrics in the Prometheus text exposition format
+        """
+        snapshot = self.snapshot()['services']
+        p = self.prefix
+        lines = []
+
+        def counter(name: str, description: str, key: str):
+            lines.append('# HELP {:s}_{:s} {:s}'.format(p, name, description))
+            lines.append('# TYPE {:s}_{:s} counter'.format(p, name))
+            for service, m in sorted(snapshot.items()):
+                lines.append('{:s}_{:s}{{service="{:s}"}} {}'.format(p, name, service, m[key]))
+
+        counter('requests_total', 'HTTP requests sent, without retries', 'requests')
+        counter('request_retries_total', 'Repeated attempts of HTTP requests', 'retries')
+        counter('downloaded_bytes_total', 'Bytes downloaded', 'bytes')
+        counter('pages_total', 'Pages fetched by multi-page requests', 'pages')
+        counter('rows_total', 'Rows fetched by multi-page requests', 'rows')
+        counter('files_downloaded_total', 'Files downloaded', 'files')
+        counter('poll_iterations_total', 'Poll iterations while waiting for data products', 'polls')
+
+        lines.append('# HELP {:s}_request_errors_total HTTP requests that failed, by status'.format(p))
+        lines.append('# TYPE {:s}_request_errors_total counter'.format(p))
+        for service, m in sorted(snapshot.items()):
+            for status, count in sorted(m['errors'].items()):
+                lines.append('{:s}_request_errors_total{{service="{:s}",status="{:s}"}} {}'.format(
+                    p, service, status, count))
+
+        lines.append('# HELP {:s}_request_duration_seconds HTTP request latency, including retries'.format(p))
+        lines.append('# TYPE {:s}_request_duration_seconds histogram'.format(p))
+        for service, m in sorted(snapshot.items()):
+            for bound, count in m['latency']['buckets'].items():
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append('{:s}_request_duration_seconds_bucket{{service="{:s}",le="{:s}"}} {}'.format(
+                    p, service, le, count))
+            lines.append('{:s}_request_duration_seconds_sum{{service="{:s}"}} {}'.format(
+                p, service, m['latency']['sum']))
+            lines.append('{:s}_request_duration_seconds_count{{service="{:s}"}} {}'.format(
+                p, service, m['latency']['count']))
+
+        return '\n'.join(lines) + '\n'
+
+    def _service(self, name: str):
+        """
+        Returns the metrics of a service, creating them if required. Call with the lock held
+        """
+        if name not in self._services:
+            self._services[name] = {
+                'requests': 0, 'errors': {}, 'retries': 0, 'bytes': 0, 'pages': 0, 'rows': 0, 'files': 0,
+                'fileBytes': 0, 'polls': 0, 'latencySum': 0., 'latencyBuckets': [0] * (len(self.buckets) + 1)
+            }
+        return self._services[name]
+
+    @staticmethod
+    def _cumulative(counts: list):
+        total = 0
+        cumulative = []
+        for count in counts:
+            total += count
+            cumulative.append(total)
+        return cumulative
+
+    def _onResponseEnd(self, event: dict):
+        with self._lock:
+            m = self._service(event['service'])
+            m['requests'] += 1
+            m['retries'] += event['retries']
+            m['bytes'] += event['bytes']
+            m['latencySum'] += event['latency']
+
+            i = 0
+            while i < len(self.buckets) and event['latency'] > self.buckets[i]:
+                i += 1
+            m['latencyBuckets'][i] += 1
+
+            if event['error'] is not None:
+                status = type(event['error']).__name__
+            elif event['status'] >= 400:
+                status = str(event['status'])
+            else:
+                return
+            m['errors'][status] = m['errors'].get(status, 0) + 1
+
+    def _onPageFetched(self, event: dict):
+        with self._lock:
+            m = self._service(event['service'])
+            m['pages'] += 1
+            m['rows'] += event['rows']
+
+    def _onFileDownloaded(self, event: dict):
+        with self._lock:
+            m = self._service(event['service'])
+            m['files'] += 1
+            m['fileBytes'] += event['bytes']
+
+    def _onPollTick(self, event: dict):
+        with self._lock:
+            self._service(event['service'])['polls'] += 1
@@ -0,0 +1,106 @@
+import threading
+from time import time
+
+
+class Progress:
+    """
+    Throughput based progress of a long download (pages of data, archive files or data product files)
+    The rates of rows (or files) and bytes per second are measured over windows of at least window seconds and smoothed
+    over the windows, and the estimated time to completion is computed from the remaining amount and the current rate,
+    so that it follows changes of the server or network speed. Until the first window is complete, the rate is the
+    average since the start. Measuring over windows keeps the rate stable when worker threads update within
+    microseconds of each other.
+    Each update is emitted as a 'progress' event on the EventHooks of the ONC instance, with the fields:
+        task, service, done, total, bytes, elapsed, rate, bytesPerSecond, eta
+    total and eta are None as long as the total amount is unknown.
+    """
+
+    # weight of the latest window in the smoothed rates
+    smoothing = 0.3
+    # minimum seconds of a window the rates are measured over
+    window = 1.0
+
+    def __init__(self, hooks, task: str, service: str, total: float = None):
+        """
+        @param hooks:   EventHooks of the ONC instance, or None to only compute the progress
+        @param task:    Name of the download, i.e. 'pages', 'archiveFiles' or 'productFiles'
+        @param service: Name of the API service
+        @param total:   Total number of rows or files to download, if known
+        """
+        self.hooks = hooks
+        self.task = task
+        self.service = service
+        self.total = total
+        self.done = 0
+        self.bytes = 0
+        self.started = time()
+        self.rate = None
+        self.bytesPerSecond = None
+        self._windowStart = self.started
+        self._windowDone = 0
+        self._windowBytes = 0
+        self._smoothed = False
+        self._lock = threading.Lock()
+
+    def update(self, done: float = 1, size: int = 0, total: float = None):
+        """
+        Accounts for done more rows or files and size more bytes, and emits the progress event
+        @param total: New estimate of the total amount, if it changed
+        @return:      The estimated seconds to completion, or None if unknown
+        """
+        with self._lock:
+            now = time()
+            self.done += done
+            self.bytes += size
+            self._windowDone += done
+            self._windowBytes += size
+            if total is not None:
+                self.total = total
+
+            interval = now - self._windowStart
+            if interval >= self.window:
+                windowRate, windowBytesPerSecond = self._windowDone / interval, self._windowBytes / interval
+                if self._smoothed:
+                    self.rate = self._smooth(self.rate, windowRate)
+                    self.bytesPerSecond = self._smooth(self.bytesPerSecond, windowBytesPerSecond)
+                else:
+                    self.rate, self.bytesPerSecond = windowRate, windowBytesPerSecond
+                    self._smoothed = True
+                self._windowStart, self._windowDone, self._windowBytes = now, 0, 0
+            elif not self._smoothed:
+                elapsed = max(now - self.started, 1e-3)
+                self.rate, self.bytesPerSecond = self.done / elapsed, self.bytes / elapsed
+            snapshot = self.snapshot()
+
+        if self.hooks is not None:
+            self.hooks.emit('progress', **snapshot)
+        return snapshot['eta']
+
+    def eta(self):
+        """
+        Returns the estimated seconds to completion, or None if the total or the rate is unknown
+        """
+        if self.total is None or not self.rate:
+            return None
+        return max(self.total - self.done, 0) / self.rate
+
+    def snapshot(self):
+        """
+        Returns the progress as a dictionary with the fields of the progress event
+        """
+        return {
+            'task': self.task,
+            'service': self.service,
+            'done': self.done,
+            'total': self.total,
+            'bytes': self.bytes,
+            'elapsed': time() - self.started,
+            'rate': self.rate,
+            'bytesPerSecond': self.bytesPerSecond,
+            'eta': self.eta()
+        }
+
+    def _smooth(self, current: float, value: float):
+        if current is None:
+            return value
+        return current + self.smoothing * (value - current)
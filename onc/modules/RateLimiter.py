@@ -0,0 +1,77 @@
+import threading
+from time import monotonic, sleep
+
+
+class _TokenBucket:
+    """
+    Thread safe token bucket refilled at a constant rate
+    Callers reserve tokens even if the bucket runs empty, and then sleep until their reservation is covered,
+    which spreads concurrent callers evenly instead of letting them retry in bursts
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        """
+        @param rate:     Tokens added per second
+        @param capacity: Maximum number of tokens, i.e. the allowed burst
+        """
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self._tokens = self.capacity
+        self._last = monotonic()
+        self._lock = threading.Lock()
+
+    def take(self, n: float = 1):
+        """
+        Takes n tokens, blocking until they are available
+        @return: Seconds waited
+        """
+        with self._lock:
+            now = monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            self._tokens -= n
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.
+
+        if wait > 0:
+            sleep(wait)
+        return wait
+
+
+class RateLimiter:
+    """
+    Limits the request rate and the download bandwidth of an ONC instance
+    All services and download threads of the instance share the same budgets
+    """
+
+    def __init__(self, requestsPerSecond: float = None, bytesPerSecond: float = None, burst: float = None,
+                 burstBytes: float = None):
+        """
+        @param requestsPerSecond: Sustained number of requests per second, None for no limit
+        @param bytesPerSecond:    Sustained number of downloaded bytes per second, None for no limit
+        @param burst:             Number of requests that may be sent at once, defaults to one second of requests
+        @param burstBytes:        Number of bytes that may be downloaded at once, defaults to one second of bytes
+        """
+        self._requests = None
+        self._bytes = None
+        if requestsPerSecond:
+            self._requests = _TokenBucket(requestsPerSecond, burst or max(requestsPerSecond, 1))
+        if bytesPerSecond:
+            self._bytes = _TokenBucket(bytesPerSecond, burstBytes or bytesPerSecond)
+
+    def acquireRequest(self):
+        """
+        Blocks until a request may be sent
+        @return: Seconds waited
+        """
+        if self._requests is None:
+            return 0.
+        return self._requests.take(1)
+
+    def consumeBytes(self, size: int):
+        """
+        Accounts for size downloaded bytes, blocking as long as the download exceeds the bandwidth budget
+        @return: Seconds waited
+        """
+        if self._bytes is None or size <= 0:
+            return 0.
+        return self._bytes.take(size)
@@ -0,0 +1,270 @@
+import numpy as np
+import pandas
+
+from ._util import _parseTimestamps
+
+
+class RawReadings:
+    """
+    Compact raw data readings of the rawdata service, replacing the lists of strings of the JSON response
+    The readings are stored in one bytes buffer (UTF-8, each reading followed by a newline) with an int64 array of
+    offsets, so that reading i is buffer[offsets[i]:offsets[i + 1] - 1]. The times are an int64 array of nanoseconds
+    since 1970, and the other columns (i.e. lineTypes) are numpy arrays.
+    Like the JSON data, it can be indexed by the column names: 'times' returns a datetime64[ns] array, 'readings' a list
+    of strings (decoded on each access). The readings can be parsed to numpy columns with a vectorized parser, see
+    delimitedParser and fixedWidthParser.
+    """
+
+    def __init__(self, times: np.ndarray, buffer: bytes, offsets: np.ndarray, columns: dict = None):
+        """
+        @param times:   Sample times as int64 nanoseconds since 1970
+        @param buffer:  Readings as UTF-8 bytes, each reading followed by a newline
+        @param offsets: Start of each reading in buffer, and the length of buffer as last element
+        @param columns: Other columns of the data, as numpy arrays of the same length as times
+        """
+        self.times = np.asarray(times, dtype=np.int64)
+        self.buffer = buffer
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.columns = columns or {}
+
+    @classmethod
+    def fromData(cls, data: dict):
+        """
+        Returns the compact form of the data of a rawdata response ({'times': [...], 'readings': [...], ...})
+        """
+        readings = ['' if reading is None else reading for reading in data.get('readings') or []]
+        buffer = ''.join([reading + '\n' for reading in readings]).encode('utf-8')
+        ends = np.flatnonzero(np.frombuffer(buffer, dtype=np.uint8) == ord('\n'))
+        if len(ends) != len(readings):
+            # some readings contain newlines, locate each reading by its encoded length
+            lengths = [len(reading.encode('utf-8')) + 1 for reading in readings]
+            ends = np.cumsum(lengths, dtype=np.int64) - 1
+        offsets = np.r_[0, ends + 1].astype(np.int64)
+
+        times = _parseTimestamps(list(data.get('times') or [])).astype(np.int64)
+        columns = {key: np.asarray(column) for key, column in data.items() if key not in ('times', 'readings')}
+        return cls(times, buffer, offsets, columns)
+
+    @classmethod
+    def concatenate(cls, parts: list):
+        """
+        Returns the readings of parts one after the other
+        Columns missing in some parts are filled for their readings, see _missingColumn
+        """
+        parts = list(parts)
+        if len(parts) == 1:
+            return parts[0]
+        if not parts:
+            return cls(np.array([], dtype=np.int64), b'', np.zeros(1, dtype=np.int64))
+
+        starts = np.cumsum([0] + [len(part.buffer) for part in parts[:-1]])
+        offsets = np.concatenate([parts[0].offsets[:1]] +
+                                 [part.offsets[1:] + start for part, start in zip(parts, starts)])
+        columns = {}
+        for key in dict.fromkeys(key for part in parts for key in part.columns):
+            dtype = np.result_type(*[part.columns[key] for part in parts if key in part.columns])
+            columns[key] = np.concatenate([part.columns[key] if key in part.columns else
+                                           _missingColumn(dtype, len(part)) for part in parts])
+        return cls(np.concatenate([part.times for part in parts]), b''.join(part.buffer for part in parts), offsets,
+                   columns)
+
+    def __len__(self):
+        return len(self.times)
+
+    def __getitem__(self, key: str):
+        if key == 'times':
+            return self.times.astype('datetime64[ns]')
+        if key == 'readings':
+            return self.readings()
+        return self.columns[key]
+
+    def __contains__(self, key: str):
+        return key in self.keys()
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def keys(self):
+        return ['times', 'readings'] + list(self.columns)
+
+    @property
+    def nbytes(self):
+        """
+        Memory used by the arrays and the buffer, in bytes
+        """
+        return self.times.nbytes + self.offsets.nbytes + len(self.buffer) + \
+            sum(column.nbytes for column in self.columns.values())
+
+    def reading(self, index: int):
+        """
+        Returns reading index as a string
+        """
+        return self.buffer[self.offsets[index]:self.offsets[index + 1] - 1].decode('utf-8')
+
+    def readings(self):
+        """
+        Returns all readings as a list of strings
+        """
+        readings = self.buffer.decode('utf-8').split('\n')[:-1]
+        if len(readings) != len(self):
+            readings = [self.reading(i) for i in range(len(self))]
+        return readings
+
+    def select(self, mask):
+        """
+        Returns the readings selected by a boolean mask or an array of indices, i.e.
+        readings.select(readings['lineTypes'] == ' ')
+        """
+        index = np.arange(len(self))[mask]
+        lengths = np.diff(self.offsets)[index]
+        offsets = np.r_[0, np.cumsum(lengths)].astype(np.int64)
+        # position in the old buffer of each byte of the new buffer
+        positions = np.repeat(self.offsets[index] - offsets[:-1], lengths) + np.arange(offsets[-1])
+        buffer = np.frombuffer(self.buffer, dtype=np.uint8)[positions].tobytes()
+        columns = {key: column[index] for key, column in self.columns.items()}
+        return RawReadings(self.times[index], buffer, offsets, columns)
+
+    def parse(self, parser):
+        """
+        Parses the readings with parser, see delimitedParser and fixedWidthParser
+        @return: Dictionary of numpy columns, with the sample times as 'times' (datetime64[ns])
+        """
+        return parser(self)
+
+    def toData(self):
+        """
+        Returns the readings in the format of the JSON response, with the times as ISO8601 strings
+        """
+        times = [t + 'Z' for t in np.datetime_as_string(self['times'], unit='ms').tolist()]
+        data = {'times': times, 'readings': self.readings()}
+        data.update((key, column.tolist()) for key, column in self.columns.items())
+        return data
+
+
+def delimitedParser(delimiter: str = ',', names: list = None, dtypes: dict = None):
+    """
+    Returns a parser of readings made of fields separated by a delimiter, i.e. CSV lines of CTDs or NMEA sentences
+    Readings with fewer fields than named get NaN (or '') for the missing fields
+    @param delimiter: Single character between the fields, None splits on whitespace
+    @param names:     Name of each field, None for fields to skip. Defaults to 'field0', 'field1'... for all fields
+    @param dtypes:    Dictionary {name: dtype} of the fields that aren't float64, i.e. {'id': str}. Fields that can't be
+                      converted to float64 are NaN
+    """
+    if delimiter is not None and len(delimiter.encode('utf-8')) != 1:
+        raise ValueError(f'delimiter must be a single byte character; got {delimiter}')
+    dtypes = dtypes or {}
+
+    def parse(readings: RawReadings):
+        tokens, counts = _splitFields(readings, delimiter)
+        starts = np.r_[0, np.cumsum(counts)[:-1]].astype(np.int64)
+        fieldNames = names if names is not None else \
+            ['field{:d}'.format(i) for i in range(int(counts.max()) if len(counts) else 0)]
+
+        columns = {'times': readings['times']}
+        for field, name in enumerate(fieldNames):
+            if name is None:
+                continue
+            present = counts > field
+            column = np.full(len(readings), b'', dtype=tokens.dtype if len(tokens) else 'S1')
+            column[present] = tokens[starts[present] + field]
+            columns[name] = _convertField(column, dtypes.get(name, np.float64))
+        return columns
+
+    return parse
+
+
+def fixedWidthParser(fields: dict, dtypes: dict = None):
+    """
+    Returns a parser of readings with fields at fixed positions
+    Readings too short for a field get NaN (or '') for it
+    @param fields: Dictionary {name: (start, end)} of the byte positions of each field in a reading
+    @param dtypes: Dictionary {name: dtype} of the fields that aren't float64, see delimitedParser
+    """
+    dtypes = dtypes or {}
+
+    def parse(readings: RawReadings):
+        buffer = np.frombuffer(readings.buffer + b' ', dtype=np.uint8)
+        lineStarts, lineEnds = readings.offsets[:-1], readings.offsets[1:] - 1
+
+        columns = {'times': readings['times']}
+        for name, (start, end) in fields.items():
+            positions = lineStarts[:, None] + np.arange(start, end)
+            # bytes past the end of a reading are read as spaces
+            inside = positions < lineEnds[:, None]
+            chars = np.where(inside, buffer[np.where(inside, positions, len(buffer) - 1)], ord(' '))
+            column = np.ascontiguousarray(chars.astype(np.uint8)).view('S{:d}'.format(end - start)).ravel()
+            columns[name] = _convertField(np.char.strip(column), dtypes.get(name, np.float64))
+        return columns
+
+    return parse
+
+
+def _missingColumn(dtype: np.dtype, length: int):
+    """
+    Returns the column of readings without it: NaN for numbers (integers become floats), NaT for dates, '' for strings
+    and None for other types
+    """
+    if dtype.kind in 'biufc':
+        return np.full(length, np.nan)
+    if dtype.kind in 'mM':
+        return np.full(length, np.datetime64('NaT'), dtype=dtype)
+    if dtype.kind in 'SU':
+        return np.full(length, '', dtype=dtype)
+    return np.full(length, None, dtype=object)
+
+
+def _splitFields(readings: RawReadings, delimiter: str = None):
+    """
+    Splits all readings into fields
+    @return: (bytes array of the fields of all readings, int64 array of the number of fields of each reading)
+    """
+    if len(readings) == 0:
+        return np.array([], dtype='S1'), np.array([], dtype=np.int64)
+    buffer = np.frombuffer(readings.buffer, dtype=np.uint8)
+    if delimiter is None:
+        # a field starts at each non-whitespace byte following whitespace (a reading starts after a newline)
+        text = ~np.isin(buffer, np.frombuffer(b' \t\r\n\v\f', dtype=np.uint8))
+        fieldStarts = text & ~np.r_[False, text[:-1]]
+        counts = np.add.reduceat(fieldStarts.astype(np.int64), readings.offsets[:-1])
+        tokens = readings.buffer.split()
+    else:
+        separator = delimiter.encode('utf-8')
+        counts = np.add.reduceat((buffer == separator[0]).astype(np.int64), readings.offsets[:-1]) + 1
+        # the newline after each reading separates its last field from the first field of the next reading
+        joined = buffer.copy()
+        joined[readings.offsets[1:] - 1] = separator[0]
+        tokens = joined[:-1].tobytes().split(separator)
+    return np.array(tokens, dtype=bytes), counts
+
+
+def _convertField(column: np.ndarray, dtype):
+    """
+    Converts a bytes array of fields to dtype (str fields are decoded)
+    Numeric fields that can't be converted are NaN, and are returned as float64 if dtype can't hold NaN
+    """
+    if dtype is bytes:
+        return column
+    if dtype is str or np.dtype(dtype).kind in 'SU':
+        return np.char.decode(column, 'utf-8')
+    try:
+        return column.astype(dtype)
+    except ValueError:
+        converted = pandas.to_numeric(pandas.Series(np.char.decode(column, 'utf-8')), errors='coerce').to_numpy()
+        return converted.astype(dtype) if np.dtype(dtype).kind == 'f' else converted
+
+
+class _RawCompactor:
+    """
+    Replaces the data of each rawdata page with RawReadings as the pages of a download arrive, follows the stream
+    protocol of DataReducer (see _MultiPage._getSerialPages)
+    """
+
+    def stream(self):
+        return self
+
+    def reducePage(self, response: dict):
+        if not isinstance(response.get('data'), RawReadings):
+            response['data'] = RawReadings.fromData(response.get('data') or {})
+
+    def flushPage(self):
+        return None
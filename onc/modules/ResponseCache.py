@@ -0,0 +1,204 @@
+import copy
+import json
+import os
+import threading
+from collections import OrderedDict
+from time import time
+
+from ._util import _hashKey, _readJson, _writeJson
+
+
+class ResponseCache:
+    """
+    Caches web service responses in memory (LRU), and optionally in a directory shared between processes
+    Entries are keyed on the service and the normalized filters without the token, and expire after a time to
+    live (TTL) per service. Expired entries with validators (ETag, Last-Modified) are kept, so that the request can be
+    revalidated with a conditional request instead of downloading the response again.
+    Any object with the methods get, set, validators, refresh, invalidate and stats can be used as the cache of an ONC
+    instance.
+    """
+
+    # default seconds a response stays valid, per service
+    defaultTtl = {
+        'locations': 3600,
+        'deviceCategories': 3600,
+        'properties': 3600,
+        'dataProducts': 3600,
+        'devices': 600,
+        'deployments': 600,
+        'archivefiles': 60,
+    }
+
+    def __init__(self, maxEntries: int = 256, ttl: dict = None, directory: str = None, fallbackTtl: float = 300):
+        """
+        @param maxEntries:  Maximum number of responses kept in memory, the least recently used are dropped first
+        @param ttl:         Dictionary {service: seconds} updating the defaultTtl, 0 disables caching for a service
+        @param directory:   If not None, responses are also stored as json files in this directory
+        @param fallbackTtl: Seconds a response stays valid for services not in ttl
+        """
+        self.maxEntries = maxEntries
+        self.ttl = dict(self.defaultTtl)
+        if ttl is not None:
+            self.ttl.update(ttl)
+        self.fallbackTtl = fallbackTtl
+        self.directory = directory
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+        self._entries = OrderedDict()  # key -> {'service', 'time', 'value', 'validators'}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(service: str, filters: dict):
+        """
+        Returns the cache key for a request, which ignores the token and the order of the filters
+        """
+        normalized = {k: str(v) for k, v in filters.items() if k != 'token' and v is not None}
+        return '{:s}?{:s}'.format(service, json.dumps(normalized, sort_keys=True))
+
+    def get(self, service: str, filters: dict):
+        """
+        Returns a copy of the cached response for the request, or None if it is missing or expired
+        """
+        key = self.key(service, filters)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._loadFile(key)
+            if entry is None or self._isExpired(entry):
+                self.misses += 1
+                if entry is not None and not entry.get('validators'):
+                    # an expired entry is only useful for revalidation
+                    self._entries.pop(key, None)
+                return None
+
+            self._remember(key, entry)
+            self.hits += 1
+            return copy.deepcopy(entry['value'])
+
+    def set(self, service: str, filters: dict, value, validators: dict = None):
+        """
+        Stores a copy of the response of a request
+        @param validators: Dictionary with the 'etag' and/or 'lastModified' headers of the response, if any
+        """
+        if self._ttlFor(service) <= 0:
+            return
+
+        key = self.key(service, filters)
+        entry = {'service': service, 'time': time(), 'value': copy.deepcopy(value), 'validators': validators or {}}
+        with self._lock:
+            self._remember(key, entry)
+            self._storeFile(key, entry)
+
+    def validators(self, service: str, filters: dict):
+        """
+        Returns the validators stored with the (possibly expired) response of a request, or None if there are none
+        """
+        key = self.key(service, filters)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._loadFile(key)
+            if entry is None:
+                return None
+            return dict(entry.get('validators') or {}) or None
+
+    def refresh(self, service: str, filters: dict):
+        """
+        Restarts the time to live of a response the server confirmed to be unchanged (HTTP 304)
+        Returns a copy of the cached response, or None if it is not cached anymore
+        """
+        key = self.key(service, filters)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._loadFile(key)
+            if entry is None:
+                return None
+
+            entry['time'] = time()
+            self._remember(key, entry)
+            self._storeFile(key, entry)
+            self.revalidations += 1
+            return copy.deepcopy(entry['value'])
+
+    def invalidate(self, service: str = None, filters: dict = None):
+        """
+        Removes cached responses
+        @param service: If None, removes all responses, otherwise only those of the service
+        @param filters: If not None, removes only the response of the request to the service with these filters, which
+                        requires the service
+        """
+        if filters is not None and service is None:
+            raise ValueError('invalidate requires the service of the filters')
+        with self._lock:
+            if filters is not None:
+                keys = [self.key(service, filters)]
+            else:
+                keys = [k for k, e in self._entries.items() if service is None or e['service'] == service]
+            for key in keys:
+                self._entries.pop(key, None)
+
+            if self.directory is not None:
+                if filters is not None:
+                    self._removeFile(keys[0])
+                else:
+                    for name in os.listdir(self.directory):
+                        if not name.endswith('.json'):
+                            continue
+                        path = os.path.join(self.directory, name)
+                        if service is None or _readJson(path, {}).get('service') == service:
+                            self._removeFile(path=path)
+
+    def stats(self):
+        """
+        Returns a dictionary with the hit, miss and revalidation counters and the number of entries in memory
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'revalidations': self.revalidations,
+                'hitRatio': self.hits / lookups if lookups > 0 else 0.,
+                'entries': len(self._entries)
+            }
+
+    def _ttlFor(self, service: str):
+        return self.ttl.get(service, self.fallbackTtl)
+
+    def _isExpired(self, entry: dict):
+        return time() - entry['time'] > self._ttlFor(entry['service'])
+
+    def _remember(self, key: str, entry: dict):
+        """
+        Adds or refreshes an entry in the in-memory LRU, dropping the least recently used above maxEntries
+        """
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxEntries:
+            self._entries.popitem(last=False)
+
+    def _filePath(self, key: str):
+        return os.path.join(self.directory, _hashKey(key) + '.json')
+
+    def _loadFile(self, key: str):
+        if self.directory is None:
+            return None
+        return _readJson(self._filePath(key))
+
+    def _storeFile(self, key: str, entry: dict):
+        if self.directory is None:
+            return
+        _writeJson(self._filePath(key), entry)
+
+    def _removeFile(self, key: str = None, path: str = None):
+        if path is None:
+            path = self._filePath(key)
+        try:
+            os.remove(path)
+        except OSError:
+            pass
@@ -0,0 +1,77 @@
+import random
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+
+class RetryPolicy:
+    """
+    Decides if and when a failed request is sent again
+    One policy is shared by all the services of an ONC instance, including multi-page and archive downloads
+    """
+
+    def __init__(self, maxAttempts: int = 3, backoff: float = 1.0, maxBackoff: float = 60.0, jitter: bool = True,
+                 retryStatuses: tuple = (500, 502, 503, 504, 598), retryTimeouts: bool = True,
+                 respectRetryAfter: bool = True):
+        """
+        @param maxAttempts:       Total number of attempts per request, 1 disables retrying
+        @param backoff:           Seconds to wait before the first retry, doubled for every further retry
+        @param maxBackoff:        Upper limit in seconds for the exponential backoff and the Retry-After header
+        @param jitter:            If True, waits a random time between half and the full backoff
+        @param retryStatuses:     HTTP status codes that are retried
+        @param retryTimeouts:     If True, timeouts and connection errors are retried
+        @param respectRetryAfter: If True, a Retry-After header of the response replaces the backoff (up to maxBackoff)
+        """
+        self.maxAttempts = max(int(maxAttempts), 1)
+        self.backoff = backoff
+        self.maxBackoff = maxBackoff
+        self.jitter = jitter
+        self.retryStatuses = set(retryStatuses)
+        self.retryTimeouts = retryTimeouts
+        self.respectRetryAfter = respectRetryAfter
+
+    def shouldRetry(self, attempt: int, response=None, error: Exception = None):
+        """
+        Returns True if the request that was sent for the attempt-th time should be sent again
+        @param response: The requests.Response obtained, if any
+        @param error:    The exception raised by the request (timeout or connection error), if any
+        """
+        if attempt >= self.maxAttempts:
+            return False
+        if error is not None:
+            return self.retryTimeouts
+        return response is not None and response.status_code in self.retryStatuses
+
+    def delay(self, attempt: int, response=None):
+        """
+        Returns the seconds to wait before sending the request for the (attempt + 1)-th time
+        A Retry-After header longer than maxBackoff is capped, so that a server can't stall the client
+        """
+        if self.respectRetryAfter and response is not None:
+            retryAfter = self._parseRetryAfter(response.headers.get('Retry-After'))
+            if retryAfter is not None:
+                return min(retryAfter, self.maxBackoff)
+
+        delay = min(self.backoff * 2 ** (attempt - 1), self.maxBackoff)
+        if self.jitter:
+            delay = delay / 2 + random.uniform(0, delay / 2)
+        return delay
+
+    @staticmethod
+    def _parseRetryAfter(value: str):
+        """
+        Returns the seconds from a Retry-After header, given either in seconds or as an HTTP date
+        Returns None if the value is missing or can't be parsed
+        """
+        if not value:
+            return None
+        try:
+            return max(float(value), 0.)
+        except ValueError:
+            pass
+        try:
+            date = parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        if date.tzinfo is None:
+            date = date.replace(tzinfo=timezone.utc)
+        return max((date - datetime.now(timezone.utc)).total_seconds(), 0.)
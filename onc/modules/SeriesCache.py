@@ -0,0 +1,227 @@
+import json
+import os
+import shutil
+import threading
+
+import numpy as np
+
+from ._columnar import _sensorColumns
+from ._util import _hashKey, _lockFile, _readJson, _writeAtomic, _writeJson
+
+
+class SeriesCache:
+    """
+    On-disk cache of the scalar data of devices, so that overlapping time ranges are only downloaded once
+    Each request (device and filters without dates) has its own directory, holding the data of each sensor as numpy
+    columns in one file per day, and the time intervals already downloaded (the coverage). getDirectByDevice with
+    allPages downloads only the gaps of the coverage, and assembles its result from the cache.
+    Data newer than settle seconds is downloaded again by the next request, because the server may still be
+    receiving it.
+    The data is returned typed like the numpy output of scalardata (see _sensorColumns): values are float64 with the
+    missing values (None) as NaN, and qaqcFlags are int8. Unlike a download, sensors without samples in the requested
+    time range are left out, and samples stored without qaqcFlags have flag 0 if other samples of the sensor have flags.
+    """
+
+    # filters that don't change the data of a time range
+    ignoredFilters = ('token', 'method', 'dateFrom', 'dateTo', 'rowLimit')
+
+    def __init__(self, directory: str, settle: float = 3600):
+        """
+        @param directory: Directory of the cache, can be shared between processes, which update the data of a request
+                          one at a time (see _lockFile)
+        @param settle:    Seconds before now after which downloaded data isn't marked as complete
+        """
+        self.directory = directory
+        self.settle = settle
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+
+    def key(self, filters: dict):
+        """
+        Returns the cache key of a request, which ignores the token, dates and rowLimit
+        """
+        normalized = {k: str(v) for k, v in filters.items() if k not in self.ignoredFilters and v is not None}
+        return json.dumps(normalized, sort_keys=True)
+
+    def gaps(self, filters: dict, dateFrom: np.datetime64, dateTo: np.datetime64):
+        """
+        Returns the time intervals of [dateFrom, dateTo) that aren't in the cache
+        @return: List of (dateFrom, dateTo) datetime64[ns] tuples
+        """
+        start, end = self._ns(dateFrom), self._ns(dateTo)
+        gaps = []
+        for coveredFrom, coveredTo in self._readMeta(filters)['coverage']:
+            if coveredTo <= start or coveredFrom >= end:
+                continue
+            if coveredFrom > start:
+                gaps.append((start, coveredFrom))
+            start = max(start, coveredTo)
+        if start < end:
+            gaps.append((start, end))
+        return [(np.datetime64(a, 'ns'), np.datetime64(b, 'ns')) for a, b in gaps]
+
+    def store(self, filters: dict, response: dict, dateFrom: np.datetime64, dateTo: np.datetime64):
+        """
+        Adds the scalar data of a response for [dateFrom, dateTo) to the cache, and marks the interval as covered
+        up to settle seconds before now
+        @return: False if the data can't be cached (values that aren't numbers), True otherwise
+        """
+        sensors = []
+        for sensorData in response.get('sensorData') or []:
+            columns = _sensorColumns(sensorData['data'])
+            if any(column.dtype == object for column in columns.values()):
+                return False
+            sensors.append((sensorData, columns))
+
+        with self._lock, _lockFile(self._lockPath(self._path(filters))):
+            os.makedirs(self._path(filters), exist_ok=True)
+            meta = self._readMeta(filters)
+            for sensorData, columns in sensors:
+                index = self._sensorIndex(meta, sensorData)
+                self._storeColumns(filters, index, columns)
+
+            end = min(self._ns(dateTo), self._ns(np.datetime64('now', 'ns')) - int(self.settle * 1e9))
+            if end > self._ns(dateFrom):
+                meta['coverage'] = self._merge(meta['coverage'] + [[self._ns(dateFrom), end]])
+            meta['response'] = {k: v for k, v in response.items() if k not in ('sensorData', 'next')}
+            _writeJson(self._metaPath(filters), meta)
+        return True
+
+    def load(self, filters: dict, dateFrom: np.datetime64, dateTo: np.datetime64):
+        """
+        Returns the cached scalar data of [dateFrom, dateTo) as a scalardata response, with the data of each sensor as
+        numpy columns (see _sensorColumns)
+        """
+        meta = self._readMeta(filters)
+        days = np.arange(np.datetime64(dateFrom, 'D'), np.datetime64(dateTo - np.timedelta64(1, 'ns'), 'D') + 1)
+
+        sensorData = []
+        for index, sensor in enumerate(meta['sensors']):
+            chunks = [self._readDay(filters, index, day) for day in days]
+            chunks = [chunk for chunk in chunks if chunk is not None]
+            if not chunks:
+                continue
+            columns = self._concatenateColumns(chunks)
+            inRange = (columns['sampleTimes'] >= dateFrom) & (columns['sampleTimes'] < dateTo)
+            if not inRange.any():
+                continue
+            sensorData.append(dict(sensor, data={key: column[inRange] for key, column in columns.items()}))
+
+        response = dict(meta.get('response', {}))
+        response['sensorData'] = sensorData or None
+        response['next'] = None
+        return response
+
+    def invalidate(self, filters: dict = None):
+        """
+        Removes cached data
+        @param filters: If not None, removes only the data of the request with these filters, otherwise all
+        """
+        if filters is not None:
+            paths = [self._path(filters)]
+        else:
+            paths = [os.path.join(self.directory, name) for name in os.listdir(self.directory)
+                     if not name.endswith('.lock')]
+        with self._lock:
+            for path in paths:
+                with _lockFile(self._lockPath(path)):
+                    shutil.rmtree(path, ignore_errors=True)
+
+    def _storeColumns(self, filters: dict, index: int, columns: dict):
+        """
+        Merges the columns of a sensor into its day files. Samples already cached are replaced by the new ones
+        Columns missing in the cached or the new samples (i.e. qaqcFlags) are filled, see _missingColumn
+        """
+        times = columns['sampleTimes']
+        if len(times) == 0:
+            return
+        days = times.astype('datetime64[D]')
+        for day in np.unique(days):
+            new = {key: column[days == day] for key, column in columns.items()}
+            old = self._readDay(filters, index, day)
+            if old is not None:
+                merged = self._concatenateColumns([new, old])
+                # the first occurrence of each time is kept, which is the new one
+                _, first = np.unique(merged['sampleTimes'], return_index=True)
+                new = {key: column[first] for key, column in merged.items()}
+            else:
+                order = np.argsort(new['sampleTimes'], kind='stable')
+                new = {key: column[order] for key, column in new.items()}
+            self._writeDay(filters, index, day, new)
+
+    @staticmethod
+    def _concatenateColumns(chunks: list):
+        """
+        Concatenates the columns of chunks, on the union of their keys
+        """
+        keys = list(dict.fromkeys(key for chunk in chunks for key in chunk))
+        return {key: np.concatenate([chunk[key] if key in chunk else
+                                     SeriesCache._missingColumn(key, len(chunk['sampleTimes'])) for chunk in chunks])
+                for key in keys}
+
+    @staticmethod
+    def _missingColumn(key: str, length: int):
+        """
+        Returns the column of samples without key: qaqcFlags 0 (no quality control), other columns NaN
+        """
+        if key == 'qaqcFlags':
+            return np.zeros(length, dtype=np.int8)
+        return np.full(length, np.nan)
+
+    @staticmethod
+    def _sensorIndex(meta: dict, sensorData: dict):
+        """
+        Returns the index of a sensor in the metadata, adding it if it is new
+        """
+        sensor = {k: v for k, v in sensorData.items() if k != 'data'}
+        for index, known in enumerate(meta['sensors']):
+            if known['sensorCode'] == sensor['sensorCode']:
+                meta['sensors'][index] = sensor
+                return index
+        meta['sensors'].append(sensor)
+        return len(meta['sensors']) - 1
+
+    @staticmethod
+    def _merge(intervals: list):
+        """
+        Returns the union of [start, end) intervals as a sorted list of disjoint intervals
+        """
+        merged = []
+        for start, end in sorted(intervals):
+            if merged and start <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], end)
+            else:
+                merged.append([start, end])
+        return merged
+
+    @staticmethod
+    def _ns(date: np.datetime64):
+        return int(np.datetime64(date, 'ns').astype(np.int64))
+
+    def _path(self, filters: dict):
+        return os.path.join(self.directory, _hashKey(self.key(filters)))
+
+    @staticmethod
+    def _lockPath(path: str):
+        # next to the directory of the request, which invalidate removes
+        return path + '.lock'
+
+    def _metaPath(self, filters: dict):
+        return os.path.join(self._path(filters), 'meta.json')
+
+    def _dayPath(self, filters: dict, index: int, day: np.datetime64):
+        return os.path.join(self._path(filters), '{:d}-{:s}.npz'.format(index, str(day)))
+
+    def _readMeta(self, filters: dict):
+        return _readJson(self._metaPath(filters), {'sensors': [], 'coverage': []})
+
+    def _readDay(self, filters: dict, index: int, day: np.datetime64):
+        try:
+            with np.load(self._dayPath(filters, index, day)) as chunk:
+                return {key: chunk[key] for key in chunk.files}
+        except (OSError, ValueError):
+            return None
+
+    def _writeDay(self, filters: dict, index: int, day: np.datetime64, columns: dict):
+        # np.savez appends .npz to names without it
+        _writeAtomic(self._dayPath(filters, index, day), lambda tmpPath: np.savez(tmpPath, **columns), '.tmp.npz')
@@ -0,0 +1,66 @@
+import json
+import os
+import shutil
+
+from ._util import _hashKey, _readJson, _writeJson
+
+
+class _Checkpoint:
+    """
+    Stores the progress of a multi-page download in a directory, so that a failed download can be resumed
+    Each downloaded page is written as a json file, and state.json holds the 'next' parameters to continue with.
+    The checkpoint of a request is found by a hash of the service, url, filters without the token and the extension
+    of archivefiles, see key
+    """
+
+    def __init__(self, directory: str, service: str, url: str, filters: dict, extension: str = None):
+        """
+        @param extension: The extension the archivefiles are filtered by, which isn't part of the filters
+        """
+        self.path = os.path.join(directory, _hashKey(self.key(service, url, filters, extension)))
+
+    @staticmethod
+    def key(service: str, url: str, filters: dict, extension: str = None):
+        """
+        Returns the key of the checkpoint of a request, which ignores the token and the order of the filters
+        """
+        normalized = {k: str(v) for k, v in filters.items() if k != 'token' and v is not None}
+        return json.dumps([service, url, normalized, extension], sort_keys=True)
+
+    def load(self):
+        """
+        Returns the saved progress as a tuple (pages, nextParameters) without the token, or None if there is none
+        """
+        state = _readJson(os.path.join(self.path, 'state.json'))
+        if state is None:
+            return None
+
+        pages = []
+        for page in range(1, state['pages'] + 1):
+            response = _readJson(self._pagePath(page))
+            if response is None:
+                # incomplete checkpoint, start over
+                return None
+            pages.append(response)
+        return pages, state['next']
+
+    def save(self, page: int, response: dict, nextParameters: dict):
+        """
+        Saves a page and the parameters of the following page. The page files are written before the state,
+        so that the state never refers to a missing page
+        @param page: Number of the page, starting at 1
+        """
+        os.makedirs(self.path, exist_ok=True)
+        _writeJson(self._pagePath(page), response)
+        nextParameters = {k: v for k, v in nextParameters.items() if k != 'token'}
+        _writeJson(os.path.join(self.path, 'state.json'), {'pages': page, 'next': nextParameters})
+
+    def remove(self):
+        """
+        Deletes the checkpoint, once the download is complete
+        """
+        shutil.rmtree(self.path, ignore_errors=True)
+
+    def _pagePath(self, page: int):
+        return os.path.join(self.path, 'page-{:06d}.json'.format(page))
+
@@ -15,7 +15,12 @@ class _DataProductFile:
     Is able to poll and wait if required
     """
 
-    def __init__(self, dpRunId: int, index: str, baseUrl: str, token: str):
+    def __init__(self, dpRunId: int, index: str, baseUrl: str, token: str, service: object = None):
+        """
+        @param service: The _OncService whose pooled session is used for the requests.
+                        If None, every request opens its own connection
+        """
+        self._service = service
         self._retries = 0
         self._status = 202
         self._downloaded = False
@@ -47,67 +52,93 @@ class _DataProductFile:
             try:
                 # Run timed request
                 start = time()
-                response = requests.get(self._baseUrl, self._filters, timeout=timeout)
+                if self._service is None:
+                    response = requests.get(self._baseUrl, self._filters, timeout=timeout)
+                else:
+                    response = self._service._sendRequest(self._baseUrl, self._filters, timeout=timeout)
                 duration = time() - start
 
-                self._downloadUrl = response.url
-                self._status = response.status_code
-                self._retries += 1
-
-                # print('request got {:d}'.format(response.status_code))
-                if 0 < maxRetries < self._retries:
-                    raise MaxRetriesException('   Maximum number of retries ({:d}) exceeded'.format(maxRetries))
-
-                # Status 200: file downloaded, 202: processing, 204: no data,
-                # 400: error, 404: index out of bounds, 410: gone (file deleted from FTP)
-                if self._status == 200:
-                    # File downloaded, get filename from header and save
-                    self._downloaded = True
-                    self._downloadingTime = round(duration, 3)
-                    filename = self.extractNameFromHeader(response)
-                    self._filePath = os.path.join(outPath, filename)
-                    self._fileSize = len(response.content)
-                    saved = saveAsFile(response, outPath, filename, overwrite)
-                    if saved == 0:
-                        pass
-                    elif saved == -2:
-                        if self._retries > 1:
-                            print('')  # new line if required
-                        print('   Skipping "{:s}": File already exists.'.format(self._filePath))
-                        self._status = 777
-                    else:
-                        raise Exception('An error occurred when saving the file "{:}"'.format(filename))
-
-                elif self._status == 202:
+                self._processResponse(response, duration, outPath, maxRetries, overwrite, log)
+                if self._status == 202:
                     # Still processing, wait and retry
-                    log.logMessage(response.json())
                     sleep(pollPeriod)
-
-                elif self._status == 204:
-                    # No data found
-                    print('   No data found.')
-
-                elif self._status == 400:
-                    # API Error
-                    _printErrorMessage(response)
-                    raise Exception('The request failed with HTTP status {:d}.'.format(self._status), response.json())
-
-                elif self._status == 404:
-                    # Index too high, no more files to download
-                    log.printNewLine()
-                    pass
-
-                else:
-                    # Gone
-                    print(
-                        '   FTP Error: File not found. If this product order is recent, retry downloading this product'
-                        ' using the method downloadProduct with the runId: ' + str(self._filters['dpRunId']))
-                    _printErrorMessage(response)
             except Exception as ex:
                 raise ex
 
         return self._status
 
+    def _processResponse(self, response, duration: float, outPath: str, maxRetries: int, overwrite: bool,
+                         log: _PollLog):
+        """
+        Updates the state of this file from the response of a single download request, and saves the file if ready
+        The caller is expected to wait and request again while the status is 202
+        @param response: A requests.Response, or an object with the same attributes
+        @param duration: Seconds the request took
+        """
+        self._downloadUrl = str(response.url)
+        self._status = response.status_code
+        self._retries += 1
+
+        # print('request got {:d}'.format(response.status_code))
+        if 0 < maxRetries < self._retries:
+            raise MaxRetriesException('   Maximum number of retries ({:d}) exceeded'.format(maxRetries))
+
+        # Status 200: file downloaded, 202: processing, 204: no data,
+        # 400: error, 404: index out of bounds, 410: gone (file deleted from FTP)
+        if self._status == 200:
+            # File downloaded, get filename from header and save
+            self._downloaded = True
+            self._downloadingTime = round(duration, 3)
+            filename = self.extractNameFromHeader(response)
+            self._filePath = os.path.join(outPath, filename)
+            self._fileSize = len(response.content)
+            saved = saveAsFile(response, outPath, filename, overwrite)
+            if saved == 0:
+                self._emit('fileDownloaded', response, duration, file=filename, outPath=outPath)
+            elif saved == -2:
+                if self._retries > 1:
+                    print('')  # new line if required
+                print('   Skipping "{:s}": File already exists.'.format(self._filePath))
+                self._status = 777
+            else:
+                raise Exception('An error occurred when saving the file "{:}"'.format(filename))
+
+        elif self._status == 202:
+            # Still processing
+            log.logMessage(response.json())
+            self._emit('pollTick', response, duration, poll=self._retries)
+
+        elif self._status == 204:
+            # No data found
+            print('   No data found.')
+
+        elif self._status == 400:
+            # API Error
+            _printErrorMessage(response)
+            raise Exception('The request failed with HTTP status {:d}.'.format(self._status), response.json())
+
+        elif self._status == 404:
+            # Index too high, no more files to download
+            log.printNewLine()
+            pass
+
+        else:
+            # Gone
+            print(
+                '   FTP Error: File not found. If this product order is recent, retry downloading this product'
+                ' using the method downloadProduct with the runId: ' + str(self._filters['dpRunId']))
+            _printErrorMessage(response)
+
+    def _emit(self, event: str, response, duration: float, **fields):
+        """
+        Emits an event for a download request on the event hooks of the service, if this file has a service
+        """
+        if self._service is None:
+            return
+        self._service._emit(event, url=self._baseUrl, service='dataProductDelivery', status=self._status,
+                            bytes=len(response.content), latency=duration, retries=getattr(response, 'retries', 0),
+                            **fields)
+
     @staticmethod
     def extractNameFromHeader(response):
         """
@@ -1,125 +1,435 @@
 import math
+import queue
 import re
+import threading
 import weakref
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
 from time import time
 
 import dateutil.parser
+import numpy as np
 
-from ._util import _formatDuration
+from ._Checkpoint import _Checkpoint
+from ._PageAccumulator import _PageAccumulator
+from .Progress import Progress
+from ._util import _formatDuration, _parseTimestamps
 
 
 # Handles data multi-page downloads (scalardata, rawdata, archivefiles)
 class _MultiPage:
+    # time windows per worker thread of parallel downloads, more windows balance uneven data density
+    windowsPerWorker = 4
+
     def __init__(self, parent: object):
         self.parent = weakref.ref(parent)
         self.result = None
 
-    def getAllPages(self, service: str, url: str, filters: dict):
+    def getAllPages(self, service: str, url: str, filters: dict, workers: int = None, reducer=None):
         """
         Requests all pages from the service, with the url and filters
         Multiple pages will be downloaded until completed
+        @param workers: If > 1, the time range dateFrom..dateTo is split into windows, which are downloaded by this
+                        number of threads at the same time and stitched in time order
+        @param reducer: Transformation of each page as it arrives, i.e. a DataReducer for scalardata, see
+                        _getSerialPages
         @return: Service response with concatenated data for all pages obtained
         """
         try:
-            # pop archivefiles extension
-            extension = None
-            if service == 'archivefiles':
-                if 'extension' in filters:
-                    extension = filters['extension']
-                    del filters['extension']
+            extension = self._popExtension(service, filters)
 
-            # download first page
-            start = time()
-            response, responseTime = self._doPageRequest(url, filters, service, extension)
+            if workers is not None and workers > 1:
+                # windows start on a bin of the reducer, so that no bin is split between two windows
+                align = getattr(reducer, 'period', None)
+                windows = self._timeWindows(filters, workers * self.windowsPerWorker, align)
+                if windows:
+                    return self._getShardedPages(service, url, filters, extension, windows, workers, reducer)
+                print('Parallel download requires dateFrom and dateTo as dates, downloading pages one by one.')
+
+            return self._getSerialPages(service, url, filters, extension, reducer=reducer)
+        except Exception:
+            raise
+
+    def iterPages(self, service: str, url: str, filters: dict):
+        """
+        Generator requesting the pages from the service one after the other, with the url and filters
+        Each page is yielded as soon as it arrives, so that it can be processed and dropped by the caller
+        @return: Iterator over the service responses of all pages
+        """
+        extension = self._popExtension(service, filters)
+        for response, duration, size in self._iterPages(service, url, filters, extension):
+            yield response
+
+    def _iterPages(self, service: str, url: str, filters: dict, extension: str = None, prefetch: int = None):
+        """
+        Generator requesting the pages one after the other, following the 'next' parameters of each response
+        @param prefetch: Number of pages requested ahead in a background thread while the caller processes the current
+                         one, defaults to the prefetch of the ONC object. With 0, the next page is only requested when
+                         the caller asks for it
+        @return: Iterator over tuples (jsonResponse, duration, bytes)
+        """
+        if prefetch is None:
+            prefetch = self.parent()._config('prefetch')
+
+        pages = self._requestPages(service, url, filters, extension)
+        if not prefetch or prefetch < 1:
+            return pages
+        return self._prefetchPages(pages, prefetch)
+
+    def _requestPages(self, service: str, url: str, filters: dict, extension: str = None):
+        """
+        Generator requesting each page when the caller asks for it
+        With the page_latency of the ONC object, the rowLimit of the 'next' parameters is adapted to reach it
+        @return: Iterator over tuples (jsonResponse, duration, bytes)
+        """
+        pageLatency = self.parent()._config('page_latency')
+        tuner = _PageSizeTuner(pageLatency, filters.get('rowLimit')) if pageLatency else None
+
+        page = 1
+        response, duration, size = self._doPageRequest(url, filters, service, extension, page=page)
+        while True:
             rNext = response['next']
+            if rNext is not None and tuner is not None:
+                rNext['parameters']['rowLimit'] = tuner.update(self._rowCount(response, service), duration)
+            yield response, duration, size
+            if rNext is None:
+                return
+            page += 1
+            response, duration, size = self._doPageRequest(url, rNext['parameters'], service, extension, page=page)
+
+    @staticmethod
+    def _prefetchPages(pages, depth: int):
+        """
+        Runs the page generator in a background thread, which stays up to depth pages ahead of the caller
+        The first page is requested by the caller, and the thread only starts if it has a next page
+        Errors of the requests are raised to the caller when it reaches the failed page
+        Closing this generator stops the background thread after its current request
+        """
+        first = next(pages)
+        if first[0]['next'] is None:
+            pages.close()
+            yield first
+            return
+
+        buffer = queue.Queue(maxsize=depth)
+        stop = threading.Event()
+
+        def put(item):
+            while not stop.is_set():
+                try:
+                    buffer.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        def produce():
+            try:
+                for item in pages:
+                    if not put(('page', item)):
+                        return
+                put(('done', None))
+            except Exception as error:
+                put(('error', error))
+            finally:
+                pages.close()
+
+        thread = threading.Thread(target=produce, name='onc-prefetch', daemon=True)
+        thread.start()
+        try:
+            yield first
+            while True:
+                kind, item = buffer.get()
+                if kind == 'done':
+                    return
+                if kind == 'error':
+                    raise item
+                yield item
+        finally:
+            stop.set()
+
+    @staticmethod
+    def _popExtension(service: str, filters: dict):
+        """
+        Removes the artificial archivefiles filter 'extension' from the filters
+        @return: The extension, or None
+        """
+        extension = None
+        if service == 'archivefiles':
+            if 'extension' in filters:
+                extension = filters['extension']
+                del filters['extension']
+        return extension
+
+    def _getSerialPages(self, service: str, url: str, filters: dict, extension: str = None, verbose: bool = True,
+                        prefetch: int = None, reducer=None):
+        """
+        Requests all pages one after the other, following the 'next' parameters of each response
+        With the checkpoint_dir of the ONC object, each page is saved, and a failed download continues from the last
+        saved page when it is requested again
+        The progress in rows, with the total estimated from the time range covered so far, is emitted as progress events
+        @param verbose:  If False, doesn't print the progress
+        @param prefetch: Number of pages requested ahead, see _iterPages
+        @param reducer:  Transformation applied to each page before it is collected, i.e. a DataReducer. Its stream()
+                         returns an object with the methods reducePage(page), which changes a page in place, and
+                         flushPage(), which returns a last page to collect, or None
+        @return: Service response with concatenated data for all pages obtained
+        """
+        log = print if verbose else (lambda *args: None)
+        pages = None
+        try:
+            start = time()
+            stream = reducer.stream() if reducer is not None else None
+            accumulator = _PageAccumulator(service)
+
+            def collect(page):
+                if stream is not None:
+                    stream.reducePage(page)
+                accumulator.add(page)
 
+            def finish():
+                if stream is not None:
+                    lastPage = stream.flushPage()
+                    if lastPage is not None:
+                        accumulator.add(lastPage)
+                return accumulator.result()
+
+            progress = Progress(self.parent()._config('hooks') if verbose else None, 'pages', service)
+            timeRange = self._timeRange(filters)
+            pageCount = 0
+
+            # continue a previous download of the same request
+            checkpoint = None
+            if self.parent()._config('checkpoint_dir') is not None:
+                checkpoint = _Checkpoint(self.parent()._config('checkpoint_dir'), service, url, filters, extension)
+                resumed = checkpoint.load()
+                if resumed is not None:
+                    for savedResponse in resumed[0]:
+                        collect(savedResponse)
+                    pageCount = len(resumed[0])
+                    progress.done = accumulator.rows
+                    filters = dict(resumed[1], token=filters.get('token'))
+                    log('Resuming the download from page {:d}.'.format(pageCount + 1))
+
+            # download first page
+            pages = self._iterPages(service, url, filters, extension, prefetch=prefetch)
+            response, responseTime, size = next(pages)
+            rNext = response['next']
+            pageCount += 1
+            # pages are saved as received, and reduced again when resuming
+            if checkpoint is not None and rNext is not None:
+                checkpoint.save(pageCount, response, rNext['parameters'])
+            # estimated from the page as received, a reducer shrinks it
+            pageLatency = self.parent()._config('page_latency')
             if rNext is not None:
-                print("Data quantity is greater than the row limit and will be downloaded in multiple pages.")
+                pageEstimate = self._estimatePages(response, service, responseTime,
+                                                   rowLimit=rNext['parameters']['rowLimit'] if pageLatency else None)
+            collect(response)
+            progress.update(self._rowCount(response, service), size,
+                            self._estimateRows(accumulator.rows, timeRange, rNext))
+
+            if rNext is None and (pageCount > 1 or stream is not None):
+                response = finish()
 
-                pageCount = 1
-                pageEstimate = self._estimatePages(response, service, responseTime)
+            if rNext is not None:
+                log("Data quantity is greater than the row limit and will be downloaded in multiple pages.")
                 if pageEstimate > 0:
-                    timeEstimate = _formatDuration(pageEstimate * responseTime)
-                    print('Estimated approx. {:d} pages'.format(pageEstimate))
-                    print('Estimated approx. {:s} to complete'.format(timeEstimate))
+                    timeEstimate = _formatDuration(pageEstimate * (pageLatency or responseTime))
+                    log('Estimated approx. {:d} pages'.format(pageEstimate))
+                    log('Estimated approx. {:s} to complete'.format(timeEstimate))
 
                 # keep downloading pages until next is None
-                print('')
+                log('')
                 while rNext is not None:
                     pageCount += 1
-                    rowCount = self._rowCount(response, service)
 
-                    print("   ({:d} samples) Downloading page {:d}...".format(rowCount, pageCount))
-                    nextResponse, nextTime = self._doPageRequest(url, rNext['parameters'], service, extension)
+                    log("   ({:d} samples) Downloading page {:d}...".format(accumulator.rows, pageCount))
+                    nextResponse, nextTime, size = next(pages)
                     rNext = nextResponse['next']
 
-                    # concatenate new data obtained
-                    self._catenateData(response, nextResponse, service)
+                    # collect new data obtained, concatenated once all pages are downloaded
+                    if checkpoint is not None and rNext is not None:
+                        checkpoint.save(pageCount, nextResponse, rNext['parameters'])
+                    collect(nextResponse)
+                    progress.update(self._rowCount(nextResponse, service), size,
+                                    self._estimateRows(accumulator.rows, timeRange, rNext))
 
+                response = finish()
                 totalTime = _formatDuration(time() - start)
-                print("   ({:d} samples) Completed in {:s}.".format(self._rowCount(response, service), totalTime))
-                response['next'] = None
+                log("   ({:d} samples) Completed in {:s}.".format(accumulator.rows, totalTime))
 
+            if checkpoint is not None:
+                checkpoint.remove()
             return response
-        except Exception:
-            raise
+        finally:
+            # stops the prefetching thread, also when a page fails
+            if pages is not None:
+                pages.close()
 
-    def _doPageRequest(self, url: str, filters: dict, service: str, extension: str = None):
+    def _getShardedPages(self, service: str, url: str, filters: dict, extension: str, windows: list, workers: int,
+                         reducer=None):
         """
-        Wraps the _doRequest method
-        Performs additional processing of the response for certain services
-        @param extension: Only provide for archivefiles filtering
-        Returns a tuple (jsonResponse, duration)
+        Downloads all pages of each time window with a pool of worker threads, and stitches them in time order
+        The connection pool of the ONC object is grown to the number of workers. Archive files spanning the bound of
+        two windows are listed by both, and are kept once
+        @param windows: List of (dateFrom, dateTo) strings covering the requested time range
+        @param reducer: Transformation of the pages of each window, see _getSerialPages
+        @return: Service response with concatenated data for all windows
         """
-        if service == 'archivefiles':
-            response, duration = self.parent()._doRequest(url, filters, getTime=True)
-            response = self.parent()._filterByExtension(response, extension)
-        else:
-            response, duration = self.parent()._doRequest(url, filters, getTime=True)
+        print('Downloading {:d} time windows with {:d} workers...'.format(len(windows), workers))
+        start = time()
+        progress = Progress(self.parent()._config('hooks'), 'windows', service, total=len(windows))
+
+        def download(window):
+            windowFilters = dict(filters)
+            windowFilters['dateFrom'], windowFilters['dateTo'] = window
+            # the windows already overlap their requests
+            windowResponse = self._getSerialPages(service, url, windowFilters, extension, verbose=False, prefetch=0,
+                                                  reducer=reducer)
+            progress.update()
+            return windowResponse
+
+        self.parent()._reservePool(workers)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            responses = list(executor.map(download, windows))
 
-        return response, duration
+        # the first window with data is the base the others are appended to
+        withData = [r for r in responses if self._rowCount(r, service) > 0]
+        accumulator = _PageAccumulator(service)
+        for nextResponse in withData or responses[:1]:
+            accumulator.add(nextResponse)
+        response = accumulator.result()
+        if service == 'archivefiles' and response is not None:
+            response['files'] = self._uniqueFiles(response['files'])
+
+        totalTime = _formatDuration(time() - start)
+        print("   ({:d} samples) Completed in {:s}.".format(accumulator.rows, totalTime))
+        return response
 
     @staticmethod
-    def _catenateData(response: dict, nextResponse: dict, service: str):
+    def _uniqueFiles(files: list):
         """
-        Concatenates the data results from nextResponse into response
-        Compatible with the row structure of different services
+        Returns the archive files without repeated filenames, in their order
+        The files are filenames, or dictionaries with a 'filename' (returnOptions='all')
         """
-        if service == 'scalardata':
-            keys = response['sensorData'][0]['data'].keys()
+        seen = set()
+        unique = []
+        for file in files:
+            name = file if isinstance(file, str) else file.get('filename', id(file))
+            if name not in seen:
+                seen.add(name)
+                unique.append(file)
+        return unique
 
-            for sensorData in response['sensorData']:
-                sensorCode = sensorData['sensorCode']
+    @staticmethod
+    def _timeRange(filters: dict):
+        """
+        Returns the requested time range as a tuple of datetimes (dateFrom, dateTo), or None if they are not dates
+        """
+        try:
+            return tuple(dateutil.parser.isoparse(filters[key]) for key in ('dateFrom', 'dateTo'))
+        except (KeyError, TypeError, ValueError):
+            return None
 
-                nextSensor = next(ns for ns in nextResponse['sensorData'] if ns['sensorCode'] == sensorCode)
-                for key in keys:
-                    sensorData['data'][key] += nextSensor['data'][key]
+    @staticmethod
+    def _estimateRows(rows: int, timeRange: tuple, rNext: dict):
+        """
+        Estimates the total number of rows of a multi-page request from the rows downloaded so far, assuming the
+        same data density in the time range that is left. The next page starts at rNext's dateFrom
+        @return: The estimate, or None if it is unknown
+        """
+        if rNext is None:
+            return rows
+        if timeRange is None:
+            return None
+        try:
+            nextFrom = dateutil.parser.isoparse(rNext['parameters']['dateFrom'])
+            covered = (nextFrom - timeRange[0]).total_seconds()
+            total = (timeRange[1] - timeRange[0]).total_seconds()
+        except (KeyError, TypeError, ValueError):
+            return None
+        if covered <= 0:
+            return None
+        return rows * max(total / covered, 1.)
 
-        elif service == 'rawdata':
-            for key in response['data']:
-                response['data'][key] += nextResponse['data'][key]
+    @staticmethod
+    def _timeWindows(filters: dict, count: int, align: float = None):
+        """
+        Splits the time range of the filters into count consecutive windows of the same length
+        The windows are half-open [dateFrom, dateTo), like the time range of the API
+        @param align: If not None, the windows start at multiples of align seconds since 1970, which can merge windows
+        @return: A list of (dateFrom, dateTo) ISO8601 strings, or None if dateFrom and dateTo are not both dates
+        """
+        try:
+            dateFrom, dateTo = [dateutil.parser.isoparse(filters[key]) for key in ('dateFrom', 'dateTo')]
+            if dateFrom.tzinfo is not None:
+                dateFrom = dateFrom.astimezone(timezone.utc).replace(tzinfo=None)
+            if dateTo.tzinfo is not None:
+                dateTo = dateTo.astimezone(timezone.utc).replace(tzinfo=None)
+        except (KeyError, TypeError, ValueError):
+            return None
+        if dateTo <= dateFrom:
+            return None
 
-        elif service == 'archivefiles':
-            response['files'] += nextResponse['files']
+        # split on whole milliseconds, the resolution of the API
+        totalMs = (dateTo - dateFrom) // timedelta(milliseconds=1)
+        count = max(min(count, totalMs), 1)
+        bounds = [dateFrom + timedelta(milliseconds=totalMs * i // count) for i in range(count)] + [dateTo]
+        if align:
+            epoch = datetime(1970, 1, 1)
+            alignMs = max(int(round(align * 1000)), 1)
+            inner = [epoch + timedelta(milliseconds=(b - epoch) // timedelta(milliseconds=1) // alignMs * alignMs)
+                     for b in bounds[1:-1]]
+            bounds = [bounds[0]] + sorted(set(b for b in inner if dateFrom < b < dateTo)) + [bounds[-1]]
+            count = len(bounds) - 1
+
+        def fmt(date):
+            return date.strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] + 'Z'
+
+        return [(fmt(bounds[i]), fmt(bounds[i + 1])) for i in range(count)]
+
+    def _doPageRequest(self, url: str, filters: dict, service: str, extension: str = None, page: int = 1):
+        """
+        Wraps the _doRequest method
+        Performs additional processing of the response for certain services, and emits the pageFetched event
+        @param extension: Only provide for archivefiles filtering
+        @param page:      Number of the page, for the event
+        Returns a tuple (jsonResponse, duration, bytes)
+        """
+        response, duration, httpResponse = self.parent()._doRequest(url, filters, getTime=True, getResponse=True)
+        if service == 'archivefiles':
+            response = self.parent()._filterByExtension(response, extension)
 
-    def _estimatePages(self, response: dict, service: str, responseTime: float):
+        self.parent()._emit('pageFetched', url=url, service=service, page=page,
+                            rows=self._rowCount(response, service), bytes=len(httpResponse.content),
+                            latency=duration, retries=getattr(httpResponse, 'retries', 0),
+                            rowLimit=filters.get('rowLimit'))
+        return response, duration, len(httpResponse.content)
+
+    def _estimatePages(self, response: dict, service: str, responseTime: float, rowLimit: int = None):
         """
         Estimates the number of pages this request will require, from the first page's response and its duration
         @param responseTime: request duration in seconds
+        @param rowLimit:     rowLimit of the next pages, if it differs from the first page's (see _PageSizeTuner)
         """
         # timespan covered by the data in the response
         pageTimespan = self._responseTimespan(response, service)
         if pageTimespan == 0:
             return 0
 
+        # the next pages cover a timespan proportional to their rowLimit
+        rows = self._rowCount(response, service)
+        if rowLimit and rows > 0:
+            pageTimespan = pageTimespan * rowLimit / rows
+
         # total timespan to cover
         totalBegin = dateutil.parser.parse(response['next']['parameters']['dateFrom'])
         totalEnd = dateutil.parser.parse(response['next']['parameters']['dateTo'])
         totalTimespan = totalEnd - totalBegin
 
         # handle cases of very small timeframes
-        pageSeconds = max(pageTimespan.seconds, 1)
-        totalSeconds = totalTimespan.seconds
+        pageSeconds = max(pageTimespan.total_seconds(), 0.001)
+        totalSeconds = totalTimespan.total_seconds()
 
         return math.ceil(totalSeconds / pageSeconds)
 
@@ -129,6 +439,8 @@ class _MultiPage:
         Returns the number of records in the response
         """
         if service == 'scalardata':
+            if not response['sensorData']:
+                return 0
             return len(response['sensorData'][0]['data']['sampleTimes'])
 
         elif service == 'rawdata':
@@ -143,8 +455,11 @@ class _MultiPage:
     def _responseTimespan(response, service: str):
         """
         Determines the timespan the data in the response covers
-        Returns a timedelta object
+        Returns a timedelta object, or 0 if the response has no data
         """
+        if _MultiPage._rowCount(response, service) == 0:
+            return 0
+
         # grab the first and last sample times
         if service == 'scalardata':
             first = response['sensorData'][0]['data']['sampleTimes'][0]
@@ -158,18 +473,61 @@ class _MultiPage:
                 regExp = "\d{8}T\d{6}\.\d{3}Z"
                 reFirst = re.search(regExp, response['files'][0])
                 reLast = re.search(regExp, response['files'][-1])
-                first = reFirst.group()
-                last = reLast.group()
                 if reFirst is None or reLast is None or reFirst.group() == reLast.group():
                     return 0
+                first = reFirst.group()
+                last = reLast.group()
             else:
                 first = response['files'][0]['dateFrom']
                 last = response['files'][-1]['dateFrom']
         else:
             raise ValueError(f"service must be one of ['scalardata', 'rawdata', 'archivefiles]; got {service}")
 
-        # compute the timedelta
-        # print(first, last)
-        dateFirst = dateutil.parser.parse(first)
-        dateLast = dateutil.parser.parse(last)
+        # compute the timedelta, the times of compact raw data are already datetime64
+        if isinstance(first, str):
+            dateFirst, dateLast = _parseTimestamps([first, last]).astype('datetime64[us]').tolist()
+        else:
+            dateFirst, dateLast = np.array([first, last]).astype('datetime64[us]').tolist()
         return dateLast - dateFirst
+
+
+class _PageSizeTuner:
+    """
+    Adapts the rowLimit of multi-page requests so that each page takes about a target time
+    The rows per second are measured from the pages, smoothed, and the rowLimit changes at most by a factor of
+    maxStep between pages, within the limits of the server
+    """
+
+    # largest rowLimit accepted by the services
+    maxRowLimit = 100000
+    minRowLimit = 100
+    maxStep = 2.
+    smoothing = 0.5
+
+    def __init__(self, pageLatency: float, rowLimit: int = None):
+        """
+        @param pageLatency: Target seconds per page
+        @param rowLimit:    rowLimit of the first page, None for the server default (maxRowLimit)
+        """
+        self.pageLatency = pageLatency
+        self.rowLimit = int(rowLimit) if rowLimit else self.maxRowLimit
+        self._rowsPerSecond = None
+
+    def update(self, rows: int, latency: float):
+        """
+        Accounts for a page of rows that took latency seconds
+        @return: The rowLimit for the next page
+        """
+        if rows <= 0 or latency <= 0:
+            return self.rowLimit
+
+        rate = rows / latency
+        if self._rowsPerSecond is None:
+            self._rowsPerSecond = rate
+        else:
+            self._rowsPerSecond += self.smoothing * (rate - self._rowsPerSecond)
+
+        rowLimit = self._rowsPerSecond * self.pageLatency
+        rowLimit = min(max(rowLimit, self.rowLimit / self.maxStep), self.rowLimit * self.maxStep)
+        self.rowLimit = int(min(max(rowLimit, self.minRowLimit), self.maxRowLimit))
+        return self.rowLimit
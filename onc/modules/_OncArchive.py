@@ -3,12 +3,12 @@ import threading
 import time
 
 import humanize
-import requests
 import pandas
 
 from ._MultiPage import _MultiPage
 from ._OncService import _OncService
 from ._util import saveAsFile, _printErrorMessage, _formatDuration, ShareJobThreads
+from .Progress import Progress
 
 
 class _OncArchive(_OncService):
@@ -19,26 +19,40 @@ class _OncArchive(_OncService):
     def __init__(self, parent: object):
         super().__init__(parent)
 
-    def getListByLocation(self, filters: dict = None, allPages: bool = False):
+    def getListByLocation(self, filters: dict = None, allPages: bool = False, workers: int = None):
         """
         Get a list of files for a given location code and device category code, and filtered by others optional
         parameters. If locationCode or deviceCategoryCode are missing, we suppose they are in the filters
+        With allPages, workers > 1 splits dateFrom..dateTo into windows listed by this number of threads
         """
         try:
-            return self._getList(filters, by='location', allPages=allPages)
+            return self._getList(filters, by='location', allPages=allPages, workers=workers)
         except Exception:
             raise
 
-    def getListByDevice(self, filters: dict = None, allPages: bool = False):
+    def getListByDevice(self, filters: dict = None, allPages: bool = False, workers: int = None):
         """
         Get a list of files available in Oceans 2.0 Archiving System for a given device code. The list of filenames can
         be filtered by time range. If deviceCode is missing, we suppose it is in the filters
+        With allPages, workers > 1 splits dateFrom..dateTo into windows listed by this number of threads
         """
         try:
-            return self._getList(filters, by='device', allPages=allPages)
+            return self._getList(filters, by='device', allPages=allPages, workers=workers)
         except Exception:
             raise
 
+    def iterListByLocation(self, filters: dict = None):
+        """
+        Generator version of getListByLocation with allPages, yields each page of the file list as soon as it arrives
+        """
+        return self._iterList(filters, by='location')
+
+    def iterListByDevice(self, filters: dict = None):
+        """
+        Generator version of getListByDevice with allPages, yields each page of the file list as soon as it arrives
+        """
+        return self._iterList(filters, by='device')
+
     def getFile(self, filename: str = '', overwrite: bool = False, outPath: str = None):
         url = self._serviceUrl('archivefiles')
 
@@ -51,7 +65,7 @@ class _OncArchive(_OncService):
         try:
             # Download the archived file with filename (response contents is binary)
             start = time.time()
-            response = requests.get(url, filters, timeout=self._config('timeout'))
+            response = self._sendRequest(url, filters)
             status = response.status_code
             elapsed = time.time() - start
 
@@ -61,6 +75,9 @@ class _OncArchive(_OncService):
                     outPath = self._config('outPath')
                 saveAsFile(response, outPath, filename, overwrite)
                 filePath = '{:s}/{:s}'.format(outPath, filename)
+                self._emit('fileDownloaded', url=url, service='archivefiles', file=filename, outPath=outPath,
+                           status=status, bytes=len(response.content), latency=elapsed,
+                           retries=getattr(response, 'retries', 0))
                 # self._fixGzFileExtension(filePath) # Supposedly not needed after DMAS fix
 
             else:
@@ -166,6 +183,8 @@ class _OncArchive(_OncService):
                 if download_threads is None:
                     download_threads = self._config('download_threads')
 
+                downloader.progress = Progress(self._config('hooks'), 'archiveFiles', 'archivefiles',
+                                               total=len(dataRows['files']))
                 share_job_threads = ShareJobThreads(download_threads, fmt='{filename}')
                 share_job_threads.do(downloader.download_file, dataRows['files'])
 
@@ -197,33 +216,50 @@ class _OncArchive(_OncService):
         url = self._serviceUrl('archivefiles')
         return '{:s}?method=getFile&filename={:s}&token={:s}'.format(url, filename, self._config('token'))
 
-    def _getList(self, filters: dict, by: str = 'location', allPages: bool = False):
+    def _getList(self, filters: dict, by: str = 'location', allPages: bool = False, workers: int = None):
         """
         Wraps archivefiles getListByLocation and getListByDevice methods
         """
         url = self._serviceUrl('archivefiles')
-        filters['token'] = self._config('token')
-        filters['method'] = 'getListByLocation' if by == 'location' else 'getListByDevice'
-
-        # parse and remove the artificial parameter extension
-        extension = None
-        filters2 = filters.copy()
-        if 'extension' in filters2:
-            extension = filters2['extension']
+        filters2, extension = self._listFilters(filters, by)
 
         try:
             if allPages:
                 mp = _MultiPage(self)
-                result = mp.getAllPages('archivefiles', url, filters2)
+                result = mp.getAllPages('archivefiles', url, filters2, workers=workers)
             else:
                 if 'extension' in filters2:
                     del filters2['extension']
-                result = self._doRequest(url, filters2)
+                result = self._cachedRequest('archivefiles', url, filters2)
                 result = self._filterByExtension(result, extension)
             return result
         except Exception:
             raise
 
+    def _iterList(self, filters: dict, by: str = 'location'):
+        """
+        Returns an iterator over the pages of an archivefiles list request
+        """
+        url = self._serviceUrl('archivefiles')
+        filters2 = self._listFilters(filters or {}, by)[0]
+        return _MultiPage(self).iterPages('archivefiles', url, filters2)
+
+    def _listFilters(self, filters: dict, by: str = 'location'):
+        """
+        Prepares the filters of an archivefiles list request
+        Returns a tuple (copy of the filters, extension), where the extension is the artificial filter parameter or None
+        """
+        filters['token'] = self._config('token')
+        filters['method'] = 'getListByLocation' if by == 'location' else 'getListByDevice'
+
+        # parse the artificial parameter extension
+        extension = None
+        filters2 = filters.copy()
+        if 'extension' in filters2:
+            extension = filters2['extension']
+
+        return filters2, extension
+
     @staticmethod
     def _filterByExtension(results: dict, extension: str):
         """
@@ -262,6 +298,7 @@ class _OncArchiveDownloader(_OncArchive):
     def __init__(self, parent: object, overwrite: bool = False):
         super().__init__(parent)
         self.overwrite = overwrite
+        self.progress = None
         self.tries = 1
         self.successes = 0
         self.size = 0
@@ -308,6 +345,8 @@ class _OncArchiveDownloader(_OncArchive):
                     self.time += downInfo['downloadTime']
                     self.downInfos.append(downInfo)
                     self.successes += 1
+                if self.progress is not None:
+                    self.progress.update(1, downInfo['size'])
             except Exception:
                 raise
             self.tries += 1
@@ -2,12 +2,12 @@ from datetime import timedelta
 from time import sleep, time
 
 import humanize
-import requests
 
 from ._DataProductFile import _DataProductFile
 from ._OncService import _OncService
 from ._PollLog import _PollLog
 from ._util import _printErrorMessage, _formatSize
+from .Progress import Progress
 
 
 class _OncDelivery(_OncService):
@@ -78,9 +78,11 @@ class _OncDelivery(_OncService):
         try:
             start = time()
             while status != 'complete':
-                response = requests.get(url,
-                                        {'method': 'run', 'token': self._config('token'), 'dpRequestId': dpRequestId},
-                                        timeout=self._config('timeout'))
+                requestStart = time()
+                response = self._sendRequest(url,
+                                             {'method': 'run', 'token': self._config('token'),
+                                              'dpRequestId': dpRequestId})
+                latency = time() - requestStart
                 code = response.status_code
                 runResult['requestCount'] += 1
 
@@ -93,6 +95,9 @@ class _OncDelivery(_OncService):
                 if waitComplete:
                     status = data[0]['status']
                     log.logMessage(data)
+                    self._emit('pollTick', url=url, service='dataProductDelivery', status=code, runStatus=status,
+                               poll=runResult['requestCount'], bytes=len(response.content), latency=latency,
+                               retries=getattr(response, 'retries', 0))
                     if code != 200:
                         sleep(self.pollPeriod)
                 else:
@@ -148,7 +153,9 @@ class _OncDelivery(_OncService):
         timeout = self._config('timeout')
         print('\nDownloading data product files with runId {:d}...'.format(runId))
 
-        dpf = _DataProductFile(runId, str(index), baseUrl, token)
+        dpf = _DataProductFile(runId, str(index), baseUrl, token, service=self)
+        progress = Progress(self._config('hooks'), 'productFiles', 'dataProductDelivery',
+                            total=fileCount if fileCount > 0 else None)
 
         # loop thorough file indexes
         while doLoop:
@@ -161,8 +168,9 @@ class _OncDelivery(_OncService):
             if status == 200 or status == 777:
                 # file was downloaded (200), or downloaded & skipped (777)
                 fileList.append(dpf.getInfo())
+                progress.update(1, fileList[-1]['size'])
                 index += 1
-                dpf = _DataProductFile(runId, str(index), baseUrl, token)
+                dpf = _DataProductFile(runId, str(index), baseUrl, token, service=self)
 
             elif status != 202 or (0 < fileCount <= index):
                 # no more files to download
@@ -170,7 +178,7 @@ class _OncDelivery(_OncService):
 
         # get metadata if required
         if getMetadata:
-            dpf = _DataProductFile(runId, 'meta', baseUrl, token)
+            dpf = _DataProductFile(runId, 'meta', baseUrl, token, service=self)
             try:
                 status = dpf.download(timeout, self.pollPeriod, outPath, maxRetries, overwrite)
                 if status == 200 or status == 777:
@@ -220,11 +228,14 @@ class _OncDelivery(_OncService):
 
         try:
             while status == 200 or status == 202:
-                response = requests.head(url, params=filters, timeout=self._config('timeout'))
+                requestStart = time()
+                response = self._sendRequest(url, filters, method='head')
                 status = response.status_code
 
                 if status == 202:
                     # If the file is still running, wait
+                    self._emit('pollTick', url=url, service='dataProductDelivery', status=status, poll=n + 1,
+                               bytes=0, latency=time() - requestStart, retries=getattr(response, 'retries', 0))
                     sleep(self.pollPeriod)
                 elif status == 200:
                     # count successful HEAD request
@@ -260,6 +271,14 @@ class _OncDelivery(_OncService):
         Sets a poll period adequate to the estimated processing time
         Longer processing times require longer poll periods to avoid going over maxRetries
         """
+        self.pollPeriod = self._pollPeriodFromEstimate(response, self.pollPeriod)
+
+    @staticmethod
+    def _pollPeriodFromEstimate(response, pollPeriod: float):
+        """
+        Returns a poll period [sec] adequate to the estimated processing time of a data product request response
+        Returns pollPeriod if the response has no estimate
+        """
         # Parse estimated processing time (if the API returns it, which is not the case with archived data products)
         if 'estimatedProcessingTime' in response:
             txtEstimated = response['estimatedProcessingTime']
@@ -272,10 +291,12 @@ class _OncDelivery(_OncService):
                 elif unit == 'hour':
                     factor = 3600
                 total = factor * int(parts[0])
-                self.pollPeriod = max(0.02 * total, 1.0)  # poll every 2%
+                pollPeriod = max(0.02 * total, 1.0)  # poll every 2%
 
                 # set an upper limit to pollPeriod [sec]
-                self.pollPeriod = min(self.pollPeriod, 10)
+                pollPeriod = min(pollPeriod, 10)
+
+        return pollPeriod
 
     @staticmethod
     def _printProductOrderStats(fileList: list, runInfo: dict):
@@ -12,16 +12,24 @@ class _OncDiscovery(_OncService):
 
     def _discoveryRequest(self, filters: dict, service: str, method: str = 'get'):
         url = self._serviceUrl(service)
-        filters['method'] = method
-        filters['token'] = self._config('token')
+        self._discoveryFilters(filters, method)
 
         try:
-            result = self._doRequest(url, filters)
+            result = self._cachedRequest(service, url, filters)
             self._sanitizeBooleans(result)
             return result
         except Exception:
             raise
 
+    def _discoveryFilters(self, filters: dict, method: str = 'get'):
+        """
+        Adds the method and the token to the filters of a discovery request
+        Will modify the filters dictionary, which is also returned
+        """
+        filters['method'] = method
+        filters['token'] = self._config('token')
+        return filters
+
     def getLocations(self, filters: dict):
         """Requests and returns a filtered list of locations. Wraps the "locations" API web service.
         @param filters: Filters in the API request
@@ -54,7 +62,8 @@ class _OncDiscovery(_OncService):
         filters = filters or {}
         return self._discoveryRequest(filters, service='dataProducts')
 
-    def _sanitizeBooleans(self, data: list):
+    @staticmethod
+    def _sanitizeBooleans(data: list):
         """
         For all rows in data, enforce that fields expected to have bool values have the right type
             Will modify the data array
@@ -88,4 +97,4 @@ class _OncDiscovery(_OncService):
 
                 # repeat for "children" if any
                 if 'children' in row:
-                    self._sanitizeBooleans(row["children"])
+                    _OncDiscovery._sanitizeBooleans(row["children"])
@@ -1,5 +1,17 @@
+from bisect import bisect_right
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from time import sleep, time
+
+import numpy as np
+
 from ._OncService import _OncService
 from ._MultiPage import _MultiPage
+from ._PageAccumulator import _PageAccumulator
+from ._columnar import _checkOutput, _columnsOutput, _scalarDataOutput
+from ._util import _parseTimestamps
+from .Progress import Progress
+from .RawReadings import _RawCompactor
 
 
 class _OncRealTime(_OncService):
@@ -10,57 +22,367 @@ class _OncRealTime(_OncService):
     def __init__(self, parent: object):
         super().__init__(parent)
 
-    def getDirectByLocation(self, filters: dict, allPages: bool):
+    def getDirectByLocation(self, filters: dict, allPages: bool, raw: bool = False, workers: int = None,
+                            output: str = None, reducer=None):
         """
         Method to return scalar data from the scalardata service in JSON Object format
         see https://wiki.oceannetworks.ca/display/help/scalardata+service for usage and available filters
+        @param raw: If True, returns the undecoded json bytes of a single page, to decode later with ONC.decode
+        @param workers: With allPages, splits dateFrom..dateTo into windows downloaded by this number of threads
+        @param output:  'numpy' returns the data of each sensor as arrays (sampleTimes as datetime64[ns], values as
+                        float64, qaqcFlags as int8), 'dataframe' as a pandas.DataFrame. None returns the JSON lists
+        @param reducer: DataReducer masking QAQC flags and aggregating the samples of each page as it arrives
         """
-        return self._getDirectAllPages(filters, 'scalardata', 'getByLocation', allPages)
+        return self._getDirectAllPages(filters, 'scalardata', 'getByLocation', allPages, raw, workers, output, reducer)
 
-    def getDirectByDevice(self, filters: dict, allPages: bool):
+    def getDirectByDevice(self, filters: dict, allPages: bool, raw: bool = False, workers: int = None,
+                          output: str = None, reducer=None):
         """
         Method to return scalar data from the scalardata service
         see https://wiki.oceannetworks.ca/display/help/scalardata+service for usage and available filters
+        @param raw: If True, returns the undecoded json bytes of a single page, to decode later with ONC.decode
+        @param workers: With allPages, splits dateFrom..dateTo into windows downloaded by this number of threads
+        @param output:  'numpy' returns the data of each sensor as arrays (sampleTimes as datetime64[ns], values as
+                        float64, qaqcFlags as int8), 'dataframe' as a pandas.DataFrame. None returns the JSON lists
+        @param reducer: DataReducer masking QAQC flags and aggregating the samples of each page as it arrives
         """
-        return self._getDirectAllPages(filters, 'scalardata', 'getByDevice', allPages)
+        return self._getDirectAllPages(filters, 'scalardata', 'getByDevice', allPages, raw, workers, output, reducer)
 
-    def getDirectRawByLocation(self, filters: dict, allPages: bool):
+    def getDirectRawByLocation(self, filters: dict, allPages: bool, raw: bool = False, workers: int = None,
+                               output: str = None):
         """
         Method to return raw data from an instrument, in the payload, in JSON format from the rawdata service
         see https://wiki.oceannetworks.ca/display/help/rawdata+service for usage and available filters
+        @param raw: If True, returns the undecoded json bytes of a single page, to decode later with ONC.decode
+        @param workers: With allPages, splits dateFrom..dateTo into windows downloaded by this number of threads
+        @param output:  'compact' returns the data as RawReadings (readings in one bytes buffer, times as int64), each
+                        page is converted as it arrives. None returns the JSON lists
         """
-        return self._getDirectAllPages(filters, 'rawdata', 'getByLocation', allPages)
+        return self._getDirectAllPages(filters, 'rawdata', 'getByLocation', allPages, raw, workers, output)
 
-    def getDirectRawByDevice(self, filters: dict, allPages: bool):
+    def getDirectRawByDevice(self, filters: dict, allPages: bool, raw: bool = False, workers: int = None,
+                             output: str = None):
         """
         Method to return raw data from an instrument, in the payload, in JSON format from the rawdata service
         see https://wiki.oceannetworks.ca/display/help/rawdata+service for usage and available filters
+        @param raw: If True, returns the undecoded json bytes of a single page, to decode later with ONC.decode
+        @param workers: With allPages, splits dateFrom..dateTo into windows downloaded by this number of threads
+        @param output:  'compact' returns the data as RawReadings (readings in one bytes buffer, times as int64), each
+                        page is converted as it arrives. None returns the JSON lists
+        """
+        return self._getDirectAllPages(filters, 'rawdata', 'getByDevice', allPages, raw, workers, output)
+
+    def getDirectByLocations(self, locationCodes: list, filters: dict, allPages: bool = False, output: str = None,
+                             download_threads: int = None, raiseErrors: bool = True):
+        """
+        Method to return the scalar data of several locations at once, see getDirectByLocation and _getDirectMany
+        @param locationCodes: List of location codes, the filters hold the common deviceCategoryCode, dates, etc.
+        """
+        return self._getDirectMany(locationCodes, 'locationCode', filters, 'getByLocation', allPages, output,
+                                   download_threads, raiseErrors)
+
+    def getDirectByDevices(self, deviceCodes: list, filters: dict, allPages: bool = False, output: str = None,
+                           download_threads: int = None, raiseErrors: bool = True):
+        """
+        Method to return the scalar data of several devices at once, see getDirectByDevice and _getDirectMany
+        @param deviceCodes: List of device codes, the filters hold the common dates, sensorCategoryCodes, etc.
+        """
+        return self._getDirectMany(deviceCodes, 'deviceCode', filters, 'getByDevice', allPages, output,
+                                   download_threads, raiseErrors)
+
+    def _getDirectMany(self, codes: list, codeFilter: str, filters: dict, method: str, allPages: bool = False,
+                       output: str = None, download_threads: int = None, raiseErrors: bool = True):
+        """
+        Requests the scalar data of each code with a pool of threads, which share the connection pool of the ONC
+        object (grown to the number of threads if it is smaller). Finished codes are counted by progress events (task
+        'devices' or 'locations')
+        @param codeFilter:       Filter name of the codes, 'deviceCode' or 'locationCode'
+        @param download_threads: Number of codes requested at the same time, defaults to the download_threads of the
+                                 ONC object
+        @param raiseErrors:      If False, the exception of a failed code is returned as its result instead of raised
+        @return:                 Dictionary {code: response}, in the order of codes
+        """
+        _checkOutput(output)
+        if download_threads is None:
+            download_threads = self._config('download_threads')
+        codes = list(dict.fromkeys(codes))
+        task = 'devices' if codeFilter == 'deviceCode' else 'locations'
+        progress = Progress(self._config('hooks'), task, 'scalardata', total=len(codes))
+
+        def download(code):
+            codeFilters = dict(filters or {})
+            codeFilters[codeFilter] = code
+            try:
+                return self._getDirectAllPages(codeFilters, 'scalardata', method, allPages, output=output)
+            except Exception as error:
+                if raiseErrors:
+                    raise
+                return error
+            finally:
+                progress.update()
+
+        self._reservePool(download_threads)
+        with ThreadPoolExecutor(max_workers=max(download_threads, 1)) as executor:
+            results = list(executor.map(download, codes))
+        return dict(zip(codes, results))
+
+    def iterDirectByLocation(self, filters: dict):
+        """
+        Generator version of getDirectByLocation with allPages, yields each page of scalar data as soon as it arrives
+        """
+        return self._iterDirectPages(filters, 'scalardata', 'getByLocation')
+
+    def iterDirectByDevice(self, filters: dict):
+        """
+        Generator version of getDirectByDevice with allPages, yields each page of scalar data as soon as it arrives
+        """
+        return self._iterDirectPages(filters, 'scalardata', 'getByDevice')
+
+    def iterDirectRawByLocation(self, filters: dict):
+        """
+        Generator version of getDirectRawByLocation with allPages, yields each page of raw data as soon as it arrives
         """
-        return self._getDirectAllPages(filters, 'rawdata', 'getByDevice', allPages)
+        return self._iterDirectPages(filters, 'rawdata', 'getByLocation')
 
-    def _getDirectAllPages(self, filters: dict, service: str, method: str, allPages: bool):
+    def iterDirectRawByDevice(self, filters: dict):
+        """
+        Generator version of getDirectRawByDevice with allPages, yields each page of raw data as soon as it arrives
+        """
+        return self._iterDirectPages(filters, 'rawdata', 'getByDevice')
+
+    def followDirectByLocation(self, filters: dict, pollInterval: float = 60, maxInterval: float = None):
+        """
+        Generator following the scalar data of a location as it arrives, see _followDirect
+        """
+        return self._followDirect(filters, 'scalardata', 'getByLocation', pollInterval, maxInterval)
+
+    def followDirectByDevice(self, filters: dict, pollInterval: float = 60, maxInterval: float = None):
+        """
+        Generator following the scalar data of a device as it arrives, see _followDirect
+        """
+        return self._followDirect(filters, 'scalardata', 'getByDevice', pollInterval, maxInterval)
+
+    def followDirectRawByLocation(self, filters: dict, pollInterval: float = 60, maxInterval: float = None):
+        """
+        Generator following the raw data of a location as it arrives, see _followDirect
+        """
+        return self._followDirect(filters, 'rawdata', 'getByLocation', pollInterval, maxInterval)
+
+    def followDirectRawByDevice(self, filters: dict, pollInterval: float = 60, maxInterval: float = None):
+        """
+        Generator following the raw data of a device as it arrives, see _followDirect
+        """
+        return self._followDirect(filters, 'rawdata', 'getByDevice', pollInterval, maxInterval)
+
+    def _followDirect(self, filters: dict, service: str, method: str, pollInterval: float = 60,
+                      maxInterval: float = None):
+        """
+        Polls the scalar or raw data from the last received sample time to now, and yields the responses with new
+        samples only. Each request starts at the oldest of the last sample times of the sensors, so that a sensor
+        reporting late still gets its samples; the samples already yielded, returned again by the service, are dropped.
+        A sensor whose last sample is more than maxInterval seconds older than the newest sample of all sensors is
+        considered stalled, and no longer holds the requests back: samples it reports later than that are missed.
+        The first request starts at the dateFrom of the filters, or pollInterval seconds ago. The generator doesn't
+        end, the caller stops it by leaving the loop.
+        The poll interval starts at pollInterval seconds, doubles after each poll without new samples up to
+        maxInterval (default 10 * pollInterval), and goes back to pollInterval when samples arrive.
+        The series cache of the ONC object isn't used, the time ranges of the polls are too short to be worth caching.
+        Each poll emits a pollTick event with the fields url, service, poll, rows and interval.
+        @return: Iterator over responses with the structure of getDirectByDevice with allPages
+        """
+        if maxInterval is None:
+            maxInterval = 10 * pollInterval
+        filters = dict(filters or {})
+        filters.pop('dateTo', None)
+        if 'dateFrom' not in filters:
+            filters['dateFrom'] = self._formatTime(datetime.utcnow() - timedelta(seconds=pollInterval))
+
+        url = self._serviceUrl(service)
+        lastTimes = {}
+        interval = pollInterval
+        poll = 0
+        while True:
+            poll += 1
+            start = time()
+            filters['dateTo'] = self._formatTime(datetime.utcnow())
+            response = self._getDirectAllPages(dict(filters), service, method, allPages=True, seriesCache=False)
+            rows = self._dropSeenSamples(response, service, lastTimes)
+
+            if rows > 0:
+                # the next request starts at the last sample of the slowest sensor, the seen samples are dropped then
+                filters['dateFrom'] = self._followCursor(lastTimes, maxInterval)
+                interval = pollInterval
+            else:
+                interval = min(interval * 2, maxInterval)
+
+            self._emit('pollTick', url=url, service=service, poll=poll, rows=rows, interval=interval)
+            if rows > 0:
+                yield response
+            sleep(max(interval - (time() - start), 0))
+
+    @staticmethod
+    def _followCursor(lastTimes: dict, maxInterval: float):
+        """
+        Returns the dateFrom of the next poll of _followDirect: the oldest of the last sample times, leaving out the
+        sensors stalled for more than maxInterval seconds behind the newest sample
+        @param lastTimes: {sensorCode: sample time}, see _dropSeenSamples
+        """
+        times = sorted(lastTimes.values())
+        newest = _parseTimestamps(times[-1:])[0]
+        stalledBefore = newest - np.timedelta64(int(maxInterval * 1000), 'ms')
+        active = _parseTimestamps(times) >= stalledBefore
+        return times[int(np.argmax(active))]
+
+    @staticmethod
+    def _dropSeenSamples(response: dict, service: str, lastTimes: dict):
+        """
+        Removes the samples at or before the last sample times of previous responses, in place, and updates
+        lastTimes with the newest sample times of the response
+        @param lastTimes: {sensorCode: sample time} for scalar data, {'times': sample time} for raw data
+        @return:          The number of new samples, of the sensor with most new samples for scalar data
+        """
+        if service == 'scalardata':
+            sensors = [(sensorData['sensorCode'], sensorData['data']) for sensorData in response['sensorData'] or []]
+            timesKey = 'sampleTimes'
+        else:
+            sensors = [('times', response['data'])]
+            timesKey = 'times'
+
+        rows = 0
+        for code, data in sensors:
+            times = data[timesKey]
+            if code in lastTimes:
+                first = bisect_right(times, lastTimes[code])
+                if first > 0:
+                    for key in data:
+                        data[key] = data[key][first:]
+            if data[timesKey]:
+                lastTimes[code] = data[timesKey][-1]
+            rows = max(rows, len(data[timesKey]))
+        return rows
+
+    @staticmethod
+    def _formatTime(date: datetime):
+        """
+        Returns a naive UTC datetime in the format of the API, 2020-01-31T23:59:59.999Z
+        """
+        return date.strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] + 'Z'
+
+    def _iterDirectPages(self, filters: dict, service: str, method: str):
+        """
+        Returns an iterator over the scalar or raw data pages, each page has the structure of a single page response
+        """
+        url = self._serviceUrl(service)
+        filters = self._directFilters(filters, method)
+        return _MultiPage(self).iterPages(service, url, filters)
+
+    def _getDirectAllPages(self, filters: dict, service: str, method: str, allPages: bool, raw: bool = False,
+                           workers: int = None, output: str = None, reducer=None, seriesCache: bool = True):
         """
         Keeps downloading all scalar or raw data pages until finished
         Automatically translates sensorCategoryCodes to a string if a list is provided
-        Return the full stitched data
+        Return the full stitched data, with the scalar data reduced by the reducer (see DataReducer) and converted to
+        the output format (see _scalarDataOutput), and the raw data as RawReadings if output is 'compact'
+        @param seriesCache: If False, the series cache of the ONC object isn't used
         """
+        if raw and allPages:
+            raise ValueError('raw responses are only available for single pages (allPages=False)')
+        if raw and reducer is not None:
+            raise ValueError('raw responses can not be reduced')
+        if service == 'rawdata':
+            if output not in (None, 'json', 'compact'):
+                raise ValueError(f"output must be one of ['json', 'compact']; got {output}")
+            if output == 'compact':
+                reducer = _RawCompactor()
+        else:
+            _checkOutput(output)
+        if raw and output not in (None, 'json'):
+            raise ValueError('raw responses can not be converted to the output {:s}'.format(output))
+
         # prepare filters for first page request
-        filters = filters or {}
         url = self._serviceUrl(service)
-        filters['method'] = method
-        filters['token'] = self._config('token')
-        dataKey = 'sensorData' if service == 'scalardata' else 'data'
-
-        # if sensorCategoryCodes is an array, join it into a comma-separated string
-        if 'sensorCategoryCodes' in filters and isinstance(filters['sensorCategoryCodes'], list):
-            filters['sensorCategoryCodes'] = ",".join(filters['sensorCategoryCodes'])
+        filters = self._directFilters(filters, method)
 
         try:
+            if allPages and seriesCache and method == 'getByDevice' and output in ('numpy', 'dataframe') and \
+                    self._config('series_cache') is not None:
+                result = self._getCachedSeries(url, filters, workers, output, reducer)
+                if result is not None:
+                    return result
+
             if allPages:
                 mp = _MultiPage(self)
-                result = mp.getAllPages(service, url, filters)
+                result = mp.getAllPages(service, url, filters, workers=workers, reducer=reducer)
             else:
-                result = self._doRequest(url, filters)
+                result = self._doRequest(url, filters, raw=raw)
+                if reducer is not None and service == 'scalardata':
+                    result = reducer.reduce(result)
+                elif reducer is not None:
+                    reducer.reducePage(result)
+            if service == 'scalardata':
+                result = _scalarDataOutput(result, output)
             return result
         except Exception:
             raise
+
+    def _getCachedSeries(self, url: str, filters: dict, workers: int = None, output: str = None, reducer=None):
+        """
+        Downloads the time ranges of a scalardata getByDevice request missing in the series cache of the ONC object,
+        and returns the result from the cache (see SeriesCache)
+        Only used for the numpy and dataframe outputs, which are typed like the cached columns. If a time range can't
+        be cached (values that aren't numbers), the result is assembled from the downloaded and cached time ranges
+        @return: The response in the output format, or None if the request has no dates
+        """
+        cache = self._config('series_cache')
+        try:
+            dateFrom, dateTo = _parseTimestamps([filters['dateFrom'], filters['dateTo']])
+        except (KeyError, TypeError, ValueError, OverflowError):
+            return None
+        if dateTo <= dateFrom:
+            return None
+
+        gaps = cache.gaps(filters, dateFrom, dateTo)
+        downloads = []
+        for gapFrom, gapTo in gaps:
+            gapFilters = dict(filters)
+            gapFilters['dateFrom'] = self._formatTime(gapFrom.astype('datetime64[ms]').tolist())
+            gapFilters['dateTo'] = self._formatTime(gapTo.astype('datetime64[ms]').tolist())
+            self._log('Downloading {:s} to {:s}, missing in the series cache'.format(
+                gapFilters['dateFrom'], gapFilters['dateTo']))
+            response = _MultiPage(self).getAllPages('scalardata', url, gapFilters, workers=workers)
+            downloads.append(None if cache.store(filters, response, gapFrom, gapTo) else response)
+
+        if all(response is None for response in downloads):
+            result = cache.load(filters, dateFrom, dateTo)
+            if reducer is None:
+                return _columnsOutput(result, output)
+            result = _columnsOutput(result)
+        else:
+            # the downloads that couldn't be cached fill their gaps, the rest of the time range comes from the cache
+            accumulator = _PageAccumulator('scalardata')
+            bounds = [dateFrom] + [date for gap in gaps for date in gap] + [dateTo]
+            for i in range(len(bounds) - 1):
+                if i % 2 == 1 and downloads[i // 2] is not None:
+                    accumulator.add(downloads[i // 2])
+                elif bounds[i] < bounds[i + 1]:
+                    accumulator.add(_columnsOutput(cache.load(filters, bounds[i], bounds[i + 1])))
+            result = accumulator.result()
+        if reducer is not None:
+            result = reducer.reduce(result)
+        return _scalarDataOutput(result, output)
+
+    def _directFilters(self, filters: dict, method: str):
+        """
+        Prepares the filters of a scalardata or rawdata request
+        Translates sensorCategoryCodes to a comma-separated string if a list is provided
+        Will modify the filters dictionary, which is also returned
+        """
+        filters = filters or {}
+        filters['method'] = method
+        filters['token'] = self._config('token')
+
+        # if sensorCategoryCodes is an array, join it into a comma-separated string
+        if 'sensorCategoryCodes' in filters and isinstance(filters['sensorCategoryCodes'], list):
+            filters['sensorCategoryCodes'] = ",".join(filters['sensorCategoryCodes'])
+
+        return filters
@@ -1,8 +1,8 @@
+import copy
 import requests
-from urllib import parse
 import weakref
-from time import time
-from ._util import _printErrorMessage, _messageForError, _formatDuration
+from time import time, sleep
+from ._util import _printErrorMessage, _messageForError, _formatDuration, _growSession
 
 
 class _OncService:
@@ -16,11 +16,19 @@ class _OncService:
         else:
             self.parent = weakref.ref(parent)
 
-    def _doRequest(self, url: str, filters: dict = None, getTime=False):
+    def _doRequest(self, url: str, filters: dict = None, getTime=False, headers: dict = None, getResponse=False,
+                   raw=False):
         """
         Generic request wrapper for making simple web service requests
-        @param url:    String full url to request
+        Identical requests (same url, filters and headers) running at the same time in other threads are sent only
+        once, and their response is shared
+        @param url:         String full url to request
+        @param headers:     Additional HTTP headers, i.e. for conditional requests
+        @param getResponse: If True, the requests.Response is returned as well
+        @param raw:         If True, the undecoded json bytes are returned instead of the json response
         @return:       if getTime is True: A tuple (jsonResponse, responseTime), otherwise just jsonResult
+                       if getResponse is True, the response is appended to the tuple: (jsonResponse, [responseTime,]
+                       response). jsonResponse is None if the server responded 304 Not Modified
         @throws:       Exception if the HTTP request fails with status 400, as a tuple with
                        the error description and the error JSON structure returned
                        by the API, or a generic exception otherwise
@@ -30,44 +38,192 @@ class _OncService:
         timeout = self._config('timeout')
 
         try:
-            txtParams = parse.unquote(parse.urlencode(filters))
-            self._log('Requesting URL:\n{:s}?{:s}'.format(url, txtParams))
-
-            start = time()
-            response = requests.get(url, filters, timeout=timeout)
-            responseTime = time() - start
-
-            if response.ok:
-                jsonResult = response.json()
-            else:
-                status = response.status_code
-                if status == 400:
-                    _printErrorMessage(response)
-                    raise Exception('The request failed with HTTP status {:d}.'.format(status), response.json())
-                elif status == 401:
-                    print('ERROR: Invalid user token.')
-                    raise Exception('Invalid user token (status 401).', response.json())
-                elif status == 503:
-                    print(
-                        'ERROR 503: Service unavailable. We could be down for maintenance; '
-                        'visit data.oceannetworks.ca for more information.')
-                    raise Exception('Service unavailable (status 503)')
-                else:
-                    raise Exception('The request failed with HTTP status {:d}.'.format(status),
-                                    _messageForError(status))
-
-            self._log('Web Service response time: {:s}'.format(_formatDuration(responseTime)))
+            key = self._requestKey(url, filters, headers) + (raw,)
+            (jsonResult, responseTime, response), shared = self._config('inflight').do(
+                key, lambda: self._fetchJson(url, filters, headers, raw), share=self._shareResult)
+            if shared:
+                self._log('Shared the response of an identical request in flight')
 
         except requests.exceptions.Timeout:
             raise Exception('The request ran out of time (timeout: {:d} s)'.format(timeout)) from None
         except Exception:
             raise
 
+        if getResponse:
+            return (jsonResult, responseTime, response) if getTime else (jsonResult, response)
         if getTime:
             return jsonResult, responseTime
         else:
             return jsonResult
 
+    def _fetchJson(self, url: str, filters: dict, headers: dict = None, raw=False):
+        """
+        Sends the request and decodes its json content with the json decoder of the parent ONC object
+        @param raw: If True, the content is returned undecoded (bytes)
+        @return:    A tuple (jsonResponse, responseTime, response), jsonResponse is None for status 304
+        """
+        start = time()
+        response = self._sendRequest(url, filters, headers=headers)
+        responseTime = time() - start
+
+        self._raiseForStatus(response)
+        if response.status_code == 304:
+            jsonResult = None
+        elif raw:
+            jsonResult = response.content
+        else:
+            jsonResult = self._config('json_decoder')(response.content)
+        return jsonResult, responseTime, response
+
+    @staticmethod
+    def _shareResult(result: tuple):
+        """
+        Returns the result of _fetchJson for another caller, with its own copy of the json response
+        """
+        jsonResult, responseTime, response = result
+        return copy.deepcopy(jsonResult), responseTime, response
+
+    @staticmethod
+    def _requestKey(url: str, filters: dict, headers: dict = None):
+        """
+        Returns a hashable key identifying a request by its url, normalized filters and headers
+        """
+        params = tuple(sorted((str(k), str(v)) for k, v in filters.items()))
+        headers = tuple(sorted(headers.items())) if headers else ()
+        return url, params, headers
+
+    def _cachedRequest(self, service: str, url: str, filters: dict):
+        """
+        Wraps _doRequest with the response cache of the parent ONC object, if it has one
+        An expired response is revalidated with a conditional request (If-None-Match / If-Modified-Since),
+        and only downloaded again if it changed
+        @param service: Name of the service, used for the cache key and its time to live
+        @return:        The json response, from the cache if available
+        """
+        cache = self._config('cache')
+        if cache is None:
+            return self._doRequest(url, filters)
+
+        result = cache.get(service, filters)
+        if result is not None:
+            return result
+
+        headers = self._conditionalHeaders(cache.validators(service, filters))
+        result, response = self._doRequest(url, filters, headers=headers, getResponse=True)
+        if response.status_code == 304:
+            result = cache.refresh(service, filters)
+            if result is not None:
+                self._log('Cached response is still valid (status 304)')
+                return result
+            # the entry was dropped in the meantime
+            result, response = self._doRequest(url, filters, getResponse=True)
+
+        cache.set(service, filters, result, self._responseValidators(response))
+        return result
+
+    @staticmethod
+    def _conditionalHeaders(validators: dict):
+        """
+        Returns the headers of a conditional request for the validators of a cached response, or None
+        """
+        if not validators:
+            return None
+        headers = {}
+        if validators.get('etag'):
+            headers['If-None-Match'] = validators['etag']
+        if validators.get('lastModified'):
+            headers['If-Modified-Since'] = validators['lastModified']
+        return headers or None
+
+    @staticmethod
+    def _responseValidators(response):
+        """
+        Returns the validators (ETag, Last-Modified) of a response as a dictionary, which can be empty
+        """
+        validators = {}
+        if response.headers.get('ETag'):
+            validators['etag'] = response.headers['ETag']
+        if response.headers.get('Last-Modified'):
+            validators['lastModified'] = response.headers['Last-Modified']
+        return validators
+
+    @staticmethod
+    def _raiseForStatus(response):
+        """
+        Prints and raises the error of a web service response that is not ok, does nothing otherwise
+        @param response: A requests.Response, or an object with the same attributes
+        """
+        if response.ok:
+            return
+
+        status = response.status_code
+        if status == 400:
+            _printErrorMessage(response)
+            raise Exception('The request failed with HTTP status {:d}.'.format(status), response.json())
+        elif status == 401:
+            print('ERROR: Invalid user token.')
+            raise Exception('Invalid user token (status 401).', response.json())
+        elif status == 503:
+            print(
+                'ERROR 503: Service unavailable. We could be down for maintenance; '
+                'visit data.oceannetworks.ca for more information.')
+            raise Exception('Service unavailable (status 503)')
+        else:
+            raise Exception('The request failed with HTTP status {:d}.'.format(status),
+                            _messageForError(status))
+
+    def _sendRequest(self, url: str, params: dict = None, method: str = 'get', timeout: int = None,
+                     headers: dict = None):
+        """
+        Sends an HTTP request through the keep-alive session shared by all services of the parent ONC object
+        Transient failures are sent again as defined by the retry policy of the parent ONC object
+        Every attempt and the downloaded bytes pass through the rate limiter of the parent ONC object, if it has one
+        Emits the requestStart and responseEnd events
+        @param method:  HTTP method, i.e. 'get' or 'head'
+        @param timeout: Seconds to wait for the server, defaults to the ONC timeout
+        @param headers: Additional HTTP headers
+        @return:        The requests.Response object of the last attempt, with the number of repeated attempts set as
+                        response.retries
+        @throws:        requests.exceptions.Timeout or ConnectionError if the last attempt failed with it
+        """
+        if timeout is None:
+            timeout = self._config('timeout')
+        session = self._config('session')
+        policy = self._config('retry_policy')
+        limiter = self._config('rate_limiter')
+
+        event = {'url': url, 'params': self._eventParams(params), 'service': self._serviceName(url), 'method': method}
+        self._emit('requestStart', **event)
+        start = time()
+
+        attempt = 1
+        while True:
+            try:
+                if limiter is not None:
+                    limiter.acquireRequest()
+                response = session.request(method, url, params=params, timeout=timeout, headers=headers)
+                if limiter is not None:
+                    limiter.consumeBytes(len(response.content))
+            except (requests.exceptions.Timeout, requests.exceptions.ConnectionError) as error:
+                if not policy.shouldRetry(attempt, error=error):
+                    self._emit('responseEnd', status=None, bytes=0, latency=time() - start, retries=attempt - 1,
+                               error=error, **event)
+                    raise
+                reason = type(error).__name__
+                delay = policy.delay(attempt)
+            else:
+                if not policy.shouldRetry(attempt, response=response):
+                    response.retries = attempt - 1
+                    self._emit('responseEnd', status=response.status_code, bytes=len(response.content),
+                               latency=time() - start, retries=response.retries, error=None, **event)
+                    return response
+                reason = 'HTTP status {:d}'.format(response.status_code)
+                delay = policy.delay(attempt, response)
+
+            self._log('Attempt {:d} failed ({:s}), retrying in {:s}'.format(attempt, reason, _formatDuration(delay)))
+            sleep(delay)
+            attempt += 1
+
     def _serviceUrl(self, service: str):
         """
         Returns the absolute url for a given ONC API service
@@ -78,6 +234,28 @@ class _OncService:
 
         return ''
 
+    @staticmethod
+    def _serviceName(url: str):
+        """
+        Returns the name of the API service of an url, i.e. 'scalardata' or 'dataProductDelivery'
+        """
+        return url.split('?')[0].rstrip('/').rsplit('/', 1)[-1]
+
+    @staticmethod
+    def _eventParams(params: dict):
+        """
+        Returns a copy of the request parameters without the token, to be passed to event callbacks
+        """
+        if params is None:
+            return {}
+        return {k: v for k, v in params.items() if k != 'token'}
+
+    def _emit(self, event: str, **fields):
+        """
+        Emits an event on the event hooks of the parent ONC object, see EventHooks
+        """
+        self._config('hooks').emit(event, **fields)
+
     def _log(self, message: str):
         """
         Prints message to console only when self.showInfo is true
@@ -86,6 +264,14 @@ class _OncService:
         if self._config('showInfo'):
             print(message)
 
+    def _reservePool(self, connections: int):
+        """
+        Grows the connection pool of the ONC object to at least connections, before starting as many threads
+        """
+        parent = self.parent()
+        if connections > parent.pool_size:
+            parent.pool_size = _growSession(parent.session, connections) or parent.pool_size
+
     def _config(self, key: str):
         """
         Returns a property from the parent (ONC class)
@@ -0,0 +1,84 @@
+from itertools import chain
+
+from .RawReadings import RawReadings
+
+
+class _PageAccumulator:
+    """
+    Collects the pages of a multi-page download (scalardata, rawdata, archivefiles) as chunks, and concatenates them
+    once when the download is complete
+    Scalar data chunks are kept per sensor, indexed by sensorCode, so adding a page doesn't depend on the number of
+    sensors already collected. Compact raw data pages (see RawReadings) are concatenated as RawReadings
+    """
+
+    def __init__(self, service: str):
+        self.service = service
+        self.rows = 0
+        self._response = None
+        self._sensors = {}
+        self._chunks = {}
+
+    def add(self, response: dict):
+        """
+        Adds the data of a page response. The first page provides the metadata of the result
+        """
+        if self._response is None:
+            self._response = response
+
+        if self.service == 'scalardata':
+            for sensorData in response['sensorData'] or []:
+                code = sensorData['sensorCode']
+                if code not in self._sensors:
+                    # sensors without data in the previous pages are appended
+                    self._sensors[code] = (sensorData, {key: [] for key in sensorData['data']})
+                chunks = self._sensors[code][1]
+                for key in chunks:
+                    chunks[key].append(sensorData['data'][key])
+            if response['sensorData']:
+                self.rows += len(response['sensorData'][0]['data']['sampleTimes'])
+
+        elif self.service == 'rawdata':
+            if isinstance(response['data'], RawReadings):
+                self._chunks.setdefault('data', []).append(response['data'])
+            else:
+                for key in response['data']:
+                    self._chunks.setdefault(key, []).append(response['data'][key])
+            self.rows += len(response['data']['times'])
+
+        elif self.service == 'archivefiles':
+            self._chunks.setdefault('files', []).append(response['files'])
+            self.rows += len(response['files'])
+
+    def result(self):
+        """
+        Returns the response of the first page with the concatenated data of all pages, and 'next' set to None
+        """
+        response = self._response
+        if response is None:
+            return None
+
+        if self.service == 'scalardata':
+            if self._sensors:
+                for sensorData, chunks in self._sensors.values():
+                    for key in chunks:
+                        sensorData['data'][key] = self._concatenate(chunks[key])
+                response['sensorData'] = [sensorData for sensorData, chunks in self._sensors.values()]
+
+        elif self.service == 'rawdata':
+            if isinstance(response['data'], RawReadings):
+                response['data'] = RawReadings.concatenate(self._chunks['data'])
+            else:
+                for key in self._chunks:
+                    response['data'][key] = self._concatenate(self._chunks[key])
+
+        elif self.service == 'archivefiles':
+            response['files'] = self._concatenate(self._chunks['files'])
+
+        response['next'] = None
+        return response
+
+    @staticmethod
+    def _concatenate(chunks: list):
+        if len(chunks) == 1:
+            return chunks[0]
+        return list(chain.from_iterable(chunks))
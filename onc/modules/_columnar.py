@@ -0,0 +1,104 @@
+import numpy as np
+import pandas
+
+from ._util import _parseTimestamps
+
+# output formats of the scalardata methods
+outputs = ('json', 'numpy', 'dataframe')
+
+
+def _checkOutput(output: str):
+    """
+    Raises a ValueError if output is not one of the output formats (None is the same as 'json')
+    """
+    if output is not None and output not in outputs:
+        raise ValueError(f'output must be one of {list(outputs)}; got {output}')
+
+
+def _scalarDataOutput(response: dict, output: str = None):
+    """
+    Converts the data of each sensor of a scalardata response to typed columns, in place
+    @param output: 'numpy' replaces sensorData[i]['data'] with a dictionary of arrays: sampleTimes as datetime64[ns],
+                   values as float64 and qaqcFlags as int8. 'dataframe' replaces it with a pandas.DataFrame of the same
+                   columns. None or 'json' leaves the response unchanged
+    @return:       The response
+    """
+    _checkOutput(output)
+    if output is None or output == 'json' or not response.get('sensorData'):
+        return response
+
+    for sensorData in response['sensorData']:
+        columns = _sensorColumns(sensorData['data'])
+        if output == 'dataframe':
+            columns = pandas.DataFrame(columns)
+        sensorData['data'] = columns
+    return response
+
+
+def _sensorColumns(data: dict):
+    """
+    Returns the data of a sensor (sampleTimes, values, qaqcFlags) as a dictionary of typed numpy arrays
+    """
+    columns = {}
+    for key, column in data.items():
+        if key == 'sampleTimes':
+            columns[key] = _timesArray(column)
+        elif key == 'qaqcFlags':
+            columns[key] = _flagsArray(column)
+        else:
+            columns[key] = _valuesArray(column)
+    return columns
+
+
+def _timesArray(times: list):
+    """
+    Returns ISO8601 UTC timestamps as a datetime64[ns] array
+    """
+    return _parseTimestamps(times)
+
+
+def _valuesArray(values: list):
+    """
+    Returns the values as a float64 array, missing values (None) are NaN
+    Values that aren't numbers are kept in an object array
+    """
+    try:
+        return np.array(values, dtype=np.float64)
+    except (TypeError, ValueError):
+        return np.array(values, dtype=object)
+
+
+def _flagsArray(flags: list):
+    """
+    Returns the QAQC flags as an int8 array, missing flags (None) are 0 (no quality control)
+    """
+    try:
+        return np.array(flags, dtype=np.int8)
+    except TypeError:
+        return np.array([0 if flag is None else flag for flag in flags], dtype=np.int8)
+
+
+def _columnsOutput(response: dict, output: str = None):
+    """
+    Converts a scalardata response holding numpy columns (see _sensorColumns) to the output format, in place
+    @param output: 'numpy' leaves the columns, 'dataframe' makes a pandas.DataFrame of them, None or 'json' converts
+                   them to the lists of the JSON response, with the sample times as ISO8601 strings
+    @return:       The response
+    """
+    _checkOutput(output)
+    if output == 'numpy' or not response.get('sensorData'):
+        return response
+
+    for sensorData in response['sensorData']:
+        columns = sensorData['data']
+        if output == 'dataframe':
+            sensorData['data'] = pandas.DataFrame(columns)
+        else:
+            sensorData['data'] = {key: _columnList(key, column) for key, column in columns.items()}
+    return response
+
+
+def _columnList(key: str, column: np.ndarray):
+    if key == 'sampleTimes':
+        return [t + 'Z' for t in np.datetime_as_string(column, unit='ms').tolist()]
+    return column.tolist()
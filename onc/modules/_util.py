@@ -1,14 +1,221 @@
+import hashlib
+import json
 import os
 import sys
 import threading
 import time
 
+import dateutil.parser
 import humanize
-from datetime import timedelta
+import numpy as np
+import requests
+from contextlib import contextmanager
+from datetime import timedelta, timezone
+from requests.adapters import HTTPAdapter
 
 from tqdm import tqdm
 
 
+def _createSession(poolSize: int):
+    """
+    Returns a requests.Session that keeps up to poolSize connections per host alive
+    The session is shared by all service objects and download threads of an ONC instance
+    @param poolSize: {int} Maximum number of pooled connections per host
+    """
+    poolSize = max(int(poolSize), 1)
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=poolSize, pool_maxsize=poolSize)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def _hashKey(key: str):
+    """
+    Returns the file name of a cache or checkpoint key, the sha1 hex digest of the key
+    """
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+
+def _writeAtomic(path: str, write, suffix: str = '.tmp'):
+    """
+    Writes a file with write(tmpPath) to a temporary file first, then moves it to path, so that other threads and
+    processes never read a partial file
+    @param suffix: Ending of the temporary file name, i.e. '.tmp.npz' for numpy.savez, which appends .npz otherwise
+    """
+    tmpPath = '{:s}.{:d}.{:d}{:s}'.format(path, os.getpid(), threading.get_ident(), suffix)
+    try:
+        write(tmpPath)
+        os.replace(tmpPath, path)
+    except BaseException:
+        if os.path.exists(tmpPath):
+            os.remove(tmpPath)
+        raise
+
+
+def _writeJson(path: str, value):
+    """
+    Writes value as a json file, see _writeAtomic
+    """
+    def write(tmpPath):
+        with open(tmpPath, 'w') as file:
+            json.dump(value, file)
+    _writeAtomic(path, write)
+
+
+def _readJson(path: str, default=None):
+    """
+    Returns the value of a json file, or default if it is missing or can't be decoded
+    """
+    try:
+        with open(path, 'r') as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return default
+
+
+@contextmanager
+def _lockFile(path: str, stale: float = 300):
+    """
+    Holds the lock file path while the with block runs, so that processes sharing a directory update it one at a time
+    The lock file is created exclusively and removed at the end of the block. A lock file older than stale seconds
+    was left by a process that ended in the block, and is taken over
+    """
+    while True:
+        try:
+            os.close(os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            break
+        except FileExistsError:
+            try:
+                if time.time() - os.path.getmtime(path) > stale:
+                    os.remove(path)
+                    continue
+            except OSError:
+                # removed by its owner in the meantime
+                continue
+            time.sleep(0.05)
+    try:
+        yield
+    finally:
+        os.remove(path)
+
+
+_sessionLock = threading.Lock()
+
+
+def _growSession(session: requests.Session, poolSize: int):
+    """
+    Replaces the adapter of a session created by _createSession with a larger one if it keeps less than poolSize
+    connections per host, so that poolSize threads can share the session without discarding connections
+    @return: The number of pooled connections per host of the session, or None if it isn't known
+    """
+    if not isinstance(session, requests.Session):
+        return None
+    with _sessionLock:
+        adapter = session.get_adapter('https://')
+        current = getattr(adapter, '_pool_maxsize', None)
+        if current is None or current >= poolSize:
+            return current
+        larger = HTTPAdapter(pool_connections=max(adapter._pool_connections, poolSize), pool_maxsize=poolSize,
+                             max_retries=adapter.max_retries)
+        session.mount('https://', larger)
+        session.mount('http://', larger)
+        adapter.close()
+        return poolSize
+
+
+def _jsonDecoder(decoder='auto'):
+    """
+    Returns a function decoding json from bytes
+    @param decoder: 'auto' uses orjson if installed and the standard library otherwise, 'orjson' or 'json' force one
+                    of them, and a callable is returned as it is
+    """
+    if callable(decoder):
+        return decoder
+    if decoder not in ('auto', 'orjson', 'json'):
+        raise ValueError(f"json_decoder must be one of ['auto', 'orjson', 'json'] or a callable; got {decoder}")
+
+    if decoder != 'json':
+        try:
+            import orjson
+            return orjson.loads
+        except ImportError:
+            if decoder == 'orjson':
+                raise
+    return json.loads
+
+
+# fixed layouts of the timestamps of the API, by length: (separators {position: character}, fields (start, end))
+# fields are year, month, day, hour, minute, second and millisecond
+_timestampLayouts = {
+    # 2020-01-31T23:59:59.999Z, sample times and dates
+    24: ({4: '-', 7: '-', 10: 'T', 13: ':', 16: ':', 19: '.', 23: 'Z'},
+         ((0, 4), (5, 7), (8, 10), (11, 13), (14, 16), (17, 19), (20, 23))),
+    # 20200131T235959.999Z, archive file names
+    20: ({8: 'T', 15: '.', 19: 'Z'},
+         ((0, 4), (4, 6), (6, 8), (9, 11), (11, 13), (13, 15), (16, 19))),
+}
+
+
+def _parseTimestamps(times):
+    """
+    Parses a sequence of UTC timestamps in one vectorized operation
+    Timestamps in the fixed formats of the API (YYYY-MM-DDTHH:MM:SS.sssZ or YYYYMMDDTHHMMSS.sssZ) are decoded from
+    their characters with numpy, any other format is parsed one by one
+    @param times: List or array of strings
+    @return:      numpy array of datetime64[ns], in UTC
+    """
+    if len(times) == 0:
+        return np.array([], dtype='datetime64[ns]')
+
+    try:
+        chars = np.asarray(times, dtype='S')
+    except UnicodeEncodeError:
+        return _parseTimestampsSlow(times)
+    layout = _timestampLayouts.get(chars.dtype.itemsize)
+    if layout is None or chars.ndim != 1:
+        return _parseTimestampsSlow(times)
+
+    separators, fields = layout
+    codes = chars.view(np.uint8).reshape(len(chars), chars.dtype.itemsize)
+    for position, character in separators.items():
+        if not (codes[:, position] == ord(character)).all():
+            return _parseTimestampsSlow(times)
+
+    digits = codes.astype(np.int64) - ord('0')
+    values = []
+    for start, end in fields:
+        field = digits[:, start:end]
+        if ((field < 0) | (field > 9)).any():
+            return _parseTimestampsSlow(times)
+        values.append(field @ (10 ** np.arange(end - start - 1, -1, -1)))
+    year, month, day, hour, minute, second, millisecond = values
+    if ((month < 1) | (month > 12) | (day < 1) | (day > 31) | (hour > 23) | (minute > 59) | (second > 59)).any():
+        return _parseTimestampsSlow(times)
+
+    months = ((year - 1970) * 12 + month - 1).astype('datetime64[M]')
+    monthStarts = months.astype('datetime64[D]')
+    # days past the end of their month (i.e. February 31) are parsed one by one, which raises like dateutil
+    if (day > ((months + 1).astype('datetime64[D]') - monthStarts).astype(np.int64)).any():
+        return _parseTimestampsSlow(times)
+    days = monthStarts + (day - 1).astype('timedelta64[D]')
+    milliseconds = ((hour * 60 + minute) * 60 + second) * 1000 + millisecond
+    return days.astype('datetime64[ns]') + milliseconds.astype('timedelta64[ms]')
+
+
+def _parseTimestampsSlow(times):
+    """
+    Parses timestamps of any format supported by dateutil one by one, see _parseTimestamps
+    """
+    dates = []
+    for timestamp in times:
+        date = dateutil.parser.parse(timestamp)
+        if date.tzinfo is not None:
+            date = date.astimezone(timezone.utc).replace(tzinfo=None)
+        dates.append(date)
+    return np.array(dates, dtype='datetime64[ns]')
+
+
 def saveAsFile(response, filePath: str, fileName: str, overwrite: bool):
     """
     Saves the file downloaded in the response object, in the outPath, with filename
@@ -91,10 +298,70 @@ def _messageForError(status: int):
     """
     errors = {
         500: 'Internal server error',
+        502: 'Bad gateway',
         503: 'Service temporarily unavailable',
+        504: 'Gateway timeout',
         598: 'Network read timeout error'
     }
-    return errors[status]
+    return errors.get(status, 'Unexpected error')
+
+
+class _SingleFlight:
+    """
+    Coalesces identical calls running at the same time in different threads
+    Only the first caller of a key runs the function, the others wait for it and share its result (or exception)
+    """
+
+    class _Call:
+        def __init__(self):
+            self.event = threading.Event()
+            self.waiters = 0
+            self.result = None
+            self.error = None
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}  # key -> _Call in flight
+
+    def do(self, key, f, share=None):
+        """
+        Runs f(), unless a call with the same key is in flight, in which case it waits for its result
+        @param key:   Hashable key identifying the call
+        @param share: Function returning a copy of the result for each waiting caller, the result itself if None
+        @return:      A tuple (result, shared), with shared True if the result came from another caller
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = self._calls[key] = self._Call()
+                leader = True
+            else:
+                call.waiters += 1
+                leader = False
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return (call.result if share is None else share(call.result)), True
+
+        try:
+            result = f()
+        except BaseException as error:
+            call.error = error
+            raise
+        else:
+            # keep an untouched copy for the waiting callers, the leader may modify its result
+            with self._lock:
+                waiters = call.waiters
+                del self._calls[key]
+            call.result = share(result) if (share is not None and waiters > 0) else result
+            return result, False
+        finally:
+            if call.error is not None:
+                with self._lock:
+                    self._calls.pop(key, None)
+            call.event.set()
 
 
 class ShareJobThreads:
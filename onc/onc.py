@@ -6,6 +6,17 @@ from modules._OncDiscovery import _OncDiscovery
 from modules._OncDelivery import _OncDelivery
 from modules._OncRealTime import _OncRealTime
 from modules._OncArchive import _OncArchive
+from modules._util import _createSession, _SingleFlight, _jsonDecoder, _parseTimestamps
+from modules.DataReducer import DataReducer
+from modules.EventHooks import EventHooks, _ConsoleLog
+from modules.Metrics import MetricsRegistry
+from modules.RateLimiter import RateLimiter
+# re-exported for the users of compact raw data, see RawReadings
+from modules.RawReadings import RawReadings, delimitedParser, fixedWidthParser  # noqa: F401
+from modules.ResponseCache import ResponseCache
+from modules.RetryPolicy import RetryPolicy
+from modules.SeriesCache import SeriesCache
+from onc.util.align import alignFrame
 from onc.util.util import add_docs
 
 
@@ -16,7 +27,10 @@ class ONC:
     """
 
     def __init__(self, token, production: bool = True, showInfo: bool = False, outPath: str = 'output',
-                 timeout: int = 60, download_threads: int = 2):
+                 timeout: int = 60, download_threads: int = 2, pool_size: int = None,
+                 retry_policy: RetryPolicy = None, cache: ResponseCache = None, json_decoder='auto',
+                 rate_limiter: RateLimiter = None, metrics=False, prefetch: int = 1, page_latency: float = None,
+                 checkpoint_dir: str = None, series_cache: SeriesCache = None):
         self.token = re.sub('[^a-zA-Z0-9\-]+', '', token)
         self.showInfo = showInfo
         self.timeout = timeout
@@ -24,6 +38,51 @@ class ONC:
         self.outPath = ''
         self.download_threads = download_threads
 
+        # one keep-alive connection pool shared by all services and download threads
+        # by default it holds one connection per download thread
+        self.pool_size = download_threads if pool_size is None else pool_size
+        self.session = _createSession(self.pool_size)
+
+        # identical requests running at the same time in different threads are sent only once
+        self.inflight = _SingleFlight()
+
+        # event bus for instrumentation, the request messages of showInfo are printed by one of its listeners
+        self.hooks = EventHooks()
+        _ConsoleLog(self).attach(self.hooks)
+
+        # optional metrics, True creates a MetricsRegistry, which can also be provided to share it between instances
+        self.metrics = None
+        if metrics:
+            self.metrics = MetricsRegistry() if metrics is True else metrics
+            self.metrics.attach(self.hooks)
+
+        # retry policy shared by all services, RetryPolicy(maxAttempts=1) disables retrying
+        self.retry_policy = RetryPolicy() if retry_policy is None else retry_policy
+
+        # optional client-side limit of requests and bytes per second, shared by all services and threads
+        self.rate_limiter = rate_limiter
+
+        # pages of multi-page downloads requested ahead in a background thread, while the previous page is processed
+        # 0 requests each page only when it is needed
+        self.prefetch = prefetch
+
+        # target seconds per page of multi-page downloads, the rowLimit of each page is adapted to the measured
+        # response times. None keeps the rowLimit of the filters
+        self.page_latency = page_latency
+
+        # optional directory where multi-page downloads save their pages, to resume them after a failure
+        self.checkpoint_dir = checkpoint_dir
+
+        # optional cache for the discovery services, None requests every time
+        self.cache = cache
+
+        # optional on-disk cache of scalar data by device for the numpy and dataframe outputs, only the time ranges
+        # missing in it are downloaded
+        self.series_cache = series_cache
+
+        # 'auto' decodes json with orjson if installed, see _jsonDecoder
+        self.json_decoder = _jsonDecoder(json_decoder)
+
         # sanitize outPath
         if len(outPath) > 0:
             outPath = outPath.replace('\\', '/')
@@ -41,6 +100,24 @@ class ONC:
         self.realTime = _OncRealTime(self)
         self.archive = _OncArchive(self)
 
+    def close(self):
+        """
+        Closes the pooled connections of this ONC instance
+        """
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def decode(self, raw: bytes):
+        """
+        Decodes the json bytes returned by a request with raw=True, using the json decoder of this instance
+        """
+        return self.json_decoder(raw)
+
     @staticmethod
     def print(obj, filename: str = ""):
         """
@@ -65,10 +142,28 @@ class ONC:
         """
         if dateString == 'now':
             return datetime.datetime.utcnow().replace(microsecond=0).isoformat() + '.000Z'
+        elif re.fullmatch(r'\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}\.\d{3}Z', dateString):
+            # already in the format of the API, the parser raises ValueError for dates that don't exist
+            _parseTimestamps([dateString])
+            return dateString[:19] + '.000Z'
         else:
             objDate = parser.parse(dateString)
             return objDate.replace(microsecond=0).isoformat() + '.000Z'
 
+    @staticmethod
+    def parseTimestamps(times):
+        """
+        Parses a list of timestamps, i.e. the sampleTimes of scalar data, into a numpy datetime64[ns] array (UTC)
+        The fixed formats of the API (2020-01-31T23:59:59.999Z and 20200131T235959.999Z in archive file names) are
+        parsed in one vectorized operation, other formats one by one with dateutil
+        """
+        return _parseTimestamps(times)
+
+    @staticmethod
+    @add_docs(alignFrame)
+    def alignSensors(responses, period: float = None, method: str = 'nearest', tolerance: float = None):
+        return alignFrame(responses, period, method, tolerance)
+
     # PUBLIC METHOD WRAPPERS
 
     # Discovery methods
@@ -124,34 +219,89 @@ class ONC:
     # Real-time methods
 
     @add_docs(_OncRealTime.getDirectByLocation)
-    def getDirectScalar(self, filters: dict = None, allPages: bool = False):
+    def getDirectScalar(self, filters: dict = None, allPages: bool = False, raw: bool = False, workers: int = None):
         # Alias for getDirectByLocation (to be eventually discontinued)
-        return self.getDirectByLocation(filters, allPages)
+        return self.getDirectByLocation(filters, allPages, raw, workers)
 
     @add_docs(_OncRealTime.getDirectByLocation)
-    def getDirectByLocation(self, filters: dict = None, allPages: bool = False):
-        return self.realTime.getDirectByLocation(filters, allPages)
+    def getDirectByLocation(self, filters: dict = None, allPages: bool = False, raw: bool = False,
+                            workers: int = None, output: str = None, reducer: DataReducer = None):
+        return self.realTime.getDirectByLocation(filters, allPages, raw, workers, output, reducer)
 
     @add_docs(_OncRealTime.getDirectByDevice)
-    def getDirectByDevice(self, filters: dict = None, allPages: bool = False):
-        return self.realTime.getDirectByDevice(filters, allPages)
+    def getDirectByDevice(self, filters: dict = None, allPages: bool = False, raw: bool = False,
+                          workers: int = None, output: str = None, reducer: DataReducer = None):
+        return self.realTime.getDirectByDevice(filters, allPages, raw, workers, output, reducer)
 
     @add_docs(_OncRealTime.getDirectRawByLocation)
-    def getDirectRawByLocation(self, filters: dict = None, allPages: bool = False):
-        return self.realTime.getDirectRawByLocation(filters, allPages)
+    def getDirectRawByLocation(self, filters: dict = None, allPages: bool = False, raw: bool = False,
+                               workers: int = None, output: str = None):
+        return self.realTime.getDirectRawByLocation(filters, allPages, raw, workers, output)
 
     @add_docs(_OncRealTime.getDirectRawByDevice)
-    def getDirectRawByDevice(self, filters: dict = None, allPages: bool = False):
-        return self.realTime.getDirectRawByDevice(filters, allPages)
+    def getDirectRawByDevice(self, filters: dict = None, allPages: bool = False, raw: bool = False,
+                             workers: int = None, output: str = None):
+        return self.realTime.getDirectRawByDevice(filters, allPages, raw, workers, output)
+
+    @add_docs(_OncRealTime.getDirectByLocations)
+    def getDirectByLocations(self, locationCodes: list, filters: dict = None, allPages: bool = False,
+                             output: str = None, download_threads: int = None, raiseErrors: bool = True):
+        return self.realTime.getDirectByLocations(locationCodes, filters, allPages, output, download_threads,
+                                                  raiseErrors)
+
+    @add_docs(_OncRealTime.getDirectByDevices)
+    def getDirectByDevices(self, deviceCodes: list, filters: dict = None, allPages: bool = False, output: str = None,
+                           download_threads: int = None, raiseErrors: bool = True):
+        return self.realTime.getDirectByDevices(deviceCodes, filters, allPages, output, download_threads, raiseErrors)
+
+    @add_docs(_OncRealTime.iterDirectByLocation)
+    def iterDirectByLocation(self, filters: dict = None):
+        return self.realTime.iterDirectByLocation(filters)
+
+    @add_docs(_OncRealTime.iterDirectByDevice)
+    def iterDirectByDevice(self, filters: dict = None):
+        return self.realTime.iterDirectByDevice(filters)
+
+    @add_docs(_OncRealTime.iterDirectRawByLocation)
+    def iterDirectRawByLocation(self, filters: dict = None):
+        return self.realTime.iterDirectRawByLocation(filters)
+
+    @add_docs(_OncRealTime.iterDirectRawByDevice)
+    def iterDirectRawByDevice(self, filters: dict = None):
+        return self.realTime.iterDirectRawByDevice(filters)
+
+    @add_docs(_OncRealTime.followDirectByLocation)
+    def followDirectByLocation(self, filters: dict = None, pollInterval: float = 60, maxInterval: float = None):
+        return self.realTime.followDirectByLocation(filters, pollInterval, maxInterval)
+
+    @add_docs(_OncRealTime.followDirectByDevice)
+    def followDirectByDevice(self, filters: dict = None, pollInterval: float = 60, maxInterval: float = None):
+        return self.realTime.followDirectByDevice(filters, pollInterval, maxInterval)
+
+    @add_docs(_OncRealTime.followDirectRawByLocation)
+    def followDirectRawByLocation(self, filters: dict = None, pollInterval: float = 60, maxInterval: float = None):
+        return self.realTime.followDirectRawByLocation(filters, pollInterval, maxInterval)
+
+    @add_docs(_OncRealTime.followDirectRawByDevice)
+    def followDirectRawByDevice(self, filters: dict = None, pollInterval: float = 60, maxInterval: float = None):
+        return self.realTime.followDirectRawByDevice(filters, pollInterval, maxInterval)
 
     # Archive file methods
     @add_docs(_OncArchive.getListByLocation)
-    def getListByLocation(self, filters: dict = None, allPages: bool = False):
-        return self.archive.getListByLocation(filters, allPages)
+    def getListByLocation(self, filters: dict = None, allPages: bool = False, workers: int = None):
+        return self.archive.getListByLocation(filters, allPages, workers)
 
     @add_docs(_OncArchive.getListByDevice)
-    def getListByDevice(self, filters: dict = None, allPages: bool = False):
-        return self.archive.getListByDevice(filters, allPages)
+    def getListByDevice(self, filters: dict = None, allPages: bool = False, workers: int = None):
+        return self.archive.getListByDevice(filters, allPages, workers)
+
+    @add_docs(_OncArchive.iterListByLocation)
+    def iterListByLocation(self, filters: dict = None):
+        return self.archive.iterListByLocation(filters)
+
+    @add_docs(_OncArchive.iterListByDevice)
+    def iterListByDevice(self, filters: dict = None):
+        return self.archive.iterListByDevice(filters)
 
     @add_docs(_OncArchive.getFile)
     def getFile(self, filename: str = '', overwrite: bool = False, outPath: str = None):
@@ -0,0 +1,138 @@
+"""
+Alignment of scalar data series of several sensors or devices onto a common time grid
+The samples are matched with binary searches of the sorted sample times (numpy.searchsorted), without Python loops
+over the samples.
+"""
+import numpy as np
+import pandas
+
+from modules._util import _parseTimestamps
+
+methods = ('nearest', 'asof', 'interpolate')
+
+
+def sensorSeries(response: dict, prefix: str = None):
+    """
+    Returns the series of each sensor of a scalardata response, in any output format (JSON lists, 'numpy' or
+    'dataframe')
+    @param prefix: Prefix of the series names, i.e. the device code. The names are '<prefix>.<sensorCode>', or just the
+                   sensorCode without prefix
+    @return:       Dictionary {name: (sampleTimes as datetime64[ns] array, values as float64 array)}
+    """
+    series = {}
+    for sensorData in response.get('sensorData') or []:
+        name = sensorData['sensorCode'] if prefix is None else '{:s}.{:s}'.format(prefix, sensorData['sensorCode'])
+        data = sensorData['data']
+        times = data['sampleTimes']
+        if not (isinstance(times, np.ndarray) and times.dtype.kind == 'M'):
+            times = np.asarray(times)
+            times = times.astype('datetime64[ns]') if times.dtype.kind == 'M' else _parseTimestamps(list(times))
+        series[name] = (times.astype('datetime64[ns]'), np.asarray(data['values'], dtype=np.float64))
+    return series
+
+
+def timeGrid(start, end, period: float):
+    """
+    Returns the times from start to end (excluded) every period seconds, as a datetime64[ns] array
+    @param start: datetime64 or ISO8601 string
+    @param end:   datetime64 or ISO8601 string
+    """
+    start, end = [_parseTimestamps([t])[0] if isinstance(t, str) else np.datetime64(t, 'ns') for t in (start, end)]
+    return np.arange(start, end, np.timedelta64(int(round(period * 1e9)), 'ns'))
+
+
+def alignSeries(series: dict, grid=None, method: str = 'nearest', tolerance: float = None):
+    """
+    Aligns series onto the times of grid
+    @param series:    Dictionary {name: (times, values)}, see sensorSeries
+    @param grid:      Times to align to (datetime64 array), defaults to the times of the first series
+    @param method:    'nearest': value of the closest sample
+                      'asof': value of the last sample at or before the grid time
+                      'interpolate': linear interpolation between the samples around the grid time
+    @param tolerance: Maximum seconds between a grid time and the sample(s) used, None for no limit
+    @return:          Dictionary {'sampleTimes': grid, name: float64 array of aligned values (NaN without match)}
+    """
+    if method not in methods:
+        raise ValueError(f'method must be one of {list(methods)}; got {method}')
+    if not series:
+        raise ValueError('series must hold at least one series')
+    if grid is None:
+        grid = next(iter(series.values()))[0]
+    grid = np.asarray(grid).astype('datetime64[ns]')
+    gridNs = grid.astype(np.int64)
+    toleranceNs = None if tolerance is None else tolerance * 1e9
+
+    aligned = {'sampleTimes': grid}
+    for name, (times, values) in series.items():
+        timesNs = np.asarray(times).astype('datetime64[ns]').astype(np.int64)
+        values = np.asarray(values, dtype=np.float64)
+        if len(timesNs) > 1 and (np.diff(timesNs) < 0).any():
+            order = np.argsort(timesNs, kind='stable')
+            timesNs, values = timesNs[order], values[order]
+        aligned[name] = _alignOne(timesNs, values, gridNs, method, toleranceNs)
+    return aligned
+
+
+def alignFrame(responses, period: float = None, method: str = 'nearest', tolerance: float = None):
+    """
+    Aligns the sensors of scalardata responses, i.e. of getDirectByDevices, and returns them as a pandas.DataFrame
+    @param responses: A scalardata response, or a dictionary {code: response} (failed codes holding an exception are
+                      skipped)
+    @param period:    Seconds of a regular grid from the first to the last sample of all series, None aligns to the
+                      times of the first series
+    @return:          pandas.DataFrame indexed by sampleTimes, with a column per sensor (see sensorSeries for the names)
+    """
+    if 'sensorData' in responses:
+        series = sensorSeries(responses)
+    else:
+        series = {}
+        for code, response in responses.items():
+            if isinstance(response, dict):
+                series.update(sensorSeries(response, prefix=code))
+
+    grid = None
+    if period is not None:
+        withData = [times for times, values in series.values() if len(times)]
+        if withData:
+            start = min(times.min() for times in withData)
+            end = max(times.max() for times in withData)
+            grid = timeGrid(start, end + np.timedelta64(1, 'ns'), period)
+
+    aligned = alignSeries(series, grid, method, tolerance)
+    return pandas.DataFrame(aligned).set_index('sampleTimes')
+
+
+def _alignOne(timesNs: np.ndarray, values: np.ndarray, gridNs: np.ndarray, method: str, toleranceNs: float = None):
+    """
+    Aligns one series with sorted int64 times onto int64 grid times
+    """
+    result = np.full(len(gridNs), np.nan)
+    if len(timesNs) == 0:
+        return result
+
+    if method == 'interpolate':
+        right = np.searchsorted(timesNs, gridNs, side='left')
+        valid = (right < len(timesNs)) & ((right > 0) | (timesNs[np.minimum(right, len(timesNs) - 1)] == gridNs))
+        result[valid] = np.interp(gridNs[valid], timesNs, values)
+        if toleranceNs is not None:
+            left = np.clip(right - 1, 0, len(timesNs) - 1)
+            right = np.clip(right, 0, len(timesNs) - 1)
+            far = (np.maximum(gridNs - timesNs[left], timesNs[right] - gridNs) > toleranceNs) & \
+                  (timesNs[right] != gridNs)
+            result[far] = np.nan
+        return result
+
+    if method == 'asof':
+        index = np.searchsorted(timesNs, gridNs, side='right') - 1
+        valid = index >= 0
+    else:
+        right = np.clip(np.searchsorted(timesNs, gridNs, side='left'), 0, len(timesNs) - 1)
+        left = np.clip(right - 1, 0, len(timesNs) - 1)
+        index = np.where(np.abs(gridNs - timesNs[left]) <= np.abs(timesNs[right] - gridNs), left, right)
+        valid = np.ones(len(gridNs), dtype=bool)
+
+    index = np.clip(index, 0, len(timesNs) - 1)
+    if toleranceNs is not None:
+        valid &= np.abs(gridNs - timesNs[index]) <= toleranceNs
+    result[valid] = values[index[valid]]
+    return result
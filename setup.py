@@ -35,6 +35,10 @@ setuptools.setup(
         'humanize',
         'urllib3'
     ],
+    extras_require={
+        'async': ['aiohttp'],
+        'fast': ['orjson'],
+    },
     classifiers=[
         "Programming Language :: Python :: 3",
         "License :: OSI Approved :: Apache Software License",
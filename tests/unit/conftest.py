@@ -0,0 +1,6 @@
+import os
+import sys
+
+# the client imports its modules as 'modules.*' (see onc/__init__.py), so the tests import them the same way
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+import onc  # noqa: E402,F401
@@ -0,0 +1,122 @@
+"""
+Offline stand-in for the session of an ONC object, answering the web services from memory
+"""
+import json
+import threading
+from datetime import datetime, timedelta
+
+from requests.models import Response
+
+
+class FakeSession:
+    """
+    Replaces the requests.Session of an ONC object. Each service is answered by the method of the same name, which
+    returns the json body, or a tuple (status, body, headers)
+    The requests are recorded in calls as (service, params, headers).
+    """
+
+    def __init__(self, sensors: tuple = ('temp', 'cond'), period: float = 1.0):
+        """
+        @param sensors: Sensor codes of the scalardata responses
+        @param period:  Seconds between the samples of the time series, which start at 2020-01-01
+        """
+        self.calls = []
+        self.etag = None
+        self.sensors = sensors
+        self.period = period
+        self._lock = threading.Lock()
+
+    def request(self, method, url, params=None, timeout=None, headers=None):
+        service = url.rstrip('/').rsplit('/', 1)[-1]
+        params = dict(params or {})
+        with self._lock:
+            self.calls.append((service, params, dict(headers or {})))
+        answer = getattr(self, service)(params, headers or {})
+        status, body, responseHeaders = answer if isinstance(answer, tuple) else (200, answer, {})
+
+        response = Response()
+        response.status_code = status
+        response.url = url
+        response._content = b'' if body is None else json.dumps(body).encode('utf-8')
+        response.headers['Content-Type'] = 'application/json'
+        response.headers.update(responseHeaders)
+        return response
+
+    def close(self):
+        pass
+
+    def serviceCalls(self, service: str):
+        return [call for call in self.calls if call[0] == service]
+
+    def locations(self, params: dict, headers: dict):
+        body = [{'locationCode': params.get('locationCode', 'BACAX'), 'locationName': 'Barkley Canyon Axis'}]
+        if self.etag is None:
+            return body
+        if headers.get('If-None-Match') == self.etag:
+            return 304, None, {'ETag': self.etag}
+        return 200, body, {'ETag': self.etag}
+
+    devices = locations
+
+    def scalardata(self, params: dict, headers: dict):
+        times, rNext = self._samples(params)
+        sensorData = [{'sensorCode': sensor, 'sensorName': sensor, 'unitOfMeasure': 'u',
+                       'data': {'sampleTimes': [_formatDate(t) for t in times],
+                                'values': [t.timestamp() % 1000 + i for t in times],
+                                'qaqcFlags': [4 if t.second % 7 == 0 else 1 for t in times]}}
+                      for i, sensor in enumerate(self.sensors)]
+        return {'citations': [], 'messages': [], 'next': rNext, 'parameters': params, 'queryUrl': '',
+                'sensorData': sensorData or None}
+
+    def rawdata(self, params: dict, headers: dict):
+        times, rNext = self._samples(params)
+        data = {'times': [_formatDate(t) for t in times],
+                'readings': ['%.3f,%d,abc' % (t.timestamp(), t.second) for t in times],
+                'lineTypes': [' ' for t in times]}
+        return {'citations': [], 'messages': [], 'next': rNext, 'parameters': params, 'queryUrl': '', 'metadata': {},
+                'data': data}
+
+    def archivefiles(self, params: dict, headers: dict):
+        times, rNext = self._samples(params)
+        files = ['DEV_%s.txt' % t.strftime('%Y%m%dT%H%M%S.000Z') for t in times]
+        return {'next': rNext, 'queryUrl': '', 'files': files}
+
+    def _samples(self, params: dict):
+        """
+        Returns the sample times of a page in [dateFrom, dateTo) with at most rowLimit samples (10 by default), and the
+        'next' of the response
+        """
+        dateFrom, dateTo = _parseDate(params['dateFrom']), _parseDate(params['dateTo'])
+        step = timedelta(seconds=self.period)
+        first = datetime(2020, 1, 1)
+        t = first + -(-(dateFrom - first) // step) * step
+        rowLimit = int(params.get('rowLimit', 10))
+        times = []
+        while t < dateTo and len(times) <= rowLimit:
+            times.append(t)
+            t += step
+        if len(times) <= rowLimit:
+            return times, None
+        times = times[:rowLimit]
+        nextParams = dict(params, dateFrom=_formatDate(times[-1] + timedelta(milliseconds=1)))
+        return times, {'parameters': nextParams, 'url': ''}
+
+
+def _formatDate(date: datetime):
+    return date.strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] + 'Z'
+
+
+def _parseDate(date: str):
+    return datetime.strptime(date, '%Y-%m-%dT%H:%M:%S.%fZ')
+
+
+def makeOnc(session: FakeSession = None, **kwargs):
+    """
+    Returns an ONC object sending its requests to a FakeSession
+    """
+    from onc.onc import ONC
+
+    onc = ONC('token', **kwargs)
+    onc.session.close()
+    onc.session = session or FakeSession()
+    return onc
@@ -0,0 +1,79 @@
+import numpy as np
+import pandas
+import pytest
+
+from onc.util.align import alignFrame, alignSeries, sensorSeries, timeGrid
+
+
+def seconds(values):
+    return np.datetime64('2020-01-01T00:00:00', 'ns') + (np.asarray(values) * 1e9).astype('timedelta64[ns]')
+
+
+@pytest.fixture
+def series():
+    rng = np.random.default_rng(2)
+    times = np.sort(rng.choice(np.arange(0, 1000, 0.5), 300, replace=False))
+    return seconds(times), rng.normal(0, 1, 300)
+
+
+@pytest.fixture
+def grid():
+    return seconds(np.arange(-5, 1010, 3.3))
+
+
+@pytest.mark.parametrize('method, direction', [('nearest', 'nearest'), ('asof', 'backward')])
+@pytest.mark.parametrize('tolerance', [None, 1.0])
+def test_matches_merge_asof(series, grid, method, direction, tolerance):
+    times, values = series
+    aligned = alignSeries({'a': series}, grid, method=method, tolerance=tolerance)
+
+    expected = pandas.merge_asof(pandas.DataFrame({'t': grid}), pandas.DataFrame({'t': times, 'a': values}), on='t',
+                                 direction=direction,
+                                 tolerance=None if tolerance is None else pandas.Timedelta(seconds=tolerance))
+    np.testing.assert_array_equal(aligned['sampleTimes'], grid)
+    np.testing.assert_allclose(aligned['a'], expected['a'].to_numpy())
+
+
+def test_interpolate_matches_np_interp(series, grid):
+    times, values = series
+    aligned = alignSeries({'a': series}, grid, method='interpolate')['a']
+
+    gridNs, timesNs = grid.astype(np.int64), times.astype(np.int64)
+    inside = (gridNs >= timesNs[0]) & (gridNs <= timesNs[-1])
+    np.testing.assert_allclose(aligned[inside], np.interp(gridNs[inside], timesNs, values))
+    assert np.isnan(aligned[~inside]).all()
+
+
+def test_interpolate_tolerance():
+    aligned = alignSeries({'a': (seconds([0, 1, 10]), [0., 1., 10.])}, seconds([0.5, 5, 10]), method='interpolate',
+                          tolerance=2)['a']
+    np.testing.assert_allclose(aligned, [0.5, np.nan, 10.])
+
+
+def test_unsorted_series():
+    aligned = alignSeries({'a': (seconds([2, 0, 1]), [2., 0., 1.])}, seconds([0, 1, 2]), method='asof')['a']
+    np.testing.assert_array_equal(aligned, [0., 1., 2.])
+
+
+def test_invalid_method():
+    with pytest.raises(ValueError):
+        alignSeries({'a': (seconds([0]), [0.])}, method='cubic')
+
+
+def test_align_frame_of_devices():
+    def response(times, values):
+        return {'sensorData': [{'sensorCode': 'temp', 'data': {
+            'sampleTimes': [np.datetime_as_string(t, unit='ms') + 'Z' for t in seconds(times)], 'values': values}}]}
+
+    frame = alignFrame({'CTD': response([0, 10, 20], [1., 2., 3.]), 'OXY': response([1, 11], [5., 6.]),
+                        'BAD': RuntimeError('failed')}, period=10, method='asof')
+    assert list(frame.columns) == ['CTD.temp', 'OXY.temp']
+    np.testing.assert_array_equal(frame.index.to_numpy(), seconds([0, 10, 20]))
+    np.testing.assert_allclose(frame['OXY.temp'].to_numpy(), [np.nan, 5., 6.])
+
+
+def test_sensor_series_and_grid():
+    series = sensorSeries({'sensorData': [{'sensorCode': 'temp', 'data': {
+        'sampleTimes': ['2020-01-01T00:00:00.000Z'], 'values': [None]}}]}, prefix='CTD')
+    assert np.isnan(series['CTD.temp'][1][0])
+    assert len(timeGrid('2020-01-01T00:00:00.000Z', '2020-01-01T00:01:00.000Z', 15)) == 4
@@ -0,0 +1,60 @@
+import os
+
+import pytest
+
+from fakeapi import FakeSession, makeOnc
+from modules._Checkpoint import _Checkpoint
+
+
+def filters():
+    return {'deviceCode': 'DEV', 'dateFrom': '2020-01-01T00:00:00.000Z', 'dateTo': '2020-01-01T00:00:45.000Z',
+            'rowLimit': 10}
+
+
+class FailingSession(FakeSession):
+    """
+    Fails the request number failAt of scalar data
+    """
+
+    def __init__(self, failAt: int = None):
+        super().__init__()
+        self.failAt = failAt
+
+    def scalardata(self, params: dict, headers: dict):
+        if len(self.serviceCalls('scalardata')) == self.failAt:
+            return 400, {'errors': [{'errorCode': 127, 'parameter': 'dateFrom', 'errorMessage': 'failed'}]}, {}
+        return super().scalardata(params, headers)
+
+
+def test_resume_after_a_failed_page(tmp_path):
+    expected = makeOnc().getDirectByDevice(filters(), allPages=True)
+
+    onc = makeOnc(FailingSession(failAt=4), checkpoint_dir=str(tmp_path), prefetch=0)
+    with pytest.raises(Exception):
+        onc.getDirectByDevice(filters(), allPages=True)
+    assert len(os.listdir(str(tmp_path))) == 1
+
+    onc.session = FailingSession()
+    response = onc.getDirectByDevice(filters(), allPages=True)
+    assert response == expected
+    # pages 1 to 3 were read from the checkpoint
+    assert len(onc.session.serviceCalls('scalardata')) == 2
+    assert onc.session.serviceCalls('scalardata')[0][1]['dateFrom'] == '2020-01-01T00:00:29.001Z'
+    # the checkpoint is deleted once the download completes
+    assert os.listdir(str(tmp_path)) == []
+
+
+def test_key_ignores_the_token_and_filter_order():
+    key = _Checkpoint.key('scalardata', 'url', {'token': 'a', 'deviceCode': 'DEV', 'rowLimit': 10})
+    assert key == _Checkpoint.key('scalardata', 'url', {'rowLimit': '10', 'deviceCode': 'DEV', 'token': 'b'})
+    assert key != _Checkpoint.key('rawdata', 'url', {'deviceCode': 'DEV', 'rowLimit': 10})
+
+
+def test_extension_is_part_of_the_key(tmp_path):
+    archiveFilters = {'deviceCode': 'DEV', 'dateFrom': '2020-01-01T00:00:00.000Z'}
+    txt = _Checkpoint(str(tmp_path), 'archivefiles', 'url', archiveFilters, 'txt')
+    png = _Checkpoint(str(tmp_path), 'archivefiles', 'url', archiveFilters, 'png')
+    assert txt.path != png.path
+    txt.save(1, {'files': ['a.txt'], 'next': {}}, {'dateFrom': 'next'})
+    assert png.load() is None
+    assert txt.load() == ([{'files': ['a.txt'], 'next': {}}], {'dateFrom': 'next'})
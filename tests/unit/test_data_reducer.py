@@ -0,0 +1,78 @@
+import numpy as np
+import pandas
+import pytest
+
+from modules.DataReducer import DataReducer
+
+
+def scalarResponse(seconds, values, flags):
+    times = [np.datetime_as_string(np.datetime64('2020-01-01T00:00:00', 'ms') + np.timedelta64(int(s * 1000), 'ms'),
+                                   unit='ms') + 'Z' for s in seconds]
+    return {'sensorData': [{'sensorCode': 'temp', 'unitOfMeasure': 'C',
+                            'data': {'sampleTimes': times, 'values': list(values), 'qaqcFlags': list(flags)}}],
+            'next': None}
+
+
+def pages(response: dict, size: int):
+    data = response['sensorData'][0]['data']
+    for start in range(0, len(data['sampleTimes']), size):
+        page = {'sensorData': [dict(response['sensorData'][0],
+                                    data={key: column[start:start + size] for key, column in data.items()})]}
+        yield page
+
+
+@pytest.fixture
+def samples():
+    rng = np.random.default_rng(1)
+    seconds = np.sort(rng.uniform(0, 600, 500))
+    return seconds, rng.normal(10, 2, 500), rng.integers(0, 5, 500)
+
+
+def test_mask_flags_and_missing_values():
+    response = scalarResponse([0, 1, 2, 3], [1.0, None, 3.0, 4.0], [1, 1, 4, 2])
+    DataReducer(keepFlags=(1, 2)).reduce(response)
+    data = response['sensorData'][0]['data']
+    assert data['values'] == [1.0, 4.0]
+    assert data['qaqcFlags'] == [1, 2]
+    assert data['sampleTimes'] == ['2020-01-01T00:00:00.000Z', '2020-01-01T00:00:03.000Z']
+
+
+@pytest.mark.parametrize('how', DataReducer.aggregations)
+def test_aggregate_matches_pandas(samples, how):
+    seconds, values, flags = samples
+    response = DataReducer(period=60, how=how).reduce(scalarResponse(seconds, values, flags))
+    data = response['sensorData'][0]['data']
+
+    frame = pandas.DataFrame({'bin': (seconds // 60).astype(int), 'value': values, 'flag': flags})
+    expected = frame.groupby('bin').agg(value=('value', how), flag=('flag', 'max'))
+    np.testing.assert_allclose(data['values'], expected['value'].to_numpy())
+    assert data['qaqcFlags'] == expected['flag'].tolist()
+    assert data['sampleTimes'][1] == '2020-01-01T00:01:00.000Z'
+
+
+@pytest.mark.parametrize('size', [1, 7, 64])
+def test_stream_does_not_depend_on_page_size(samples, size):
+    seconds, values, flags = samples
+    reducer = DataReducer(keepFlags=(0, 1, 2), period=30)
+    whole = reducer.reduce(scalarResponse(seconds, values, flags))['sensorData'][0]['data']
+
+    stream = reducer.stream()
+    collected = {'sampleTimes': [], 'values': [], 'qaqcFlags': []}
+    reduced = []
+    for page in pages(scalarResponse(seconds, values, flags), size):
+        stream.reducePage(page)
+        reduced.append(page)
+    reduced.append(stream.flushPage())
+    for page in reduced:
+        for sensorData in page['sensorData']:
+            for key in collected:
+                collected[key] += sensorData['data'][key]
+
+    assert collected['sampleTimes'] == whole['sampleTimes']
+    np.testing.assert_allclose(collected['values'], whole['values'])
+    assert collected['qaqcFlags'] == whole['qaqcFlags']
+
+
+def test_invalid_aggregation():
+    with pytest.raises(ValueError):
+        DataReducer(how='median')
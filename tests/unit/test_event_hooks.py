@@ -0,0 +1,52 @@
+import pytest
+
+from fakeapi import FakeSession, makeOnc
+from modules.EventHooks import EventHooks
+from modules.RetryPolicy import RetryPolicy
+
+
+class FlakySession(FakeSession):
+    """
+    Answers the first request with HTTP 503
+    """
+
+    def locations(self, params, headers):
+        if len(self.calls) == 1:
+            return 503, {}, {}
+        return super().locations(params, headers)
+
+
+def test_register_and_unregister():
+    hooks = EventHooks()
+    events = []
+    callback = hooks.on('pollTick', events.append)
+
+    @hooks.on('*')
+    def anyEvent(event):
+        events.append(event['event'])
+
+    hooks.emit('pollTick', poll=1)
+    hooks.off('pollTick', callback)
+    hooks.emit('pollTick', poll=2)
+    hooks.emit('progress', done=1)
+    assert events[0]['event'] == 'pollTick' and events[0]['poll'] == 1 and 'time' in events[0]
+    assert events[1:] == ['pollTick', 'pollTick', 'progress']
+
+
+def test_unknown_event():
+    with pytest.raises(ValueError):
+        EventHooks().on('pageDone', print)
+
+
+def test_request_events():
+    onc = makeOnc(FlakySession(), retry_policy=RetryPolicy(backoff=0, jitter=False))
+    events = []
+    onc.hooks.on('*', events.append)
+    onc.getLocations({'locationCode': 'BACAX'})
+
+    assert [event['event'] for event in events] == ['requestStart', 'responseEnd']
+    start, end = events
+    assert start['service'] == 'locations'
+    assert start['params']['locationCode'] == 'BACAX' and 'token' not in start['params']
+    assert end['status'] == 200 and end['retries'] == 1 and end['error'] is None
+    assert end['bytes'] > 0 and end['latency'] >= 0
@@ -0,0 +1,56 @@
+import pytest
+
+from fakeapi import FakeSession, makeOnc
+
+
+def filters():
+    return {'dateFrom': '2020-01-01T00:00:00.000Z', 'dateTo': '2020-01-01T00:00:25.000Z', 'rowLimit': 10}
+
+
+class FailingSession(FakeSession):
+    """
+    Fails the requests of the device BAD
+    """
+
+    def scalardata(self, params: dict, headers: dict):
+        if params.get('deviceCode') == 'BAD':
+            return 400, {'errors': [{'errorCode': 127, 'parameter': 'deviceCode', 'errorMessage': 'unknown'}]}, {}
+        return super().scalardata(params, headers)
+
+
+def test_results_per_device():
+    onc = makeOnc(download_threads=3)
+    codes = ['DEV1', 'DEV2', 'DEV3', 'DEV1', 'DEV4']
+    results = onc.getDirectByDevices(codes, filters(), allPages=True)
+    assert list(results) == ['DEV1', 'DEV2', 'DEV3', 'DEV4']
+    expected = makeOnc().getDirectByDevice(dict(filters(), deviceCode='DEV1'), allPages=True)
+    assert results['DEV1']['sensorData'] == expected['sensorData']
+    deviceCodes = {params['deviceCode'] for service, params, headers in onc.session.serviceCalls('scalardata')}
+    assert deviceCodes == {'DEV1', 'DEV2', 'DEV3', 'DEV4'}
+
+
+def test_locations_and_output():
+    onc = makeOnc()
+    results = onc.getDirectByLocations(['LOC1', 'LOC2'], filters(), allPages=True, output='numpy')
+    assert sorted(results) == ['LOC1', 'LOC2']
+    locationCodes = [params['locationCode'] for service, params, headers in onc.session.serviceCalls('scalardata')]
+    assert sorted(set(locationCodes)) == ['LOC1', 'LOC2']
+
+
+def test_failed_device():
+    onc = makeOnc(FailingSession())
+    with pytest.raises(Exception):
+        onc.getDirectByDevices(['DEV1', 'BAD'], filters())
+
+    results = onc.getDirectByDevices(['DEV1', 'BAD'], filters(), raiseErrors=False)
+    assert isinstance(results['BAD'], Exception)
+    assert len(results['DEV1']['sensorData'][0]['data']['sampleTimes']) == 10
+
+
+def test_progress_counts_devices():
+    onc = makeOnc()
+    events = []
+    onc.hooks.on('progress', events.append)
+    onc.getDirectByDevices(['DEV1', 'DEV2'], filters())
+    assert [event['done'] for event in events] == [1, 2]
+    assert all(event['task'] == 'devices' and event['total'] == 2 for event in events)
@@ -0,0 +1,80 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import modules._OncRealTime
+from fakeapi import FakeSession, makeOnc
+from modules.SeriesCache import SeriesCache
+
+
+class StallingSession(FakeSession):
+    """
+    The sensor cond stops reporting after 2020-01-01T00:00:10
+    """
+
+    def scalardata(self, params: dict, headers: dict):
+        response = super().scalardata(params, headers)
+        for sensorData in response['sensorData']:
+            if sensorData['sensorCode'] == 'cond':
+                data = sensorData['data']
+                kept = sum(t < '2020-01-01T00:00:10.000Z' for t in data['sampleTimes'])
+                for key in data:
+                    data[key] = data[key][:kept]
+        return response
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """
+    Fakes the clock of the follow mode, starting at 2020-01-01T00:00:05, sleep moves it forward
+    """
+    clock = {'now': datetime(2020, 1, 1, 0, 0, 5)}
+
+    class FakeDatetime(datetime):
+        @classmethod
+        def utcnow(cls):
+            return clock['now']
+
+    def sleep(seconds: float):
+        clock['now'] += timedelta(seconds=seconds)
+
+    monkeypatch.setattr(modules._OncRealTime, 'datetime', FakeDatetime)
+    monkeypatch.setattr(modules._OncRealTime, 'sleep', sleep)
+    monkeypatch.setattr(modules._OncRealTime, 'time', lambda: 0)
+    return clock
+
+
+def follow(onc, polls: int, **kwargs):
+    filters = {'deviceCode': 'DEV', 'dateFrom': '2020-01-01T00:00:00.000Z', 'rowLimit': 1000}
+    responses = onc.followDirectByDevice(filters, pollInterval=5, **kwargs)
+    return [next(responses) for poll in range(polls)]
+
+
+def sampleTimes(responses: list, sensorCode: str):
+    return [t for response in responses for sensorData in response['sensorData']
+            if sensorData['sensorCode'] == sensorCode for t in sensorData['data']['sampleTimes']]
+
+
+def test_each_sample_is_yielded_once(clock):
+    onc = makeOnc()
+    responses = follow(onc, 6)
+    expected = ['2020-01-01T00:00:{:02d}.000Z'.format(s) for s in range(30)]
+    assert sampleTimes(responses, 'temp') == expected
+    assert sampleTimes(responses, 'cond') == expected
+
+
+def test_stalled_sensor_releases_the_cursor(clock):
+    onc = makeOnc(StallingSession())
+    responses = follow(onc, 20, maxInterval=20)
+    assert sampleTimes(responses, 'temp') == ['2020-01-01T00:{:02d}:{:02d}.000Z'.format(s // 60, s % 60)
+                                              for s in range(100)]
+    assert sampleTimes(responses, 'cond') == ['2020-01-01T00:00:{:02d}.000Z'.format(s) for s in range(10)]
+    # the requests start about maxInterval behind now instead of at the last sample of cond
+    lastFrom = onc.session.serviceCalls('scalardata')[-1][1]['dateFrom']
+    assert lastFrom >= '2020-01-01T00:01:15.000Z'
+
+
+def test_follow_skips_the_series_cache(clock, tmp_path):
+    onc = makeOnc(series_cache=SeriesCache(str(tmp_path), settle=0))
+    follow(onc, 2)
+    assert list(tmp_path.iterdir()) == []
@@ -0,0 +1,38 @@
+import json
+
+import pytest
+
+from fakeapi import makeOnc
+from modules._util import _jsonDecoder
+
+
+def filters():
+    return {'deviceCode': 'DEV', 'dateFrom': '2020-01-01T00:00:00.000Z', 'dateTo': '2020-01-01T00:00:05.000Z'}
+
+
+def test_decoder_choice():
+    assert _jsonDecoder('json') is json.loads
+    assert _jsonDecoder(len) is len
+    assert _jsonDecoder('auto')(b'{"a": [1, 2]}') == {'a': [1, 2]}
+    with pytest.raises(ValueError):
+        _jsonDecoder('simplejson')
+
+
+def test_custom_decoder_is_used():
+    decoded = []
+
+    def decoder(content: bytes):
+        decoded.append(content)
+        return json.loads(content)
+
+    onc = makeOnc(json_decoder=decoder)
+    response = onc.getDirectByDevice(filters())
+    assert len(decoded) == 1
+    assert len(response['sensorData'][0]['data']['sampleTimes']) == 5
+
+
+def test_raw_response():
+    onc = makeOnc()
+    raw = onc.getDirectByDevice(filters(), raw=True)
+    assert isinstance(raw, bytes)
+    assert onc.decode(raw) == onc.getDirectByDevice(filters())
@@ -0,0 +1,43 @@
+from fakeapi import makeOnc
+from modules.EventHooks import EventHooks
+from modules.Metrics import MetricsRegistry
+
+
+def responseEnd(latency: float, status: int = 200, error: Exception = None):
+    return {'service': 'scalardata', 'status': status, 'bytes': 100, 'latency': latency, 'retries': 1,
+            'error': error}
+
+
+def test_counters_and_histogram():
+    hooks = EventHooks()
+    metrics = MetricsRegistry().attach(hooks)
+    hooks.emit('responseEnd', **responseEnd(0.07))
+    hooks.emit('responseEnd', **responseEnd(3, status=404))
+    hooks.emit('responseEnd', **responseEnd(100, status=None, error=TimeoutError()))
+    hooks.emit('pageFetched', service='scalardata', rows=10)
+    hooks.emit('pollTick', service='scalardata')
+
+    m = metrics.snapshot()['services']['scalardata']
+    assert m['requests'] == 3 and m['retries'] == 3 and m['bytes'] == 300
+    assert m['errors'] == {'404': 1, 'TimeoutError': 1}
+    assert m['pages'] == 1 and m['rows'] == 10 and m['polls'] == 1
+    assert m['latency']['buckets'][0.05] == 0
+    assert m['latency']['buckets'][0.1] == 1
+    assert m['latency']['buckets'][5.] == 2
+    assert m['latency']['buckets'][float('inf')] == 3
+
+    text = metrics.toPrometheus()
+    assert 'onc_requests_total{service="scalardata"} 3' in text
+    assert 'onc_request_errors_total{service="scalardata",status="404"} 1' in text
+    assert 'onc_request_duration_seconds_bucket{service="scalardata",le="+Inf"} 3' in text
+
+    metrics.reset()
+    assert metrics.snapshot()['services'] == {}
+
+
+def test_onc_metrics():
+    onc = makeOnc(metrics=True)
+    onc.getLocations({'locationCode': 'BACAX'})
+    onc.getLocations({'locationCode': 'NC89'})
+    m = onc.metrics.snapshot()['services']['locations']
+    assert m['requests'] == 2 and m['errors'] == {} and m['bytes'] > 0
@@ -0,0 +1,42 @@
+from modules._PageAccumulator import _PageAccumulator
+
+
+def scalarPage(sensors: dict, rNext=None):
+    return {'next': rNext, 'sensorData': [{'sensorCode': code, 'data': {'sampleTimes': times, 'values': times}}
+                                          for code, times in sensors.items()] or None}
+
+
+def test_scalar_chunks_per_sensor():
+    accumulator = _PageAccumulator('scalardata')
+    accumulator.add(scalarPage({'temp': [1, 2], 'cond': [1, 2]}, rNext={'parameters': {}}))
+    accumulator.add(scalarPage({}))
+    # a sensor without data in the first page is appended
+    accumulator.add(scalarPage({'cond': [3], 'pres': [3]}))
+    accumulator.add(scalarPage({'temp': [4], 'cond': [4], 'pres': [4]}))
+
+    response = accumulator.result()
+    assert response['next'] is None
+    data = {s['sensorCode']: s['data']['sampleTimes'] for s in response['sensorData']}
+    assert data == {'temp': [1, 2, 4], 'cond': [1, 2, 3, 4], 'pres': [3, 4]}
+    assert [s['sensorCode'] for s in response['sensorData']] == ['temp', 'cond', 'pres']
+    assert accumulator.rows == 4
+
+
+def test_raw_and_file_chunks():
+    raw = _PageAccumulator('rawdata')
+    raw.add({'next': {}, 'data': {'times': ['a', 'b'], 'readings': ['1', '2']}})
+    raw.add({'next': None, 'data': {'times': ['c'], 'readings': ['3']}})
+    assert raw.result()['data'] == {'times': ['a', 'b', 'c'], 'readings': ['1', '2', '3']}
+
+    files = _PageAccumulator('archivefiles')
+    files.add({'next': {}, 'files': ['f1', 'f2']})
+    files.add({'next': None, 'files': ['f3']})
+    assert files.result() == {'next': None, 'files': ['f1', 'f2', 'f3']}
+    assert files.rows == 3
+
+
+def test_empty_download():
+    assert _PageAccumulator('scalardata').result() is None
+    accumulator = _PageAccumulator('scalardata')
+    accumulator.add(scalarPage({}))
+    assert accumulator.result()['sensorData'] is None
@@ -0,0 +1,31 @@
+from fakeapi import makeOnc
+
+
+def filters():
+    return {'deviceCode': 'DEV', 'dateFrom': '2020-01-01T00:00:00.000Z', 'dateTo': '2020-01-01T00:00:25.000Z',
+            'rowLimit': 10}
+
+
+def test_pages_are_yielded_as_they_arrive():
+    onc = makeOnc(prefetch=0)
+    pages = onc.iterDirectByDevice(filters())
+    first = next(pages)
+    # the next pages aren't requested before they are needed
+    assert len(onc.session.serviceCalls('scalardata')) == 1
+    assert first['sensorData'][0]['data']['sampleTimes'][0] == '2020-01-01T00:00:00.000Z'
+    rest = list(pages)
+    assert [len(page['sensorData'][0]['data']['sampleTimes']) for page in [first] + rest] == [10, 10, 5]
+    assert rest[-1]['next'] is None
+
+
+def test_pages_add_up_to_all_pages():
+    onc = makeOnc()
+    times = [t for page in onc.iterDirectRawByDevice(filters()) for t in page['data']['times']]
+    assert times == onc.getDirectRawByDevice(filters(), allPages=True)['data']['times']
+
+
+def test_file_list_pages():
+    onc = makeOnc()
+    files = [f for page in onc.iterListByDevice(filters()) for f in page['files']]
+    assert files == onc.getListByDevice(filters(), allPages=True)['files']
+    assert len(files) == 25
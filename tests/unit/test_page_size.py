@@ -0,0 +1,43 @@
+from fakeapi import FakeSession, makeOnc
+from modules.DataReducer import DataReducer
+from modules._MultiPage import _PageSizeTuner
+
+
+def filters(rowLimit: int = 10):
+    return {'deviceCode': 'DEV', 'dateFrom': '2020-01-01T00:00:00.000Z', 'dateTo': '2020-01-01T00:01:00.000Z',
+            'rowLimit': rowLimit}
+
+
+def test_tuner_steps_towards_the_target():
+    tuner = _PageSizeTuner(pageLatency=1., rowLimit=1000)
+    # 10000 rows per second would be 10000 rows per page, but the rowLimit at most doubles per page
+    assert tuner.update(1000, 0.1) == 2000
+    assert tuner.update(2000, 0.2) == 4000
+    # pages without rows or time don't change it
+    assert tuner.update(0, 1.) == 4000
+    # slower pages shrink it, by at most half
+    tuner = _PageSizeTuner(pageLatency=1., rowLimit=1000)
+    assert tuner.update(1000, 100.) == 500
+
+
+def test_tuner_limits():
+    tuner = _PageSizeTuner(pageLatency=1.)
+    assert tuner.rowLimit == _PageSizeTuner.maxRowLimit
+    assert tuner.update(100000, 0.01) == _PageSizeTuner.maxRowLimit
+    tuner = _PageSizeTuner(pageLatency=1., rowLimit=150)
+    assert tuner.update(150, 100.) == _PageSizeTuner.minRowLimit
+
+
+def test_next_pages_use_the_tuned_row_limit():
+    onc = makeOnc(FakeSession(period=0.01), page_latency=10.)
+    response = onc.getDirectByDevice(filters(rowLimit=200), allPages=True)
+    assert len(response['sensorData'][0]['data']['sampleTimes']) == 6000
+    rowLimits = [int(params['rowLimit']) for service, params, headers in onc.session.serviceCalls('scalardata')]
+    assert rowLimits[:3] == [200, 400, 800]
+
+
+def test_page_estimate_before_reducing(capsys):
+    onc = makeOnc(prefetch=0)
+    onc.getDirectByDevice(filters(), allPages=True, reducer=DataReducer(period=30))
+    # the first page covers 9 of the 60 seconds before it is reduced to a single bin
+    assert 'Estimated approx. 6 pages' in capsys.readouterr().out
@@ -0,0 +1,59 @@
+import threading
+
+import pytest
+
+from fakeapi import FakeSession, makeOnc
+
+
+def filters(dateTo: str = '2020-01-01T00:00:25.000Z'):
+    return {'deviceCode': 'DEV', 'dateFrom': '2020-01-01T00:00:00.000Z', 'dateTo': dateTo, 'rowLimit': 10}
+
+
+def prefetchThreads():
+    return [thread for thread in threading.enumerate() if thread.name == 'onc-prefetch']
+
+
+def test_prefetch_gives_the_same_result():
+    serial = makeOnc(prefetch=0).getDirectByDevice(filters(), allPages=True)
+    prefetched = makeOnc(prefetch=2).getDirectByDevice(filters(), allPages=True)
+    assert prefetched == serial
+    assert len(prefetched['sensorData'][0]['data']['sampleTimes']) == 25
+
+
+def test_no_thread_for_a_single_page(monkeypatch):
+    started = []
+    monkeypatch.setattr(threading.Thread, 'start', lambda thread: started.append(thread))
+    response = makeOnc().getDirectByDevice(filters('2020-01-01T00:00:05.000Z'), allPages=True)
+    assert len(response['sensorData'][0]['data']['sampleTimes']) == 5
+    assert started == []
+
+
+class FailingSession(FakeSession):
+    """
+    Fails the third page of scalar data
+    """
+
+    def scalardata(self, params: dict, headers: dict):
+        if len(self.serviceCalls('scalardata')) == 3:
+            return 400, {'errors': [{'errorCode': 127, 'parameter': 'dateFrom', 'errorMessage': 'failed'}]}, {}
+        return super().scalardata(params, headers)
+
+
+def test_errors_reach_the_caller():
+    onc = makeOnc(FailingSession(), prefetch=1)
+    with pytest.raises(Exception):
+        onc.getDirectByDevice(filters(), allPages=True)
+    for thread in prefetchThreads():
+        thread.join(1)
+    assert prefetchThreads() == []
+
+
+def test_closing_the_iterator_stops_the_thread():
+    onc = makeOnc(prefetch=1)
+    pages = onc.iterDirectByDevice(filters('2020-01-01T00:01:00.000Z'))
+    next(pages)
+    pages.close()
+    for thread in prefetchThreads():
+        thread.join(1)
+    assert prefetchThreads() == []
+    assert len(onc.session.serviceCalls('scalardata')) < 6
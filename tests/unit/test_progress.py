@@ -0,0 +1,51 @@
+import threading
+from time import sleep
+
+from fakeapi import makeOnc
+from modules.Progress import Progress
+
+
+def test_rate_of_concurrent_updates():
+    progress = Progress(None, 'devices', 'scalardata', total=80)
+    sleep(0.05)
+    barrier = threading.Barrier(8)
+
+    def worker():
+        for i in range(10):
+            barrier.wait()
+            progress.update(1, size=100)
+            sleep(0.01)
+
+    threads = [threading.Thread(target=worker) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    elapsed = progress.snapshot()['elapsed']
+    assert progress.done == 80
+    assert progress.bytes == 8000
+    # updates within microseconds of each other don't inflate the rate above the average
+    assert progress.rate <= 80 / elapsed * 1.5
+    assert progress.bytesPerSecond <= 8000 / elapsed * 1.5
+
+
+def test_eta():
+    progress = Progress(None, 'pages', 'scalardata', total=10)
+    assert progress.eta() is None
+    sleep(0.05)
+    eta = progress.update(5)
+    assert eta is not None and eta >= 0.04
+    assert progress.update(5) == 0
+
+
+def test_progress_events_of_a_download():
+    onc = makeOnc(prefetch=0)
+    events = []
+    onc.hooks.on('progress', events.append)
+    filters = {'deviceCode': 'DEV', 'dateFrom': '2020-01-01T00:00:00.000Z', 'dateTo': '2020-01-01T00:00:25.000Z',
+               'rowLimit': 10}
+    onc.getDirectByDevice(filters, allPages=True)
+    assert [event['done'] for event in events] == [10, 20, 25]
+    assert events[-1]['total'] == 25 and events[-1]['eta'] == 0
+    assert all(event['task'] == 'pages' and event['service'] == 'scalardata' for event in events)
@@ -0,0 +1,53 @@
+from concurrent.futures import ThreadPoolExecutor
+from time import monotonic
+
+import pytest
+
+from fakeapi import makeOnc
+from modules.RateLimiter import RateLimiter
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """
+    Fake monotonic clock of the rate limiter, sleeping advances it
+    """
+    now = [100.]
+
+    def sleep(seconds):
+        now[0] += seconds
+
+    monkeypatch.setattr('modules.RateLimiter.monotonic', lambda: now[0])
+    monkeypatch.setattr('modules.RateLimiter.sleep', sleep)
+    return now
+
+
+def test_request_rate(clock):
+    limiter = RateLimiter(requestsPerSecond=10, burst=2)
+    waits = [limiter.acquireRequest() for i in range(5)]
+    assert waits == pytest.approx([0, 0, 0.1, 0.1, 0.1])
+    assert clock[0] == pytest.approx(100.3)
+
+
+def test_bucket_refills_up_to_the_burst(clock):
+    limiter = RateLimiter(requestsPerSecond=10, burst=2)
+    limiter.acquireRequest()
+    limiter.acquireRequest()
+    clock[0] += 10
+    assert [limiter.acquireRequest() for i in range(3)] == pytest.approx([0, 0, 0.1])
+
+
+def test_bandwidth(clock):
+    limiter = RateLimiter(bytesPerSecond=1000)
+    assert limiter.consumeBytes(1000) == 0
+    assert limiter.consumeBytes(500) == pytest.approx(0.5)
+    assert RateLimiter().consumeBytes(10 ** 9) == 0
+
+
+def test_threads_share_the_budget():
+    onc = makeOnc(rate_limiter=RateLimiter(requestsPerSecond=50, burst=1))
+    start = monotonic()
+    with ThreadPoolExecutor(4) as executor:
+        list(executor.map(lambda i: onc.getLocations({'locationCode': str(i)}), range(11)))
+    assert monotonic() - start >= 0.19
+    assert len(onc.session.serviceCalls('locations')) == 11
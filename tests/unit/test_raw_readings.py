@@ -0,0 +1,76 @@
+import numpy as np
+
+from fakeapi import makeOnc
+from modules.RawReadings import RawReadings, delimitedParser, fixedWidthParser
+
+
+def rawData(readings):
+    return {'times': ['2020-01-01T00:00:{:02d}.{:03d}Z'.format(i % 60, i) for i in range(len(readings))],
+            'readings': list(readings), 'lineTypes': [' '] * len(readings)}
+
+
+def test_round_trip():
+    data = rawData(['12.5,3.1,OK', '', 'température 4,5', 'two\nlines', '13.0,3.2,OK'])
+    readings = RawReadings.fromData(data)
+    assert len(readings) == 5
+    assert readings.toData() == data
+    assert readings.reading(2) == 'température 4,5'
+    assert readings['times'].dtype == np.dtype('datetime64[ns]')
+
+
+def test_empty():
+    readings = RawReadings.fromData({'times': [], 'readings': []})
+    assert len(readings) == 0
+    assert readings.toData() == {'times': [], 'readings': []}
+
+
+def test_concatenate_and_select():
+    first, second = rawData(['a', 'bb']), rawData(['ccc', 'd'])
+    second['times'] = ['2020-01-01T00:01:00.000Z', '2020-01-01T00:01:01.000Z']
+    readings = RawReadings.concatenate([RawReadings.fromData(first), RawReadings.fromData(second)])
+    assert readings.readings() == ['a', 'bb', 'ccc', 'd']
+    assert readings.toData()['times'] == first['times'] + second['times']
+
+    selected = readings.select(np.array([False, True, True, False]))
+    assert selected.toData() == {'times': readings.toData()['times'][1:3], 'readings': ['bb', 'ccc'],
+                                 'lineTypes': [' ', ' ']}
+
+
+def test_concatenate_columns_missing_in_some_parts():
+    first, second = rawData(['a']), rawData(['b', 'c'])
+    first['depth'] = [3]
+    del second['lineTypes']
+    readings = RawReadings.concatenate([RawReadings.fromData(first), RawReadings.fromData(second)])
+    assert list(readings['lineTypes']) == [' ', '', '']
+    np.testing.assert_array_equal(readings['depth'], [3, np.nan, np.nan])
+
+
+def test_compact_download():
+    onc = makeOnc()
+    filters = {'deviceCode': 'DEV', 'dateFrom': '2020-01-01T00:00:00.000Z', 'dateTo': '2020-01-01T00:00:25.000Z'}
+    compact = onc.getDirectRawByDevice(dict(filters), allPages=True, output='compact')
+    assert isinstance(compact['data'], RawReadings)
+    assert compact['data'].toData() == onc.getDirectRawByDevice(dict(filters), allPages=True)['data']
+
+
+def test_delimited_parser():
+    readings = RawReadings.fromData(rawData(['$PSEN,12.5,3.1', '$PSEN,13.0', '$PSEN,x,3.3,extra']))
+    columns = readings.parse(delimitedParser(',', names=['id', 'temp', 'cond'], dtypes={'id': str}))
+    assert columns['id'].tolist() == ['$PSEN'] * 3
+    np.testing.assert_array_equal(columns['temp'], [12.5, 13.0, np.nan])
+    np.testing.assert_array_equal(columns['cond'], [3.1, np.nan, 3.3])
+    np.testing.assert_array_equal(columns['times'], readings['times'])
+
+
+def test_whitespace_parser():
+    readings = RawReadings.fromData(rawData(['  1.5   2.5', '3.5 4.5  ']))
+    columns = readings.parse(delimitedParser(None))
+    np.testing.assert_array_equal(columns['field0'], [1.5, 3.5])
+    np.testing.assert_array_equal(columns['field1'], [2.5, 4.5])
+
+
+def test_fixed_width_parser():
+    readings = RawReadings.fromData(rawData([' 12.50  3.10', ' 13.00  3.20', ' 14.00']))
+    columns = readings.parse(fixedWidthParser({'temp': (0, 6), 'cond': (6, 12)}))
+    np.testing.assert_array_equal(columns['temp'], [12.5, 13.0, 14.0])
+    np.testing.assert_array_equal(columns['cond'], [3.1, 3.2, np.nan])
@@ -0,0 +1,70 @@
+import pytest
+
+from fakeapi import makeOnc
+from modules.ResponseCache import ResponseCache
+
+
+def test_invalidate_request():
+    cache = ResponseCache()
+    cache.set('locations', {'locationCode': 'BACAX', 'token': 'a'}, [1])
+    cache.set('locations', {'locationCode': 'NC89'}, [2])
+    cache.invalidate('locations', {'locationCode': 'BACAX', 'token': 'b'})
+    assert cache.get('locations', {'locationCode': 'BACAX'}) is None
+    assert cache.get('locations', {'locationCode': 'NC89'}) == [2]
+
+
+def test_invalidate_filters_without_service():
+    cache = ResponseCache()
+    with pytest.raises(ValueError):
+        cache.invalidate(filters={'locationCode': 'BACAX'})
+
+
+def test_ttl(monkeypatch):
+    now = [1000.]
+    monkeypatch.setattr('modules.ResponseCache.time', lambda: now[0])
+    cache = ResponseCache(ttl={'locations': 60})
+    cache.set('locations', {}, [1])
+    now[0] += 59
+    assert cache.get('locations', {}) == [1]
+    now[0] += 2
+    assert cache.get('locations', {}) is None
+    assert cache.stats()['hits'] == 1 and cache.stats()['misses'] == 1
+
+
+def test_zero_ttl_disables_caching():
+    cache = ResponseCache(ttl={'devices': 0})
+    cache.set('devices', {}, [1])
+    assert cache.get('devices', {}) is None
+
+
+def test_lru_eviction():
+    cache = ResponseCache(maxEntries=2)
+    cache.set('locations', {'locationCode': 'A'}, ['A'])
+    cache.set('locations', {'locationCode': 'B'}, ['B'])
+    cache.get('locations', {'locationCode': 'A'})
+    cache.set('locations', {'locationCode': 'C'}, ['C'])
+    assert cache.get('locations', {'locationCode': 'B'}) is None
+    assert cache.get('locations', {'locationCode': 'A'}) == ['A']
+    assert cache.get('locations', {'locationCode': 'C'}) == ['C']
+
+
+def test_returns_copies():
+    cache = ResponseCache()
+    cache.set('locations', {}, [{'locationCode': 'A'}])
+    cache.get('locations', {})[0]['locationCode'] = 'changed'
+    assert cache.get('locations', {}) == [{'locationCode': 'A'}]
+
+
+def test_directory_shared_between_instances(tmp_path):
+    ResponseCache(directory=str(tmp_path)).set('locations', {'locationCode': 'A'}, ['A'])
+    cache = ResponseCache(directory=str(tmp_path))
+    assert cache.get('locations', {'locationCode': 'A'}) == ['A']
+    cache.invalidate('locations')
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_discovery_requests_are_cached():
+    onc = makeOnc(cache=ResponseCache())
+    assert onc.getLocations({'locationCode': 'BACAX'}) == onc.getLocations({'locationCode': 'BACAX'})
+    onc.getLocations({'locationCode': 'NC89'})
+    assert len(onc.session.serviceCalls('locations')) == 2
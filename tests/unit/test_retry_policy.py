@@ -0,0 +1,30 @@
+from types import SimpleNamespace
+
+from modules.RetryPolicy import RetryPolicy
+
+
+def response(retryAfter: str):
+    return SimpleNamespace(status_code=503, headers={'Retry-After': retryAfter})
+
+
+def test_retry_after_seconds():
+    assert RetryPolicy(maxBackoff=60).delay(1, response('5')) == 5
+
+
+def test_retry_after_capped_at_max_backoff():
+    policy = RetryPolicy(maxBackoff=60)
+    assert policy.delay(1, response('86400')) == 60
+    assert policy.delay(1, response('Fri, 31 Dec 2100 23:59:59 GMT')) == 60
+
+
+def test_exponential_backoff():
+    policy = RetryPolicy(maxAttempts=5, backoff=1, maxBackoff=3, jitter=False)
+    assert [policy.delay(attempt) for attempt in range(1, 5)] == [1, 2, 3, 3]
+
+
+def test_should_retry():
+    policy = RetryPolicy(maxAttempts=3)
+    assert policy.shouldRetry(1, response=SimpleNamespace(status_code=503))
+    assert not policy.shouldRetry(1, response=SimpleNamespace(status_code=400))
+    assert policy.shouldRetry(2, error=TimeoutError())
+    assert not policy.shouldRetry(3, error=TimeoutError())
@@ -0,0 +1,42 @@
+from fakeapi import FakeSession, makeOnc
+from modules.ResponseCache import ResponseCache
+
+
+def test_expired_response_is_revalidated(monkeypatch):
+    now = [1000.]
+    monkeypatch.setattr('modules.ResponseCache.time', lambda: now[0])
+    session = FakeSession()
+    session.etag = '"v1"'
+    cache = ResponseCache(ttl={'locations': 60})
+    onc = makeOnc(session, cache=cache)
+
+    first = onc.getLocations({'locationCode': 'BACAX'})
+    now[0] += 61
+    assert onc.getLocations({'locationCode': 'BACAX'}) == first
+
+    calls = session.serviceCalls('locations')
+    assert len(calls) == 2
+    assert 'If-None-Match' not in calls[0][2]
+    assert calls[1][2]['If-None-Match'] == '"v1"'
+    assert cache.stats()['revalidations'] == 1
+
+    # the entry is valid again for the time to live
+    now[0] += 30
+    onc.getLocations({'locationCode': 'BACAX'})
+    assert len(session.serviceCalls('locations')) == 2
+
+
+def test_changed_response_is_downloaded(monkeypatch):
+    now = [1000.]
+    monkeypatch.setattr('modules.ResponseCache.time', lambda: now[0])
+    session = FakeSession()
+    session.etag = '"v1"'
+    cache = ResponseCache(ttl={'locations': 60})
+    onc = makeOnc(session, cache=cache)
+
+    onc.getLocations({'locationCode': 'BACAX'})
+    now[0] += 61
+    session.etag = '"v2"'
+    onc.getLocations({'locationCode': 'BACAX'})
+    assert cache.validators('locations', {'locationCode': 'BACAX', 'method': 'get'}) == {'etag': '"v2"'}
+    assert cache.stats()['revalidations'] == 0
@@ -0,0 +1,123 @@
+import os
+import threading
+from time import sleep
+
+import numpy as np
+
+from fakeapi import FakeSession, makeOnc
+from modules.SeriesCache import SeriesCache
+from modules._util import _lockFile
+
+
+def times(start: int, end: int):
+    return ['2020-01-01T00:00:{:02d}.000Z'.format(s) for s in range(start, end)]
+
+
+def date(seconds: int):
+    return np.datetime64('2020-01-01T00:00:00', 'ns') + np.timedelta64(seconds, 's')
+
+
+def test_merge_columns_missing_in_one_fetch(tmp_path):
+    cache = SeriesCache(str(tmp_path), settle=0)
+    filters = {'deviceCode': 'DEV'}
+    withFlags = {'sensorData': [{'sensorCode': 'temp', 'data': {
+        'sampleTimes': times(0, 10), 'values': list(range(10)), 'qaqcFlags': [1] * 10}}]}
+    withoutFlags = {'sensorData': [{'sensorCode': 'temp', 'data': {
+        'sampleTimes': times(10, 20), 'values': list(range(10, 20))}}]}
+
+    cache.store(filters, withFlags, date(0), date(10))
+    cache.store(filters, withoutFlags, date(10), date(20))
+    assert cache.gaps(filters, date(0), date(20)) == []
+
+    data = cache.load(filters, date(0), date(20))['sensorData'][0]['data']
+    np.testing.assert_array_equal(data['values'], np.arange(20))
+    np.testing.assert_array_equal(data['qaqcFlags'], [1] * 10 + [0] * 10)
+
+
+def deviceFilters(dateFrom: str, dateTo: str):
+    return {'deviceCode': 'DEV', 'dateFrom': dateFrom, 'dateTo': dateTo, 'rowLimit': 100}
+
+
+def test_only_gaps_are_downloaded(tmp_path):
+    onc = makeOnc(series_cache=SeriesCache(str(tmp_path), settle=0))
+    onc.getDirectByDevice(deviceFilters('2020-01-01T00:00:00.000Z', '2020-01-01T00:01:00.000Z'), allPages=True,
+                          output='numpy')
+    onc.session.calls.clear()
+    cached = onc.getDirectByDevice(deviceFilters('2020-01-01T00:00:30.000Z', '2020-01-01T00:01:30.000Z'),
+                                   allPages=True, output='numpy')
+    ranges = [(params['dateFrom'], params['dateTo']) for service, params, headers in onc.session.calls]
+    assert ranges == [('2020-01-01T00:01:00.000Z', '2020-01-01T00:01:30.000Z')]
+
+    expected = makeOnc().getDirectByDevice(deviceFilters('2020-01-01T00:00:30.000Z', '2020-01-01T00:01:30.000Z'),
+                                           allPages=True, output='numpy')
+    for sensor, expectedSensor in zip(cached['sensorData'], expected['sensorData']):
+        assert sensor['sensorCode'] == expectedSensor['sensorCode']
+        for key, column in expectedSensor['data'].items():
+            np.testing.assert_array_equal(sensor['data'][key], column)
+            assert sensor['data'][key].dtype == column.dtype
+
+
+def test_json_output_is_not_cached(tmp_path):
+    onc = makeOnc(series_cache=SeriesCache(str(tmp_path), settle=0))
+    onc.getDirectByDevice(deviceFilters('2020-01-01T00:00:00.000Z', '2020-01-01T00:00:10.000Z'), allPages=True)
+    assert list(tmp_path.iterdir()) == []
+
+
+class TextSession(FakeSession):
+    """
+    The sensor status reports text values
+    """
+
+    def scalardata(self, params: dict, headers: dict):
+        response = super().scalardata(params, headers)
+        for sensorData in response['sensorData']:
+            if sensorData['sensorCode'] == 'status':
+                sensorData['data']['values'] = ['ok'] * len(sensorData['data']['values'])
+        return response
+
+
+def test_values_that_are_not_numbers(tmp_path):
+    cache = SeriesCache(str(tmp_path), settle=0)
+    onc = makeOnc(series_cache=cache)
+    # the first half is cached before the text values appear
+    onc.getDirectByDevice(deviceFilters('2020-01-01T00:00:00.000Z', '2020-01-01T00:00:30.000Z'), allPages=True,
+                          output='numpy')
+    onc.session = TextSession(sensors=('temp', 'status'))
+    response = onc.getDirectByDevice(deviceFilters('2020-01-01T00:00:00.000Z', '2020-01-01T00:01:00.000Z'),
+                                     allPages=True, output='numpy')
+    # the gap is downloaded once, and not stored
+    ranges = [(params['dateFrom'], params['dateTo']) for service, params, headers in onc.session.calls]
+    assert ranges == [('2020-01-01T00:00:30.000Z', '2020-01-01T00:01:00.000Z')]
+    assert cache.gaps(deviceFilters('', ''), date(0), date(60)) == [(date(30), date(60))]
+
+    sensors = {sensor['sensorCode']: sensor['data'] for sensor in response['sensorData']}
+    np.testing.assert_array_equal(sensors['temp']['sampleTimes'], [date(s) for s in range(60)])
+    assert list(sensors['status']['values']) == ['ok'] * 30
+
+
+def test_lock_file(tmp_path):
+    path = str(tmp_path / 'request.lock')
+    inside = []
+    overlaps = []
+
+    def update(i):
+        with _lockFile(path):
+            inside.append(i)
+            overlaps.append(len(inside) > 1)
+            sleep(0.01)
+            inside.remove(i)
+
+    threads = [threading.Thread(target=update, args=(i,)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert overlaps == [False] * 4
+    assert not os.path.exists(path)
+
+    # a lock left by a process that ended is taken over once it is stale
+    open(path, 'w').close()
+    os.utime(path, (0, 0))
+    with _lockFile(path, stale=60):
+        assert os.path.exists(path)
+    assert not os.path.exists(path)
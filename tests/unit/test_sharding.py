@@ -0,0 +1,68 @@
+from datetime import datetime, timedelta
+
+import requests
+
+from fakeapi import FakeSession, makeOnc, _parseDate
+from modules._MultiPage import _MultiPage
+
+
+def filters(dateTo: str = '2020-01-01T00:01:00.000Z'):
+    return {'deviceCode': 'DEV', 'dateFrom': '2020-01-01T00:00:00.000Z', 'dateTo': dateTo, 'rowLimit': 7}
+
+
+def test_time_windows():
+    windows = _MultiPage._timeWindows(filters(), 4)
+    assert windows == [('2020-01-01T00:00:00.000Z', '2020-01-01T00:00:15.000Z'),
+                       ('2020-01-01T00:00:15.000Z', '2020-01-01T00:00:30.000Z'),
+                       ('2020-01-01T00:00:30.000Z', '2020-01-01T00:00:45.000Z'),
+                       ('2020-01-01T00:00:45.000Z', '2020-01-01T00:01:00.000Z')]
+    aligned = _MultiPage._timeWindows(filters(), 4, align=20)
+    assert [w[0] for w in aligned] == ['2020-01-01T00:00:00.000Z', '2020-01-01T00:00:20.000Z',
+                                       '2020-01-01T00:00:40.000Z']
+    assert _MultiPage._timeWindows({'dateFrom': '-P1D', 'dateTo': '2020-01-01T00:00:00.000Z'}, 4) is None
+
+
+def test_sharded_equals_serial():
+    serial = makeOnc().getDirectByDevice(filters(), allPages=True)
+    onc = makeOnc()
+    sharded = onc.getDirectByDevice(filters(), allPages=True, workers=3)
+    assert sharded['sensorData'] == serial['sensorData']
+    assert len(sharded['sensorData'][0]['data']['sampleTimes']) == 60
+    assert sharded['next'] is None
+
+
+class OverlappingSession(FakeSession):
+    """
+    Lists the file open at dateFrom too, like the archive files that span the bound of two windows
+    """
+
+    def archivefiles(self, params: dict, headers: dict):
+        response = super().archivefiles(params, headers)
+        dateFrom = _parseDate(params['dateFrom'])
+        step = timedelta(seconds=self.period)
+        opened = datetime(2020, 1, 1) + (dateFrom - datetime(2020, 1, 1)) // step * step
+        if opened < dateFrom:
+            response['files'].insert(0, 'DEV_%s.txt' % opened.strftime('%Y%m%dT%H%M%S.000Z'))
+        return response
+
+
+def test_sharded_archive_files_are_unique():
+    onc = makeOnc(OverlappingSession(period=10))
+    result = onc.getListByDevice(filters(), allPages=True, workers=3)
+    assert result['files'] == ['DEV_20200101T0000%02d.000Z.txt' % s for s in range(0, 60, 10)]
+
+
+def test_pool_grows_to_workers():
+    onc = makeOnc(pool_size=2)
+    onc.session = requests.Session()
+    onc.session.mount('https://', requests.adapters.HTTPAdapter(pool_maxsize=2))
+    onc.realTime._reservePool(6)
+    assert onc.pool_size == 6
+    assert onc.session.get_adapter('https://')._pool_maxsize == 6
+    onc.realTime._reservePool(3)
+    assert onc.session.get_adapter('https://')._pool_maxsize == 6
+    # sessions other than requests.Session are left alone
+    fake = makeOnc(pool_size=2)
+    fake.realTime._reservePool(6)
+    assert fake.pool_size == 2
+
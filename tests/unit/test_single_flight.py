@@ -0,0 +1,65 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from time import sleep
+
+import pytest
+
+from fakeapi import FakeSession, makeOnc
+from modules._util import _SingleFlight
+
+
+class SlowSession(FakeSession):
+    def locations(self, params, headers):
+        sleep(0.2)
+        return super().locations(params, headers)
+
+
+def test_identical_calls_share_one_run():
+    flight = _SingleFlight()
+    runs = []
+    started = threading.Event()
+
+    def run():
+        runs.append(1)
+        started.set()
+        sleep(0.2)
+        return [1]
+
+    with ThreadPoolExecutor(4) as executor:
+        leader = executor.submit(flight.do, 'key', run, list)
+        started.wait()
+        followers = [executor.submit(flight.do, 'key', run, list) for i in range(3)]
+        results = [leader.result()] + [future.result() for future in followers]
+
+    assert len(runs) == 1
+    assert [shared for result, shared in results] == [False, True, True, True]
+    # each follower gets its own copy
+    assert len({id(result) for result, shared in results}) == 4
+
+
+def test_error_is_raised_in_every_caller():
+    flight = _SingleFlight()
+    started = threading.Event()
+
+    def fail():
+        started.set()
+        sleep(0.1)
+        raise RuntimeError('failed')
+
+    with ThreadPoolExecutor(2) as executor:
+        leader = executor.submit(flight.do, 'key', fail)
+        started.wait()
+        follower = executor.submit(flight.do, 'key', fail)
+        for future in (leader, follower):
+            with pytest.raises(RuntimeError):
+                future.result()
+    # the next call runs again
+    assert flight.do('key', lambda: 2) == (2, False)
+
+
+def test_concurrent_identical_requests_are_sent_once():
+    onc = makeOnc(SlowSession())
+    with ThreadPoolExecutor(4) as executor:
+        results = list(executor.map(lambda i: onc.getLocations({'locationCode': 'BACAX'}), range(4)))
+    assert all(result == results[0] for result in results)
+    assert len(onc.session.serviceCalls('locations')) == 1
@@ -0,0 +1,54 @@
+import dateutil.parser
+import numpy as np
+import pytest
+
+from modules._util import _parseTimestamps
+
+
+def dateutilTimes(times):
+    return np.array([dateutil.parser.isoparse(t).replace(tzinfo=None) for t in times], dtype='datetime64[ns]')
+
+
+def test_api_layouts_match_dateutil():
+    times = ['2020-01-01T00:00:00.000Z', '2020-02-29T23:59:59.999Z', '1999-12-31T12:30:45.123Z',
+             '2021-01-31T00:00:00.001Z']
+    np.testing.assert_array_equal(_parseTimestamps(times), dateutilTimes(times))
+
+
+def test_file_name_layout():
+    parsed = _parseTimestamps(['20200131T235959.999Z'])
+    assert parsed[0] == np.datetime64('2020-01-31T23:59:59.999', 'ns')
+
+
+def test_other_formats_are_parsed_one_by_one():
+    parsed = _parseTimestamps(['2020-01-01T01:00:00+01:00', '2020-01-01'])
+    np.testing.assert_array_equal(parsed, np.array(['2020-01-01T00:00', '2020-01-01T00:00'], dtype='datetime64[ns]'))
+
+
+def test_empty():
+    assert _parseTimestamps([]).dtype == np.dtype('datetime64[ns]')
+
+
+@pytest.mark.parametrize('timestamp', ['2021-02-31T00:00:00.000Z', '2021-04-31T00:00:00.000Z',
+                                       '2021-02-29T00:00:00.000Z', '20210229T000000.000Z',
+                                       '2021-13-01T00:00:00.000Z', '2021-01-01T24:00:00.000Z'])
+def test_invalid_dates_raise(timestamp):
+    with pytest.raises(ValueError):
+        _parseTimestamps(['2021-01-01T00:00:00.000Z', timestamp])
+
+
+def test_second_60_raises_like_dateutil():
+    with pytest.raises(ValueError):
+        dateutil.parser.parse('2021-01-01T00:00:60.000Z')
+    with pytest.raises(ValueError):
+        _parseTimestamps(['2021-01-01T00:00:60.000Z'])
+
+
+def test_format_utc():
+    from onc.onc import ONC
+
+    assert ONC.formatUtc('2021-02-28T12:30:45.123Z') == '2021-02-28T12:30:45.000Z'
+    assert ONC.formatUtc('2021-02-28 12:30:45') == '2021-02-28T12:30:45.000Z'
+    for invalid in ['2021-02-31T00:00:00.000Z', '2021-01-01T00:00:60.000Z']:
+        with pytest.raises(ValueError):
+            ONC.formatUtc(invalid)